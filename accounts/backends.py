@@ -1,25 +1,52 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.contrib.auth.hashers import make_password
+
+from .user_cache import get_cached_user
 
 User = get_user_model()
 
+
+def hash_dummy_password(password):
+    """Spend one password hash, so unknown accounts take as long to reject as known ones"""
+    make_password(password)
+
+
 class EmailBackend(ModelBackend):
     """
     Custom authentication backend that allows users to log in using their email address.
     """
     
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Try to find user by email
-            user = User.objects.get(Q(email=username) | Q(username=username))
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        # One lookup on the matching unique index rather than an OR of both;
+        # usernames may contain '@', so those fall back to the username.
+        lookups = ['email', 'username'] if '@' in username else ['username']
+        for field in lookups:
+            try:
+                user = User.objects.get(**{field: username})
+            except User.DoesNotExist:
+                continue
             if user.check_password(password):
                 return user
-        except User.DoesNotExist:
             return None
+        hash_dummy_password(password)
         return None
     
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        return await sync_to_async(self.authenticate)(request, username, password, **kwargs)
+    
     def get_user(self, user_id):
+        return get_cached_user(user_id, self._load_user)
+    
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
+    
+    def _load_user(self, user_id):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core import checks
+
+# Caches that live inside one process; other workers never see their writes
+PRIVATE_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    """The cached session engine needs a cache every worker process shares"""
+    if settings.SESSION_ENGINE != 'accounts.sessions':
+        return []
+    alias = settings.SESSION_CACHE_ALIAS
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend not in PRIVATE_CACHES:
+        return []
+    return [checks.Error(
+        f'SESSION_ENGINE accounts.sessions is used with the per-process {backend.rsplit(".", 1)[-1]} '
+        f'cache {alias!r}: a session flushed or logged out in one worker would stay valid in the others.',
+        hint='Point CACHES at Redis or Memcached, or use django.contrib.sessions.backends.db.',
+        id='accounts.E001',
+    )]
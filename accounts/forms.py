@@ -7,6 +7,8 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column, Field
 import re
 
+from .backends import hash_dummy_password
+
 User = get_user_model()
 
 class SignUpForm(UserCreationForm):
@@ -348,6 +350,7 @@ class CustomLoginForm(AuthenticationForm):
                 if not user.is_active:
                     raise ValidationError("This account has been deactivated. Please contact support.")
             except User.DoesNotExist:
+                hash_dummy_password(password)
                 raise ValidationError("No account found with this email address.")
             
             # Authenticate the user
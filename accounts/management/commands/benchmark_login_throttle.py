@@ -0,0 +1,50 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from accounts.throttle import allow_login_attempt, local_buckets
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-attempt overhead of the login throttle against one password hash'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=20000)
+        parser.add_argument('--ips', type=int, default=500, help='Distinct client IPs')
+        parser.add_argument('--accounts', type=int, default=2000, help='Distinct account names')
+        parser.add_argument('--seed', type=int, default=0)
+    
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        factory = RequestFactory()
+        requests = [
+            factory.post('/accounts/login/', REMOTE_ADDR=f'10.{n // 65536}.{n // 256 % 256}.{n % 256}')
+            for n in range(options['ips'])
+        ]
+        accounts = [f'bench{n}@example.com' for n in range(options['accounts'])]
+        
+        timings = []
+        allowed = 0
+        try:
+            for _ in range(options['attempts']):
+                request, account = rng.choice(requests), rng.choice(accounts)
+                started = time.perf_counter()
+                allowed += allow_login_attempt(request, account)
+                timings.append(time.perf_counter() - started)
+        finally:
+            local_buckets.clear()
+        
+        started = time.perf_counter()
+        make_password('benchmark')
+        hash_seconds = time.perf_counter() - started
+        
+        timings.sort()
+        mean = sum(timings) / len(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f'{len(timings)} attempts ({allowed} allowed): mean {mean * 1e6:.1f} us, '
+            f'p99 {p99 * 1e6:.1f} us per check'
+        )
+        self.stdout.write(f'one password hash: {hash_seconds * 1000:.1f} ms ({hash_seconds / mean:.0f}x a check)')
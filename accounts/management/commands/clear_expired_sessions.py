@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in batches; use instead of clearsessions on large tables'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or getattr(settings, 'SESSION_CLEANUP_BATCH', 5000)
+        total = 0
+        while True:
+            deleted = SessionStore.clear_expired_batch(batch_size)
+            total += deleted
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  deleted {deleted} ({total} so far)')
+            if deleted < batch_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired sessions.'))
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
+from .user_cache import invalidate_user
+
 class CustomUser(AbstractUser):
     """Custom User model for e-commerce customers"""
     
@@ -41,6 +43,26 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.email} - {self.get_full_name()}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Authentication reads users from a cache (see user_cache.py)
+        invalidate_user(self.pk)
+    
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        invalidate_user(pk)
+        return result
+    
+    def get_session_auth_hash(self):
+        # Users from the authentication cache carry the hash but not the password
+        cached = getattr(self, 'cached_session_auth_hash', None)
+        return cached if cached is not None else super().get_session_auth_hash()
+    
+    def set_password(self, raw_password):
+        self.cached_session_auth_hash = None
+        super().set_password(raw_password)
+    
     def get_full_address(self):
         """Returns the complete address as a formatted string"""
         address_parts = [
@@ -0,0 +1,127 @@
+"""
+Cache-backed session engine with write-through persistence.
+
+Sessions are read from the cache, falling back to ``django_session``,
+and every write goes to both. A save whose data matches what was loaded
+is skipped unless more than SESSION_REFRESH_FRACTION of the session's
+lifetime has passed since it was last written; then only the expiry
+moves. With SESSION_SAVE_EVERY_REQUEST this gives sliding expiry for
+about one write per session per fraction of its lifetime, instead of one
+per request.
+
+The cache must be shared by every process serving requests (Redis,
+Memcached), or a process can read a session another one has since
+changed.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.utils import timezone
+
+KEY_PREFIX = 'accounts.sessions:'
+
+logger = logging.getLogger('django.contrib.sessions')
+
+
+def refresh_fraction():
+    return getattr(settings, 'SESSION_REFRESH_FRACTION', 0.1)
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = KEY_PREFIX
+    
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # (serialized data, expire_date) as last read or written
+        self._stored = None
+    
+    def _snapshot(self, data):
+        return self.serializer().dumps(data)
+    
+    def _cache_entry(self, data, expires):
+        try:
+            self._cache.set(
+                self.cache_key, {'data': data, 'expires': expires}, self.get_expiry_age(expiry=expires)
+            )
+        except Exception:
+            logger.exception('Error saving to cache (%s)', self._cache)
+    
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid keys raise on some backends; treat as a miss (#17810)
+            entry = None
+        if entry is None:
+            s = self._get_session_from_db()
+            if s is None:
+                self._stored = None
+                return {}
+            entry = {'data': self.decode(s.session_data), 'expires': s.expire_date}
+            self._cache_entry(entry['data'], entry['expires'])
+        self._stored = (self._snapshot(entry['data']), entry['expires'])
+        return entry['data']
+    
+    async def aload(self):
+        return await sync_to_async(self.load)()
+    
+    def _needs_write(self):
+        if self._stored is None:
+            return True
+        data, expires = self._stored
+        if self._snapshot(self._session) != data:
+            return True
+        # Unchanged: push the expiry back only once enough of it is used up
+        lived = (self.get_expiry_date() - expires).total_seconds()
+        return lived >= self.get_expiry_age() * refresh_fraction()
+    
+    def create_model_instance(self, data):
+        obj = super().create_model_instance(data)
+        self._written_expiry = obj.expire_date
+        return obj
+    
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not must_create and not self._needs_write():
+            return
+        DBStore.save(self, must_create)
+        data = self._get_session(no_load=must_create)
+        self._stored = (self._snapshot(data), self._written_expiry)
+        self._cache_entry(data, self._written_expiry)
+    
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+    
+    @classmethod
+    def clear_expired_batch(cls, batch_size):
+        """Delete up to ``batch_size`` expired sessions; returns the number deleted"""
+        model = cls.get_model_class()
+        keys = list(
+            model.objects.filter(expire_date__lt=timezone.now())
+            .values_list('session_key', flat=True)[:batch_size]
+        )
+        if not keys:
+            return 0
+        return model.objects.filter(session_key__in=keys).delete()[0]
+    
+    @classmethod
+    def clear_expired(cls, batch_size=None):
+        """
+        Delete expired sessions in short batches, so ``clearsessions``
+        never holds one huge DELETE open on a large table.
+        """
+        batch_size = batch_size or getattr(settings, 'SESSION_CLEANUP_BATCH', 5000)
+        deleted = 0
+        while True:
+            count = cls.clear_expired_batch(batch_size)
+            deleted += count
+            if count < batch_size:
+                return deleted
+    
+    @classmethod
+    async def aclear_expired(cls, batch_size=None):
+        return await sync_to_async(cls.clear_expired)(batch_size)
@@ -1,3 +1,216 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .backends import EmailBackend
+from .checks import check_session_cache
+from .sessions import SessionStore
+from .throttle import local_buckets
+
+User = get_user_model()
+# The engine settings ships disabled until a shared cache is configured
+cached_sessions = override_settings(SESSION_ENGINE='accounts.sessions', SESSION_SAVE_EVERY_REQUEST=True)
+
+
+class CachedSessionStoreTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.store = SessionStore()
+        self.store['cart'] = 1
+        self.store.save()
+    
+    def reload(self):
+        return SessionStore(self.store.session_key)
+    
+    def test_reads_come_from_cache_and_survive_a_cache_flush(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.reload()['cart'], 1)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.reload()['cart'], 1)
+    
+    def test_unchanged_session_is_not_written(self):
+        session = self.reload()
+        session['cart'] = 1
+        with self.assertNumQueries(0):
+            session.save()
+        
+        session['cart'] = 2
+        session.save()
+        self.assertEqual(SessionStore().decode(Session.objects.get().session_data), {'cart': 2})
+    
+    def test_expiry_refreshed_after_fraction_of_lifetime(self):
+        session = self.reload()
+        session.set_expiry(1000)
+        session.save()
+        written = Session.objects.get().expire_date
+        
+        # Pretend 5% of the lifetime has passed, then 20%
+        for elapsed, writes in ((50, 0), (200, 1)):
+            session = self.reload()
+            session.load()
+            session._stored = (session._stored[0], written - timedelta(seconds=elapsed))
+            with self.assertNumQueries(writes * 3):  # savepoint, UPDATE, release
+                session.save()
+        self.assertGreaterEqual(Session.objects.get().expire_date, written)
+    
+    def test_expired_sessions_cleared_in_batches(self):
+        for n in range(5):
+            store = SessionStore()
+            store['n'] = n
+            store.set_expiry(-1)
+            store.save()
+        out = StringIO()
+        call_command('clear_expired_sessions', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.store.session_key])
+    
+    def test_engine_refuses_a_per_process_cache(self):
+        self.assertEqual(check_session_cache(None), [])  # the database engine is the default
+        with cached_sessions:
+            [error] = check_session_cache(None)
+            self.assertEqual(error.id, 'accounts.E001')
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}}
+            with override_settings(CACHES=shared):
+                self.assertEqual(check_session_cache(None), [])
+
+
+@cached_sessions
+class SessionWriteTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='Secret#123')
+    
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_logged_in_requests_do_not_rewrite_session(self):
+        response = self.client.post(reverse('login'), {'username': 'shopper@example.com', 'password': 'Secret#123'})
+        self.assertEqual(response.status_code, 302)
+        written = Session.objects.get().expire_date
+        
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('profile'))
+            self.client.get(reverse('profile'))
+        self.assertFalse([q for q in ctx.captured_queries if 'django_session' in q['sql']])
+        self.assertEqual(Session.objects.get().expire_date, written)
+
+
+@cached_sessions
+class UserCacheTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='Secret#123')
+        self.backend = EmailBackend()
+    
+    def test_authenticate_by_email_or_username(self):
+        for login in ('shopper@example.com', 'shopper'):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.backend.authenticate(None, login, 'Secret#123'), self.user)
+        self.assertIsNone(self.backend.authenticate(None, 'shopper', 'wrong'))
+        self.assertIsNone(self.backend.authenticate(None, 'nobody@example.com', 'Secret#123'))
+        
+        User.objects.create_user(username='odd@name', email='odd@example.com', password='Secret#123')
+        self.assertEqual(self.backend.authenticate(None, 'odd@name', 'Secret#123').email, 'odd@example.com')
+    
+    def test_get_user_cached_until_saved(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).first_name, '')
+        
+        self.user.first_name = 'Ada'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'Ada')
+        
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+    
+    def test_cached_user_holds_no_password_hash(self):
+        self.backend.get_user(self.user.pk)
+        entry = cache.get(f'accounts:user:{self.user.pk}')
+        self.assertNotIn('password', entry['fields'])
+        self.assertNotIn(self.user.password, repr(entry))
+        
+        cached = self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached.get_session_auth_hash(), self.user.get_session_auth_hash())
+        # The password column is read back from the database, never blanked by a save
+        with self.assertNumQueries(1):
+            self.assertTrue(cached.check_password('Secret#123'))
+        cached.first_name = 'Ada'
+        cached.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Secret#123'))
+    
+    def test_authenticated_product_list_skips_user_and_session_queries(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('product_list'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('accounts_customuser', tables)
+        self.assertNotIn('django_session', tables)
+        # Categories, brands and the page of products; facets come from cache
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+
+@override_settings(LOGIN_THROTTLE={'IP_BURST': 5, 'ACCOUNT_BURST': 3})
+class LoginThrottleTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        local_buckets.clear()
+        self.addCleanup(local_buckets.clear)
+        User.objects.create_user(username='shopper', email='shopper@example.com', password='Secret#123')
+    
+    def attempt(self, email='shopper@example.com', password='wrong', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': email, 'password': password}, REMOTE_ADDR=ip)
+    
+    def test_excess_attempts_rejected_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.attempt().status_code, 200)
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.encode') as encode:
+            with self.assertNumQueries(0):
+                response = self.attempt(password='Secret#123')
+        self.assertEqual(response.status_code, 429)
+        encode.assert_not_called()
+        
+        # Other accounts from another IP are unaffected
+        self.assertEqual(self.attempt('other@example.com', ip='10.0.0.2').status_code, 200)
+    
+    def test_ip_bucket_spans_accounts(self):
+        for n in range(5):
+            self.assertEqual(self.attempt(f'user{n}@example.com').status_code, 200)
+        self.assertEqual(self.attempt('user9@example.com').status_code, 429)
+    
+    @override_settings(LOGIN_THROTTLE={'IP_BURST': 5, 'ACCOUNT_BURST': 3, 'TRUSTED_PROXIES': ['10.9.0.0/16']})
+    def test_clients_behind_trusted_proxy_get_own_buckets(self):
+        def through_proxy(email, client, proxy='10.9.0.7'):
+            return self.client.post(reverse('login'), {'username': email, 'password': 'wrong'},
+                                    REMOTE_ADDR=proxy, HTTP_X_FORWARDED_FOR=f'{client}, 10.9.0.3')
+        
+        for n in range(5):
+            self.assertEqual(through_proxy(f'user{n}@example.com', '203.0.113.5').status_code, 200)
+        self.assertEqual(through_proxy('user9@example.com', '203.0.113.5').status_code, 429)
+        self.assertEqual(through_proxy('user9@example.com', '198.51.100.8').status_code, 200)
+        # An untrusted peer can't choose its bucket with the header
+        for n in range(5):
+            through_proxy(f'user{n}@example.com', f'192.0.2.{n}', proxy='192.0.2.200')
+        self.assertEqual(through_proxy('user9@example.com', '192.0.2.99', proxy='192.0.2.200').status_code, 429)
+    
+    def test_unknown_account_still_hashes(self):
+        with mock.patch('accounts.forms.hash_dummy_password') as dummy:
+            self.attempt('nobody@example.com')
+        dummy.assert_called_once_with('wrong')
@@ -0,0 +1,152 @@
+"""
+Token-bucket throttle for login attempts.
+
+Attempts are counted per client IP and per account in two layers: a
+bucket in this process, which turns a flood away without any I/O, and a
+bucket in the shared cache, which holds the limit across processes.
+Both are checked before the login form hashes a password, so rejected
+attempts cost microseconds instead of a PBKDF2 run.
+
+Behind a CDN or reverse proxy every request arrives from a few proxy
+addresses, so a bucket keyed on REMOTE_ADDR would be shared by the whole
+site. List those proxies in TRUSTED_PROXIES (addresses or networks).
+The client is then the right-most X-Forwarded-For entry that isn't one
+of them. The header is only read when REMOTE_ADDR is trusted, so clients
+can't pick their own bucket.
+
+The shared bucket is a read-modify-write, so attempts racing in
+different processes can spend the same token; the local layer bounds
+that slack to one bucket per process.
+"""
+import hashlib
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'IP_BURST': 30,             # attempts a client IP can make at once
+    'IP_PER_MINUTE': 10,        # ... and the rate they come back at
+    'ACCOUNT_BURST': 10,
+    'ACCOUNT_PER_MINUTE': 3,
+    'LOCAL_MAX_KEYS': 10000,    # buckets kept per process (least recent dropped)
+    'TRUSTED_PROXIES': (),      # proxies whose X-Forwarded-For names the client
+}
+THROTTLE_KEY = 'accounts:throttle:{}'
+
+
+def throttle_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOGIN_THROTTLE', {})}
+
+
+def _refill(state, now, burst, rate):
+    if state is None:
+        return float(burst)
+    tokens, stamp = state
+    return min(float(burst), tokens + max(now - stamp, 0) * rate)
+
+
+class LocalBuckets:
+    """Per-process buckets, bounded to the most recently used keys"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = OrderedDict()
+    
+    def take(self, key, burst, rate, max_keys):
+        now = time.monotonic()
+        with self._lock:
+            tokens = _refill(self.buckets.pop(key, None), now, burst, rate)
+            allowed = tokens >= 1
+            self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self.buckets) > max_keys:
+                self.buckets.popitem(last=False)
+        return allowed
+    
+    def drain(self, key):
+        with self._lock:
+            self.buckets[key] = (0.0, time.monotonic())
+    
+    def clear(self):
+        with self._lock:
+            self.buckets.clear()
+
+
+local_buckets = LocalBuckets()
+
+
+def _shared_key(key):
+    # Account keys are user input; hash them into a safe cache key
+    return THROTTLE_KEY.format(hashlib.md5(key.encode()).hexdigest())
+
+
+def _take_shared(buckets):
+    """Spend a token from each shared bucket; returns the keys that were empty"""
+    now = time.time()
+    keys = {key: _shared_key(key) for key, _, _ in buckets}
+    states = cache.get_many(keys.values())
+    updates = {}
+    empty = []
+    for key, burst, rate in buckets:
+        tokens = _refill(states.get(keys[key]), now, burst, rate)
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            empty.append(key)
+        updates[keys[key]] = (tokens, now)
+    # A bucket left alone this long is full again, so it can just expire
+    timeout = max(int(burst / rate) + 1 for _, burst, rate in buckets)
+    cache.set_many(updates, timeout)
+    return empty
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def _trusted(address, networks):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(request, proxies=()):
+    """REMOTE_ADDR, or the nearest untrusted X-Forwarded-For hop when it is a trusted proxy"""
+    address = request.META.get('REMOTE_ADDR', '')
+    networks = _networks(tuple(proxies))
+    if not networks or not _trusted(address, networks):
+        return address
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop, networks):
+            return hop
+    return hops[0] if hops else address
+
+
+def allow_login_attempt(request, username):
+    """Spend one attempt for this IP and account; False when either is used up"""
+    config = throttle_settings()
+    if not config['ENABLED']:
+        return True
+    ip = client_ip(request, config['TRUSTED_PROXIES'])
+    buckets = [(f'ip:{ip}', config['IP_BURST'], config['IP_PER_MINUTE'] / 60)]
+    username = (username or '').strip().lower()
+    if username:
+        buckets.append((f'account:{username}', config['ACCOUNT_BURST'], config['ACCOUNT_PER_MINUTE'] / 60))
+    
+    for key, burst, rate in buckets:
+        if not local_buckets.take(key, burst, rate, config['LOCAL_MAX_KEYS']):
+            return False
+    empty = _take_shared(buckets)
+    for key in empty:
+        # Turn the next attempts away here, without a cache round trip
+        local_buckets.drain(key)
+    return not empty
@@ -0,0 +1,83 @@
+"""
+Short-lived cache of users for per-request authentication.
+
+Each user has a version counter in the cache; entries remember the
+version they were read under and are ignored once it moves.
+``CustomUser.save()`` and ``delete()`` bump it, so a change is visible on
+the next request. Queryset ``update()`` calls bypass that and can be
+served stale for up to USER_CACHE_TIMEOUT seconds.
+
+Entries never hold the password hash. They keep the other columns and
+the session auth hash (an HMAC keyed with SECRET_KEY), which is all that
+per-request authentication checks. Users rebuilt from an entry have
+``password`` deferred, so check_password() and save() read or leave the
+real column in the database.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+USER_KEY = 'accounts:user:{}'
+USER_VERSION_KEY = 'accounts:user-version:{}'
+
+
+def user_cache_timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 60)
+
+
+def user_version(user_id, versions=None):
+    """Current version stamp for ``user_id``, seeded from the clock if missing"""
+    key = USER_VERSION_KEY.format(user_id)
+    version = (versions or {}).get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_cached_user(user_id, load):
+    """
+    The user with ``user_id`` from the cache, or from ``load(user_id)``.
+    
+    ``load`` returns the user or None; misses are not cached.
+    """
+    key = USER_KEY.format(user_id)
+    entries = cache.get_many([key, USER_VERSION_KEY.format(user_id)])
+    # Read the version before loading, so a save racing this read
+    # leaves our entry already outdated
+    version = user_version(user_id, entries)
+    entry = entries.get(key)
+    if entry is not None and entry['version'] == version:
+        return _from_entry(entry)
+    user = load(user_id)
+    if user is not None:
+        cache.set(key, _entry(user, version), user_cache_timeout())
+    return user
+
+
+def _entry(user, version):
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != 'password'
+    }
+    return {
+        'version': version,
+        'db': user._state.db,
+        'fields': fields,
+        'session_auth_hash': user.get_session_auth_hash(),
+    }
+
+
+def _from_entry(entry):
+    user = get_user_model().from_db(entry['db'], list(entry['fields']), list(entry['fields'].values()))
+    user.cached_session_auth_hash = entry['session_auth_hash']
+    return user
+
+
+def invalidate_user(user_id):
+    try:
+        cache.incr(USER_VERSION_KEY.format(user_id))
+    except ValueError:
+        pass  # Never cached under a version, or evicted: nothing to invalidate
@@ -5,6 +5,7 @@ from django.contrib import messages
 from django.views.generic import CreateView
 from django.urls import reverse_lazy
 from .forms import SignUpForm, CustomLoginForm, ProfileUpdateForm
+from .throttle import allow_login_attempt
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -54,6 +55,11 @@ def login_view(request):
         return redirect('profile')
     
     if request.method == 'POST':
+        # Checked before the form runs, so a flood never reaches the password hasher
+        if not allow_login_attempt(request, request.POST.get('username')):
+            messages.error(request, 'Too many sign-in attempts. Please wait a minute and try again.')
+            return render(request, 'accounts/login.html', {'form': CustomLoginForm(request)}, status=429)
+        
         form = CustomLoginForm(request, data=request.POST)
         if form.is_valid():
             user = form.get_user()
@@ -0,0 +1,302 @@
+"""
+On-demand profiling of live requests.
+
+ProfilingMiddleware profiles a random SAMPLE_RATE share of requests, plus
+any request whose TRIGGER_HEADER holds a token from ``trigger_token()``.
+The token is signed with SECRET_KEY and names the profiler to use. Each
+profile is written to DIRECTORY as ``<view>--<stamp>.<ext>``, and only the
+newest MAX_FILES are kept:
+
+* ``sampling`` records a stack every INTERVAL seconds from a helper
+  thread and writes collapsed stacks (``.folded``, one ``frame;frame;...
+  count`` line each), the format flame graph tools read. Its cost does not
+  depend on how many calls the request makes.
+* ``cprofile`` traces every call and writes a pstats dump (``.prof``). It
+  is exact but slows the request several times over. Only one request per
+  process is traced at a time; requests arriving meanwhile run unprofiled.
+
+Either profiler covers one thread, so concurrent requests stay out of the
+profile. Under WSGI that is the thread running the request. Under ASGI it
+is the request's thread-sensitive executor, where sync_to_async runs the
+ORM queries, template rendering and other sync work; the coroutine code
+between those calls runs on the event loop and is not profiled.
+
+``manage.py profile_report`` aggregates the files per view.
+"""
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.0,
+    'PROFILER': 'sampling',                # for sampled requests; triggers name their own
+    'INTERVAL': 0.005,                     # seconds between stack samples
+    'DIRECTORY': 'profiles',
+    'MAX_FILES': 500,
+    'TRIGGER_HEADER': 'X-Profile-Request',
+    'TRIGGER_MAX_AGE': 3600,               # seconds a trigger token stays valid
+}
+EXTENSIONS = {'sampling': '.folded', 'cprofile': '.prof'}
+SALT = 'ecommerce.profiling'
+UNSAFE = re.compile(r'[^\w-]+')
+# Threads parked in these are idle (event loops, thread pools and
+# executors between jobs, the caller of async_to_sync), not working for a
+# request
+IDLE_FUNCTIONS = frozenset({'select', 'poll', 'wait', '_wait_for_tstate_lock', 'accept', '_worker'})
+
+_sequence = itertools.count()
+# Held while a cProfile.Profile is enabled; profilers on overlapping
+# requests would otherwise clobber each other (or raise, on Python 3.12+)
+_cprofile_lock = threading.Lock()
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+def profile_directory(config=None):
+    return Path(settings.BASE_DIR) / (config or profiling_settings())['DIRECTORY']
+
+
+def trigger_token(profiler='sampling'):
+    """Header value that makes the next requests carrying it get profiled"""
+    if profiler not in EXTENSIONS:
+        raise ValueError(f'Unknown profiler {profiler!r}')
+    return signing.TimestampSigner(salt=SALT).sign(profiler)
+
+
+def triggered_profiler(value, max_age):
+    """Profiler named by a valid trigger token, else None"""
+    try:
+        profiler = signing.TimestampSigner(salt=SALT).unsign(value, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    return profiler if profiler in EXTENSIONS else None
+
+
+def frame_label(filename, line, name):
+    project = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(project):
+        filename = filename[len(project):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f'{name} ({filename}:{line})'
+
+
+def collapse(frame):
+    """'outer;...;inner' for a frame and its callers"""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """Collapsed stacks of the thread calling ``start()``, sampled from a helper thread"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.target = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is not None and frame.f_code.co_name not in IDLE_FUNCTIONS:
+                self.stacks[collapse(frame)] += 1
+    
+    def start(self):
+        self.target = threading.get_ident()
+        self._thread.start()
+    
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+    
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfile:
+    """One profile: ``start()`` and ``stop()`` on the profiled thread, then ``finish()`` writes it out"""
+    
+    def __init__(self, profiler, config):
+        self.profiler = profiler
+        self.config = config
+        if profiler == 'cprofile':
+            self.tracer = cProfile.Profile()
+        else:
+            self.tracer = StackSampler(config['INTERVAL'])
+    
+    @classmethod
+    def claim(cls, profiler, config):
+        """A profile ready to start, or None while another request holds cProfile"""
+        if profiler == 'cprofile' and not _cprofile_lock.acquire(blocking=False):
+            return None
+        return cls(profiler, config)
+    
+    def start(self):
+        if self.profiler == 'cprofile':
+            try:
+                self.tracer.enable()
+            except BaseException:
+                _cprofile_lock.release()
+                raise
+        else:
+            self.tracer.start()
+    
+    def stop(self):
+        if self.profiler == 'cprofile':
+            self.tracer.disable()
+            _cprofile_lock.release()
+        else:
+            self.tracer.stop()
+    
+    def finish(self, request):
+        match = getattr(request, 'resolver_match', None)
+        view = UNSAFE.sub('_', match.view_name if match else 'unresolved')
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        directory = profile_directory(self.config)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{view}--{stamp}-{os.getpid()}-{next(_sequence)}{EXTENSIONS[self.profiler]}'
+        if self.profiler == 'cprofile':
+            self.tracer.dump_stats(path)
+        else:
+            self.tracer.dump(path)
+        rotate(directory, self.config['MAX_FILES'])
+        return path
+
+
+def rotate(directory, keep):
+    """Delete all but the newest ``keep`` profiles in ``directory``"""
+    files = [p for p in directory.iterdir() if p.suffix in EXTENSIONS.values()]
+    if len(files) <= keep:
+        return
+    files.sort(key=lambda p: p.stat().st_mtime)
+    for path in files[:len(files) - keep]:
+        path.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.config = profiling_settings()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + self.config['TRIGGER_HEADER'].upper().replace('-', '_')
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def choose_profiler(self, request):
+        """Profiler for this request, or None to run it unprofiled"""
+        token = request.META.get(self.header)
+        if token:
+            return triggered_profiler(token, self.config['TRIGGER_MAX_AGE'])
+        if self.config['SAMPLE_RATE'] and random.random() < self.config['SAMPLE_RATE']:
+            return self.config['PROFILER']
+        return None
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiler = self.choose_profiler(request)
+        profile = RequestProfile.claim(profiler, self.config) if profiler else None
+        if profile is None:
+            return self.get_response(request)
+        profile.start()
+        try:
+            return self.get_response(request)
+        finally:
+            profile.stop()
+            profile.finish(request)
+    
+    async def __acall__(self, request):
+        profiler = self.choose_profiler(request)
+        profile = RequestProfile.claim(profiler, self.config) if profiler else None
+        if profile is None:
+            return await self.get_response(request)
+        # The view's sync work runs on the request's thread-sensitive
+        # executor, not on the event loop; profile that thread
+        await sync_to_async(profile.start)()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(profile.stop)()
+            await sync_to_async(profile.finish)(request)
+
+
+def profiles_by_view(directory):
+    """{(view, profiler): [paths]} for the profiles in ``directory``"""
+    kinds = {ext: profiler for profiler, ext in EXTENSIONS.items()}
+    grouped = defaultdict(list)
+    for path in sorted(Path(directory).glob('*--*')):
+        if path.suffix in kinds:
+            grouped[path.name.split('--', 1)[0], kinds[path.suffix]].append(path)
+    return dict(grouped)
+
+
+def folded_totals(paths):
+    """(self, inclusive, total) sample counts per function"""
+    own, inclusive, total = Counter(), Counter(), 0
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                count = int(count)
+                frames = stack.split(';')
+                total += count
+                own[frames[-1]] += count
+                # Recursive functions count once per stack
+                for label in set(frames):
+                    inclusive[label] += count
+    return own, inclusive, total
+
+
+def pstats_totals(paths):
+    """(self, inclusive, total) seconds per function"""
+    stats = pstats.Stats(*map(str, paths))
+    own, inclusive = Counter(), Counter()
+    for (filename, line, name), (_, _, tottime, cumtime, _) in stats.stats.items():
+        label = frame_label(filename, line, name)
+        own[label] += tottime
+        inclusive[label] += cumtime
+    return own, inclusive, stats.total_tt
+
+
+def hot_functions(paths, profiler, limit=20, sort='self'):
+    """[(function, self %, total %)] hottest first, across ``paths``"""
+    totals = folded_totals if profiler == 'sampling' else pstats_totals
+    own, inclusive, total = totals(paths)
+    if not total:
+        return []
+    ranked = (own if sort == 'self' else inclusive).most_common(limit)
+    return [
+        (label, 100 * own[label] / total, 100 * inclusive[label] / total)
+        for label, _ in ranked
+    ]
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.sql_instrumentation.SQLInstrumentationMiddleware',
+    'ecommerce.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -151,6 +153,93 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'profile'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Anonymous product pages are cached for this long (seconds); see
+# products/page_cache.py for surrogate-key purging
+PAGE_CACHE_TIMEOUT = 600
+
+# Catalog pagination: 'cursor' (keyset, no COUNT/OFFSET) or 'page'
+CATALOG_PAGINATION = 'cursor'
+
+# In-process product search index, for read-only replicas without
+# PostgreSQL full-text search (see products/search_index.py)
+PRODUCT_SEARCH_INDEX = {
+    'ENABLED': False,
+    'REFRESH_INTERVAL': 60,
+    'MAX_RESULTS': 1000,
+    'MAX_BYTES': 512 * 1024 * 1024,
+}
+
+# Time-limited stock holds for cart lines; enable for flash sales
+# (see products/reservations.py)
+STOCK_RESERVATIONS = {
+    'ENABLED': False,
+    'TTL': 15 * 60,
+}
+
+# Sessions stay in the database until CACHES points at Redis or Memcached
+# shared by every process. Then set SESSION_ENGINE = 'accounts.sessions'
+# and SESSION_SAVE_EVERY_REQUEST = True: sessions are read from the cache
+# and written through to the database only when they change, or once
+# SESSION_REFRESH_FRACTION of their lifetime has passed (sliding expiry);
+# see accounts/sessions.py. The accounts.E001 check refuses that engine
+# with a per-process cache, where a logged-out session would stay valid
+# in the other workers.
+SESSION_REFRESH_FRACTION = 0.1
+SESSION_CLEANUP_BATCH = 5000
+
+# Seconds a user stays in the authentication cache (accounts/user_cache.py);
+# CustomUser.save() invalidates it immediately
+USER_CACHE_TIMEOUT = 60
+
+# Login attempts allowed per client IP and per account before any password
+# is hashed (token buckets; see accounts/throttle.py). Behind a CDN or
+# reverse proxy, list its addresses in TRUSTED_PROXIES so clients are told
+# apart by X-Forwarded-For instead of sharing the proxy's bucket.
+LOGIN_THROTTLE = {
+    'ENABLED': True,
+    'IP_BURST': 30,
+    'IP_PER_MINUTE': 10,
+    'ACCOUNT_BURST': 10,
+    'ACCOUNT_PER_MINUTE': 3,
+    'TRUSTED_PROXIES': [],
+}
+
+# Query count and SQL time for a sample of requests, reported in a
+# Server-Timing header and on the ecommerce.sql logger, which warns when a
+# query shape repeats DUPLICATE_THRESHOLD times (ecommerce/sql_instrumentation.py)
+SQL_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.05,
+    'DUPLICATE_THRESHOLD': 5,
+}
+
+# Profiles of sampled requests, and of any request carrying a signed
+# X-Profile-Request header (manage.py profile_report --token sampling),
+# kept in BASE_DIR/profiles (ecommerce/profiling.py)
+REQUEST_PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.0,
+    'PROFILER': 'sampling',
+    'DIRECTORY': 'profiles',
+    'MAX_FILES': 500,
+}
+
+# Content-similarity index built by manage.py build_recommender (needs
+# NumPy); published builds live in BASE_DIR/recommender (products/recommender.py)
+RECOMMENDER = {
+    'DIRECTORY': 'recommender',
+    'DIMENSIONS': 1024,
+    'NEIGHBOURS': 20,
+}
+
+# Gzipped CSV/JSONL/XML catalog feeds for shopping channels, written by
+# manage.py export_feed or streamed from /products/feeds/ to holders of a
+# signed channel token (products/feeds.py)
+PRODUCT_FEEDS = {
+    'BASE_URL': 'http://localhost:8000',
+    'CHUNK_SIZE': 2000,
+}
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -0,0 +1,187 @@
+"""
+Per-request SQL instrumentation.
+
+SQLInstrumentationMiddleware times every query of a sampled request
+through a database execute wrapper. It reports the totals in a
+``Server-Timing`` header and in one JSON line on the ``ecommerce.sql``
+logger. Queries are grouped by shape: the SQL without its parameters,
+with IN lists collapsed. A shape repeated DUPLICATE_THRESHOLD times is
+the N+1 pattern, so the line is logged at WARNING and names the first
+project frame (and template) that issued it.
+
+Requests that aren't sampled pay one context-variable lookup per query.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.05,        # share of requests instrumented
+    'DUPLICATE_THRESHOLD': 5,   # repeats of one query shape that count as N+1
+}
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+TEMPLATE_SOURCE = os.path.join('django', 'template', 'base.py')
+
+logger = logging.getLogger('ecommerce.sql')
+
+_collector = ContextVar('sql_collector', default=None)
+
+
+def instrumentation_settings():
+    return {**DEFAULTS, **getattr(settings, 'SQL_INSTRUMENTATION', {})}
+
+
+def call_site():
+    """'path:line in function' of the innermost project frame, plus the template rendering it"""
+    project = str(settings.BASE_DIR) + os.sep
+    site = template = None
+    frame = sys._getframe(1)
+    while frame is not None and (site is None or template is None):
+        code = frame.f_code
+        filename = code.co_filename
+        if template is None and code.co_name == 'render' and filename.endswith(TEMPLATE_SOURCE):
+            origin = getattr(frame.f_locals.get('self'), 'origin', None)
+            template = getattr(origin, 'template_name', None)
+        if (site is None and filename.startswith(project) and filename != __file__
+                and 'site-packages' not in filename):
+            site = f'{os.path.relpath(filename, project)}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    if template:
+        return f'{site or "?"} via {template}'
+    return site
+
+
+class QueryCollector:
+    """Query count, SQL time and repeated shapes for one request"""
+    
+    def __init__(self, threshold=DEFAULTS['DUPLICATE_THRESHOLD']):
+        self.threshold = threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}  # shape: [count, seconds, call site]
+    
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        shape = IN_LIST.sub('IN (...)', sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = [0, 0.0, None]
+        entry[0] += 1
+        entry[1] += duration
+        if entry[0] == self.threshold:
+            # Only walk the stack once per repeated shape
+            entry[2] = call_site()
+    
+    def duplicates(self):
+        """Shapes run at least ``threshold`` times, most repeated first"""
+        repeated = [
+            {'sql': shape[:300], 'count': count, 'ms': round(seconds * 1000, 2), 'site': site}
+            for shape, (count, seconds, site) in self.shapes.items()
+            if count >= self.threshold
+        ]
+        return sorted(repeated, key=lambda entry: -entry['count'])
+
+
+def record_query(execute, sql, params, many, context):
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        collector.record(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_all():
+    """Wrap this thread's open connections; new ones are wrapped as they connect"""
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+connection_created.connect(install, dispatch_uid='ecommerce.sql_instrumentation')
+
+
+@contextmanager
+def collect_queries(threshold=None):
+    """Record every query run in this context (and sync_to_async calls it makes)"""
+    install_all()
+    collector = QueryCollector(threshold or instrumentation_settings()['DUPLICATE_THRESHOLD'])
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+
+
+class SQLInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.config = instrumentation_settings()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def sampled(self):
+        return random.random() < self.config['SAMPLE_RATE']
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with collect_queries(self.config['DUPLICATE_THRESHOLD']) as collector:
+            response = self.get_response(request)
+        return self.report(request, response, collector, time.perf_counter() - started)
+    
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with collect_queries(self.config['DUPLICATE_THRESHOLD']) as collector:
+            response = await self.get_response(request)
+        return self.report(request, response, collector, time.perf_counter() - started)
+    
+    def report(self, request, response, collector, elapsed):
+        sql_ms = round(collector.duration * 1000, 2)
+        total_ms = round(elapsed * 1000, 2)
+        timing = f'sql;dur={sql_ms};desc="{collector.count} queries", app;dur={total_ms}'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        
+        duplicates = collector.duplicates()
+        logger.log(logging.WARNING if duplicates else logging.INFO, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': collector.count,
+            'sql_ms': sql_ms,
+            'total_ms': total_ms,
+            'duplicates': duplicates,
+        }))
+        return response
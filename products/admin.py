@@ -4,7 +4,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     Category, Brand, Product, ProductImage, ProductReview, 
-    ProductVariant, Cart, CartItem, Wishlist, WishlistItem
+    ProductVariant, Cart, CartItem, Wishlist, WishlistItem, StockReservation, RelatedProduct
 )
 
 @admin.register(Category)
@@ -145,11 +145,11 @@ class ProductReviewAdmin(admin.ModelAdmin):
     actions = ['approve_reviews', 'reject_reviews']
     
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
+        queryset.set_approval(True)
     approve_reviews.short_description = "Approve selected reviews"
     
     def reject_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
+        queryset.set_approval(False)
     reject_reviews.short_description = "Reject selected reviews"
 
 @admin.register(ProductVariant)
@@ -165,6 +165,9 @@ class CartItemInline(admin.TabularInline):
     readonly_fields = ['added_at', 'updated_at', 'total_price']
     fields = ['product', 'variant', 'quantity', 'unit_price', 'total_price', 'added_at']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
     def unit_price(self, obj):
         return obj.unit_price
     unit_price.short_description = 'Unit Price'
@@ -174,7 +177,11 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'total_price', 'created_at', 'updated_at']
     readonly_fields = ['created_at', 'updated_at', 'total_items', 'total_price']
     search_fields = ['user__email', 'user__first_name', 'user__last_name']
+    list_select_related = ['user']
     inlines = [CartItemInline]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -182,6 +189,43 @@ class CartItemAdmin(admin.ModelAdmin):
     list_filter = ['added_at', 'updated_at']
     search_fields = ['cart__user__email', 'product__name']
     readonly_fields = ['added_at', 'updated_at', 'unit_price', 'total_price']
+    list_select_related = ['cart__user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Read-only: rows must change together with the reserved_quantity counters"""
+    list_display = ['holder', 'product', 'variant', 'quantity', 'expires_at', 'created_at']
+    list_filter = ['expires_at']
+    search_fields = ['holder', 'product__name', 'product__sku']
+    list_select_related = ['product', 'variant']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    """Read-only: rows are rewritten by refresh_related_products"""
+    list_display = ['product', 'rank', 'related', 'score', 'computed_at']
+    search_fields = ['product__name', 'product__sku']
+    list_select_related = ['product', 'related']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 class WishlistItemInline(admin.TabularInline):
     model = WishlistItem
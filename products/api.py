@@ -0,0 +1,247 @@
+"""
+Read-only JSON catalog API for the mobile app and partners.
+
+Rows are serialized straight from ``.values()``, without building model
+instances. Clients pick columns with ``?fields=`` and page with opaque
+``?cursor=`` tokens (see KeysetPaginator). Each page is streamed as it is
+read from the database, under ASGI as well as WSGI (see products.streaming).
+
+Responses carry a strong ETag built from the request and one aggregate
+over the rows of the requested page: the same keyset slice of at most
+limit + 1 rows that the page streams, so it costs an index range scan
+however large the catalog is. The aggregate is max(updated_at) plus the
+row count and id sum, so a row leaving the page and the next one moving
+in changes it; for products it also adds the sum of cache_version, which
+moves on review, image and variant changes that leave updated_at alone.
+A matching If-None-Match gets a 304 before any row is serialized.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Sum
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_safe
+
+from .models import Brand, Category, Product, ProductImage
+from .pagination import InvalidCursor, KeysetPaginator
+from .streaming import streamed
+
+API_VERSION = 1
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+FLUSH_ROWS = 200  # rows serialized per streamed chunk
+
+image_storage = ProductImage._meta.get_field('image').storage
+
+
+class InvalidRequest(Exception):
+    pass
+
+
+class Collection:
+    """One listing: what it exposes, how it filters and sorts, and what its ETag covers"""
+    
+    def __init__(self, queryset, fields, default_fields, orderings, filters=None, version=None):
+        self.queryset = queryset
+        self.fields = fields
+        self.default_fields = default_fields
+        self.orderings = orderings          # ?sort= value -> keyset ordering
+        self.filters = filters or {}        # query parameter -> lookup
+        self.version = version or {}        # extra aggregates folded into the ETag
+    
+    def selected_fields(self, params):
+        if 'fields' not in params:
+            return self.default_fields
+        fields = tuple(dict.fromkeys(f.strip() for f in params['fields'].split(',') if f.strip()))
+        unknown = [f for f in fields if f not in self.fields]
+        if unknown or not fields:
+            raise InvalidRequest(f'Unknown fields: {", ".join(unknown)}; choose from {", ".join(self.fields)}')
+        return fields
+    
+    def filtered(self, params):
+        queryset = self.queryset()
+        for param, lookup in self.filters.items():
+            if params.get(param):
+                queryset = queryset.filter(**{lookup: params[param]})
+        if params.get('updated_since'):
+            since = parse_datetime(params['updated_since'])
+            if since is None:
+                raise InvalidRequest('updated_since must be an ISO 8601 datetime')
+            queryset = queryset.filter(updated_at__gt=since)
+        return queryset
+    
+    def ordering(self, params):
+        sort = params.get('sort', 'id')
+        if sort not in self.orderings:
+            raise InvalidRequest(f'sort must be one of {", ".join(self.orderings)}')
+        return self.orderings[sort]
+    
+    def page(self, params):
+        """(fields, limit, paginator, queryset of the page's rows); raises InvalidRequest or InvalidCursor"""
+        fields = self.selected_fields(params)
+        limit = _limit(params)
+        queryset = self.filtered(params)
+        if 'main_image' in fields:
+            queryset = queryset.with_main_image()
+        paginator = KeysetPaginator(queryset, self.ordering(params), limit)
+        direction, _, queryset = paginator.page_queryset(params.get('cursor'))
+        if direction != 'next':
+            raise InvalidCursor(params['cursor'])
+        return fields, limit, paginator, queryset
+    
+    def etag(self, request):
+        """Strong validator for this request, or None when its parameters are invalid"""
+        try:
+            *_, queryset = self.page(request.GET)
+        except (InvalidRequest, InvalidCursor):
+            return None
+        # Aggregating a slice wraps it in a subquery, so only the page's rows are read
+        state = queryset.aggregate(
+            updated=Max('updated_at'), rows=Count('id'), ids=Sum('id'), **self.version
+        )
+        stamp = ':'.join(str(state[key]) for key in sorted(state))
+        return hashlib.md5(f'{API_VERSION}:{request.get_full_path()}:{stamp}'.encode()).hexdigest()
+
+
+def _columns(fields):
+    # main_image is the with_main_image() annotation, turned into a URL below
+    return ['main_image_path' if f == 'main_image' else f for f in fields]
+
+
+def _present(row, fields):
+    if 'main_image' in fields:
+        path = row.get('main_image_path')
+        row['main_image'] = image_storage.url(path) if path else None
+    return {f: row[f] for f in fields}
+
+
+def _stream(rows, fields, paginator, limit):
+    """JSON text of one page, in chunks, ending with the next page's cursor"""
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    chunk, sent, last = [], 0, None
+    for row in rows:
+        if sent == limit:
+            break  # the extra row only says there is a next page
+        chunk.append(encoder.encode(_present(row, fields)))
+        sent += 1
+        last = row
+        if len(chunk) == FLUSH_ROWS:
+            yield (',' if sent > FLUSH_ROWS else '') + ','.join(chunk)
+            chunk = []
+    else:
+        last = None  # no extra row: this is the last page
+    if chunk:
+        yield (',' if sent > len(chunk) else '') + ','.join(chunk)
+    cursor = paginator.next_cursor(last) if last is not None else None
+    yield f'], "next_cursor": {json.dumps(cursor)}}}'
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidRequest('limit must be an integer')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidRequest(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def _cacheable(response):
+    # Clients may keep a copy but must revalidate it with the ETag
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def collection_view(collection):
+    """A GET view listing ``collection`` as a streamed, cursor-paginated JSON page"""
+    
+    def etag(request):
+        return collection.etag(request)
+    
+    @require_safe
+    @condition(etag_func=etag)
+    def view(request):
+        try:
+            fields, limit, paginator, queryset = collection.page(request.GET)
+        except InvalidRequest as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        # Cursor keys are read even when not requested, and dropped on output
+        columns = list(dict.fromkeys(_columns(fields) + paginator.fields))
+        rows = queryset.values(*columns).iterator(chunk_size=FLUSH_ROWS)
+        response = StreamingHttpResponse(
+            streamed(request, _stream(rows, fields, paginator, limit)), content_type='application/json'
+        )
+        return _cacheable(response)
+    
+    return view
+
+
+PRODUCTS = Collection(
+    queryset=lambda: Product.objects.filter(is_active=True),
+    fields=(
+        'id', 'name', 'slug', 'sku', 'brand_id', 'category_id', 'short_description', 'description',
+        'features', 'specifications', 'tags', 'price', 'original_price', 'discount_percentage',
+        'stock_quantity', 'max_order_quantity', 'is_featured', 'is_bestseller', 'is_new_arrival',
+        'free_shipping', 'rating_avg', 'rating_count', 'main_image', 'created_at', 'updated_at',
+    ),
+    default_fields=(
+        'id', 'name', 'slug', 'brand_id', 'category_id', 'price', 'original_price',
+        'rating_avg', 'rating_count', 'main_image', 'updated_at',
+    ),
+    orderings={
+        'id': ('id',),
+        'name': ('name',),
+        'price_low': ('price',),
+        'price_high': ('-price',),
+        'newest': ('-created_at',),
+    },
+    filters={'category': 'category__slug', 'brand': 'brand__slug'},
+    version={'versions': Sum('cache_version')},
+)
+CATEGORIES = Collection(
+    queryset=lambda: Category.objects.filter(is_active=True),
+    fields=('id', 'name', 'slug', 'description', 'created_at', 'updated_at'),
+    default_fields=('id', 'name', 'slug', 'updated_at'),
+    orderings={'id': ('id',), 'name': ('name',)},
+)
+BRANDS = Collection(
+    queryset=lambda: Brand.objects.filter(is_active=True),
+    fields=('id', 'name', 'slug', 'description', 'website', 'created_at', 'updated_at'),
+    default_fields=('id', 'name', 'slug', 'updated_at'),
+    orderings={'id': ('id',), 'name': ('name',)},
+)
+
+product_collection = collection_view(PRODUCTS)
+category_collection = collection_view(CATEGORIES)
+brand_collection = collection_view(BRANDS)
+
+
+def _product_etag(request, slug):
+    state = Product.objects.filter(slug=slug, is_active=True).values('updated_at', 'cache_version').first()
+    if state is None:
+        return None
+    stamp = f'{state["updated_at"].isoformat()}:{state["cache_version"]}'
+    return hashlib.md5(f'{API_VERSION}:{request.get_full_path()}:{stamp}'.encode()).hexdigest()
+
+
+@require_safe
+@condition(etag_func=_product_etag)
+def product_item(request, slug):
+    """One product as JSON, with the same ?fields= as the listing"""
+    try:
+        fields = PRODUCTS.selected_fields(request.GET)
+    except InvalidRequest as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    queryset = PRODUCTS.queryset().filter(slug=slug)
+    if 'main_image' in fields:
+        queryset = queryset.with_main_image()
+    row = queryset.values(*_columns(fields)).first()
+    if row is None:
+        raise Http404('No such product')
+    return _cacheable(JsonResponse(_present(row, fields), encoder=DjangoJSONEncoder))
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CATALOG_VERSION_KEY = 'products:catalog-version'
+
+
+def catalog_version():
+    """Version stamp for catalog-wide cached data; changes on every catalog write"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a flushed cache can't resurrect old entries
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        catalog_version()
+
+
+# Rendered product cards
+
+CARD_TEMPLATE = 'products/includes/product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CARD_METRICS_KEY = 'products:card-cache:{}'
+CARD_METRICS_FLUSH_EVERY = 100
+
+
+def card_cache_key(product):
+    # cache_version moves on image, variant, review and brand changes;
+    # updated_at on every save() or bulk update of the product row.
+    stamp = product.updated_at.timestamp() if product.updated_at else 0
+    return f'products:card:{product.pk}:{product.cache_version}:{stamp}'
+
+
+class CardCacheMetrics:
+    """
+    Hit/miss counters for the card cache.
+    
+    Counted in-process and flushed to the shared cache in batches so the
+    bookkeeping doesn't add a round trip to every listing request.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = Counter()
+    
+    def record(self, hits, misses):
+        with self._lock:
+            self.pending['hits'] += hits
+            self.pending['misses'] += misses
+            if sum(self.pending.values()) < CARD_METRICS_FLUSH_EVERY:
+                return
+            pending, self.pending = self.pending, Counter()
+        self._flush(pending)
+    
+    def _flush(self, pending):
+        for name, count in pending.items():
+            key = CARD_METRICS_KEY.format(name)
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.set(key, count, None)
+    
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, Counter()
+        self._flush(pending)
+    
+    def snapshot(self):
+        """Shared totals plus this process's unflushed counts"""
+        shared = cache.get_many([CARD_METRICS_KEY.format(n) for n in ('hits', 'misses')])
+        hits = shared.get(CARD_METRICS_KEY.format('hits'), 0) + self.pending['hits']
+        misses = shared.get(CARD_METRICS_KEY.format('misses'), 0) + self.pending['misses']
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
+    
+    def reset(self):
+        with self._lock:
+            self.pending = Counter()
+        cache.delete_many([CARD_METRICS_KEY.format(n) for n in ('hits', 'misses')])
+
+
+card_metrics = CardCacheMetrics()
+
+
+def render_product_cards(products):
+    """
+    [(product, html)] for a page of products, read with one cache multi-get.
+    
+    Missing cards are rendered and written back with one multi-set.
+    """
+    products = list(products)
+    keys = [card_cache_key(product) for product in products]
+    cached = cache.get_many(keys)
+    missing = {}
+    cards = []
+    for product, key in zip(products, keys):
+        html = cached.get(key)
+        if html is None:
+            html = missing[key] = render_to_string(CARD_TEMPLATE, {'product': product})
+        cards.append((product, mark_safe(html)))
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+    card_metrics.record(len(products) - len(missing), len(missing))
+    return cards
@@ -0,0 +1,213 @@
+"""
+Batched cart mutations.
+
+A burst of add/update/remove operations is applied in one transaction:
+the cart and its lines are locked, every product and variant involved is
+loaded with one query each, stock is checked in memory, and the changes
+are written with at most one bulk delete and update plus an upsert of the
+new lines. add_for_user() does not take the cart lock, so a line it adds
+concurrently is merged by the upsert rather than colliding with it.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product, ProductVariant
+from .reservations import reservations_enabled, user_holder, held_quantities, hold_cart_line, release
+
+OPERATIONS = ('add', 'update', 'remove')
+MAX_OPERATIONS = 100
+
+
+class InvalidOperations(ValueError):
+    pass
+
+
+def _parse_operation(raw):
+    if not isinstance(raw, dict) or raw.get('op') not in OPERATIONS:
+        return None
+    try:
+        if raw['op'] == 'add':
+            return {
+                'op': 'add',
+                'product_id': int(raw['product_id']),
+                'quantity': int(raw.get('quantity', 1)),
+                'variant_id': int(raw['variant_id']) if raw.get('variant_id') else None,
+            }
+        operation = {'op': raw['op'], 'item_id': int(raw['item_id'])}
+        if raw['op'] == 'update':
+            operation['quantity'] = int(raw['quantity'])
+        return operation
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def parse_operations(payload):
+    """
+    Normalize ``{"operations": [...]}``; malformed entries become None so
+    they can be reported individually.
+    """
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not 0 < len(operations) <= MAX_OPERATIONS:
+        raise InvalidOperations(f'Expected a list of 1 to {MAX_OPERATIONS} operations.')
+    return [_parse_operation(raw) for raw in operations]
+
+
+def _failure(message):
+    return {'success': False, 'message': message}
+
+
+class CartBatch:
+    """In-memory view of a locked cart that operations are applied to"""
+    
+    def __init__(self, cart, operations, holder=None):
+        self.cart = cart
+        # Reservation holder, when stock reservations are enabled
+        self.holder = holder
+        self.held = held_quantities(holder) if holder else {}
+        self.lines = {item.pk: item for item in cart.items.select_for_update()}
+        self.by_key = {(item.product_id, item.variant_id): item for item in self.lines.values()}
+        self.new_lines = []
+        self.unsaved_results = []  # results waiting for the pk of a new line
+        self.changed = set()
+        self.removed = set()
+        
+        product_ids = set()
+        variant_ids = set()
+        for operation in operations:
+            if operation is None:
+                continue
+            if operation['op'] == 'add':
+                product_ids.add(operation['product_id'])
+                if operation['variant_id']:
+                    variant_ids.add(operation['variant_id'])
+            elif operation['item_id'] in self.lines:
+                line = self.lines[operation['item_id']]
+                product_ids.add(line.product_id)
+                if line.variant_id:
+                    variant_ids.add(line.variant_id)
+        self.products = Product.objects.filter(pk__in=product_ids).only(
+            'id', 'is_active', 'stock_quantity', 'reserved_quantity', 'max_order_quantity'
+        ).in_bulk()
+        self.variants = ProductVariant.objects.filter(pk__in=variant_ids).only(
+            'id', 'product_id', 'is_active', 'stock_quantity', 'reserved_quantity'
+        ).in_bulk()
+    
+    def _available(self, product_id, variant_id):
+        sku = self.variants[variant_id] if variant_id else self.products[product_id]
+        if self.holder is None:
+            return sku.stock_quantity
+        # Units this cart already holds are available to it
+        return sku.available_quantity + self.held.get((product_id, variant_id or None), 0)
+    
+    def _line(self, item_id):
+        if item_id in self.removed:
+            return None
+        return self.lines.get(item_id)
+    
+    def apply(self, operation):
+        if operation is None:
+            return _failure('Invalid operation.')
+        return getattr(self, operation['op'])(**{k: v for k, v in operation.items() if k != 'op'})
+    
+    def add(self, product_id, quantity, variant_id):
+        if quantity < 1:
+            return _failure('Quantity must be at least 1.')
+        product = self.products.get(product_id)
+        variant = self.variants.get(variant_id) if variant_id else None
+        if (
+            product is None or not product.is_active
+            or variant_id and (variant is None or not variant.is_active or variant.product_id != product_id)
+        ):
+            return _failure('This product is currently unavailable.')
+        limit = min(product.max_order_quantity, self._available(product_id, variant_id))
+        if limit <= 0:
+            return _failure('This product is currently unavailable.')
+        
+        line = self.by_key.get((product_id, variant_id))
+        if line is None:
+            line = CartItem(cart=self.cart, product_id=product_id, variant_id=variant_id, quantity=0)
+            self.by_key[(product_id, variant_id)] = line
+            self.new_lines.append(line)
+        elif line.pk in self.removed:
+            self.removed.discard(line.pk)
+            line.quantity = 0
+        line.quantity = min(line.quantity + quantity, limit)
+        if line.pk:
+            self.changed.add(line.pk)
+        
+        message = 'Product added to cart!'
+        if line.quantity >= limit:
+            message = f'Only {limit} items available; your cart now has the maximum.'
+        result = {'success': True, 'message': message, 'item_id': line.pk, 'item_quantity': line.quantity}
+        if line.pk is None:
+            self.unsaved_results.append((result, line))
+        return result
+    
+    def update(self, item_id, quantity):
+        line = self._line(item_id)
+        if line is None:
+            return _failure('Item not found in cart.')
+        if quantity <= 0:
+            self.removed.add(item_id)
+            return {'success': True, 'message': 'Item removed from cart.'}
+        
+        available_stock = self._available(line.product_id, line.variant_id)
+        if available_stock < quantity:
+            return _failure(f'Only {available_stock} items available in stock.')
+        max_order_quantity = self.products[line.product_id].max_order_quantity
+        if quantity > max_order_quantity:
+            return _failure(f'Maximum order quantity is {max_order_quantity}.')
+        
+        line.quantity = quantity
+        self.changed.add(item_id)
+        return {'success': True, 'message': 'Cart updated successfully!', 'item_id': item_id, 'item_quantity': quantity}
+    
+    def remove(self, item_id):
+        if self._line(item_id) is None:
+            return _failure('Item not found in cart.')
+        self.removed.add(item_id)
+        return {'success': True, 'message': 'Item removed from cart successfully!'}
+    
+    def save(self):
+        if self.removed:
+            CartItem.objects.filter(pk__in=self.removed).delete()
+        now = timezone.now()
+        changed = [self.lines[pk] for pk in self.changed - self.removed]
+        for line in changed:
+            line.updated_at = now
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+        if self.new_lines:
+            stored = CartItem.objects.upsert_lines(
+                self.cart.pk, [(line.product_id, line.variant_id, line.quantity) for line in self.new_lines]
+            )
+            for line in self.new_lines:
+                line.pk, line.quantity = stored[line.product_id, line.variant_id]
+        for result, line in self.unsaved_results:
+            result['item_id'] = line.pk
+            result['item_quantity'] = line.quantity
+        if self.holder:
+            self._hold_stock(changed + self.new_lines)
+    
+    def _hold_stock(self, lines):
+        for pk in self.removed:
+            line = self.lines[pk]
+            release(self.holder, line.product_id, line.variant_id)
+        for line in lines:
+            hold_cart_line(self.holder, line.pk, line.product_id, line.variant_id, line.quantity)
+
+
+def apply_cart_operations(user, operations):
+    """
+    Apply parsed operations to the user's cart atomically.
+    
+    Returns (per-operation results, CartSummary after the batch).
+    """
+    with transaction.atomic():
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        holder = user_holder(user) if reservations_enabled() else None
+        batch = CartBatch(cart, operations, holder)
+        results = [batch.apply(operation) for operation in operations]
+        batch.save()
+        summary = cart.summary()
+    return results, summary
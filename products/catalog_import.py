@@ -0,0 +1,295 @@
+"""
+Bulk product import from supplier files (CSV or JSON Lines), upserting by SKU.
+
+Files are read in batches of CHUNK_SIZE rows. Each batch is parsed and
+validated in a process pool against in-memory brand and category slug
+maps, so validation never touches the database. The parent then runs a
+fixed number of queries per batch, however many rows it holds: one to load
+the current rows for the batch's SKUs, usually one or two to find free
+slugs for new products, the upsert itself, and (on PostgreSQL) a search
+vector refresh.
+
+The upsert is ``bulk_create(update_conflicts=True)`` on sku. On PostgreSQL
+it can instead COPY the batch into a staging table and merge it with
+INSERT ... ON CONFLICT. Rows that would not change anything are skipped,
+so re-importing a file leaves updated_at, caches and related products
+alone. Blank CSV cells and absent JSON keys keep the current value;
+existing products keep their slug.
+"""
+import csv
+import gzip
+import json
+from collections import deque
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cache import bump_catalog_version
+from .models import Brand, Category, Product
+from .page_cache import purge_surrogate_keys
+from .parallel import fork_pool
+from .related import refresh_related
+from .synthetic import complete_row, copy_rows
+
+FORMATS = ('csv', 'jsonl')
+# Columns a supplier file may set; brand and category are given as slugs
+FIELDS = (
+    'sku', 'name', 'slug', 'brand', 'category', 'description', 'short_description', 'features',
+    'specifications', 'price', 'original_price', 'discount_percentage', 'stock_quantity',
+    'min_stock_level', 'max_order_quantity', 'is_active', 'is_featured', 'is_bestseller',
+    'is_new_arrival', 'meta_title', 'meta_description', 'tags', 'weight', 'dimensions',
+    'free_shipping', 'shipping_class',
+)
+REQUIRED = ('name', 'brand_id', 'category_id', 'price')  # for new products
+UPDATE_FIELDS = [
+    Product._meta.get_field(name).attname for name in FIELDS if name not in ('sku', 'slug')
+]
+MAX_ERRORS = 100  # row errors kept for the report
+# Spellings suppliers use for flags; matched case-insensitively
+BOOLEANS = {
+    **dict.fromkeys(('true', 't', 'yes', 'y', '1'), True),
+    **dict.fromkeys(('false', 'f', 'no', 'n', '0'), False),
+}
+STAGE_TABLE = 'product_import_stage'
+
+
+def file_format(path):
+    name = str(path).lower().removesuffix('.gz')
+    for format, suffixes in (('csv', ('.csv',)), ('jsonl', ('.jsonl', '.ndjson'))):
+        if name.endswith(suffixes):
+            return format
+    raise ValueError(f'Cannot tell the format of {path}; pass one of {", ".join(FORMATS)}')
+
+
+def read_rows(path, format=None):
+    """(line number, row) pairs; JSON Lines rows stay text for the workers to parse"""
+    format = format or file_format(path)
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8-sig') as f:
+        if format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    yield line, text
+
+
+def _json_value(name, value):
+    if isinstance(value, str):
+        if name == 'features' and not value.lstrip().startswith('['):
+            return [part.strip() for part in value.split('|') if part.strip()]
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValidationError('Enter valid JSON.')
+    expected = list if name == 'features' else dict
+    if not isinstance(value, expected):
+        raise ValidationError(f'Expected a JSON {"array" if expected is list else "object"}.')
+    return value
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    key = str(value).lower()
+    if key not in BOOLEANS:
+        raise ValidationError(f'Expected true/false, yes/no or 1/0, not {value!r}.')
+    return BOOLEANS[key]
+
+
+def clean_row(raw, brands, categories):
+    """(values by attname, [error]) for one supplier row; needs no database"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as exc:
+            return {}, [f'invalid JSON: {exc}']
+        if not isinstance(raw, dict):
+            return {}, ['expected a JSON object']
+    values, errors = {}, []
+    for name in FIELDS:
+        value = raw.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        if isinstance(value, float):
+            value = str(value)  # DecimalField rejects the binary expansion of a float
+        try:
+            if name in ('brand', 'category'):
+                slugs = brands if name == 'brand' else categories
+                if value not in slugs:
+                    raise ValidationError(f'Unknown {name} {value!r}.')
+                values[f'{name}_id'] = slugs[value]
+            elif name in ('features', 'specifications'):
+                values[name] = _json_value(name, value)
+            elif Product._meta.get_field(name).get_internal_type() == 'BooleanField':
+                values[name] = _boolean(value)
+            else:
+                values[name] = Product._meta.get_field(name).clean(value, None)
+        except ValidationError as exc:
+            errors.append(f'{name}: {" ".join(exc.messages)}')
+    if 'sku' not in values and not errors:
+        errors.append('sku: This field is required.')
+    return values, errors
+
+
+def validate_batch(rows, brands, categories):
+    """Run in a worker process: [(line, values, errors)] for one batch"""
+    return [(line, *clean_row(raw, brands, categories)) for line, raw in rows]
+
+
+def validated(batches, brands, categories, workers):
+    """validate_batch() results in file order, at most 2 x ``workers`` batches in flight"""
+    if workers <= 1:
+        for batch in batches:
+            yield validate_batch(batch, brands, categories)
+        return
+    with fork_pool(workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(validate_batch, batch, brands, categories))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def unique_slugs(bases, skus):
+    """A free slug per (base, sku): the base, else base-sku, else base-sku-N; one query per round"""
+    max_length = Product._meta.get_field('slug').max_length
+    
+    def candidate(base, sku, attempt):
+        suffix = '' if attempt == 0 else f'-{slugify(sku)}' + (f'-{attempt}' if attempt > 1 else '')
+        return base[:max_length - len(suffix)] + suffix
+    
+    slugs, used = [None] * len(bases), set()
+    pending, attempt = list(range(len(bases))), 0
+    while pending:
+        wanted = {n: candidate(bases[n], skus[n], attempt) for n in pending}
+        taken = set(Product.objects.filter(slug__in=set(wanted.values())).order_by().values_list('slug', flat=True))
+        retry = []
+        for n in pending:
+            if wanted[n] in taken or wanted[n] in used:
+                retry.append(n)
+            else:
+                slugs[n] = wanted[n]
+                used.add(wanted[n])
+        pending, attempt = retry, attempt + 1
+    return slugs
+
+
+def merge_copy(rows, now):
+    """COPY rows into a staging table and merge them into products on sku (PostgreSQL)"""
+    rows = [complete_row(Product, row, now) for row in rows]
+    quote = connection.ops.quote_name
+    table = quote(Product._meta.db_table)
+    columns = ', '.join(quote(Product._meta.get_field(name).column) for name in rows[0])
+    updates = ', '.join(f'{quote(name)} = EXCLUDED.{quote(name)}' for name in UPDATE_FIELDS + ['updated_at'])
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE {STAGE_TABLE} AS SELECT {columns} FROM {table} WITH NO DATA')
+        copy_rows(Product, rows, table=STAGE_TABLE)
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {STAGE_TABLE} '
+            f'ON CONFLICT ({quote("sku")}) DO UPDATE SET {updates}'
+        )
+        cursor.execute(f'DROP TABLE {STAGE_TABLE}')
+
+
+class ImportReport:
+    """Counts and the first MAX_ERRORS row errors of one import"""
+    
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.errors = []    # (line, message)
+    
+    def reject(self, line, errors):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, '; '.join(errors)))
+
+
+def import_batch(results, method, report, dry_run=False):
+    """Upsert one validated batch in its own transaction; a dry run only counts"""
+    rows = {}
+    for line, values, errors in results:
+        report.rows += 1
+        if errors:
+            report.reject(line, errors)
+        else:
+            rows[values['sku']] = (line, values)  # a later row for the same SKU wins
+    current = {
+        row['sku']: row for row in
+        Product.objects.filter(sku__in=list(rows)).order_by().values('sku', 'slug', *UPDATE_FIELDS)
+    }
+    inserts, updates = [], []
+    for sku, (line, values) in rows.items():
+        existing = current.get(sku)
+        if existing is None:
+            missing = [name.removesuffix('_id') for name in REQUIRED if name not in values]
+            if missing:
+                report.reject(line, [f'{name}: Required for new products.' for name in missing])
+            else:
+                inserts.append(values)
+            continue
+        merged = {**existing, **values, 'slug': existing['slug']}
+        if merged == existing:
+            report.unchanged += 1
+        else:
+            updates.append(merged)
+    if dry_run:
+        report.created += len(inserts)
+        report.updated += len(updates)
+        return
+    
+    if inserts:
+        slugs = unique_slugs(
+            [row.get('slug') or slugify(row['name']) or 'product' for row in inserts],
+            [row['sku'] for row in inserts],
+        )
+        for row, slug in zip(inserts, slugs):
+            row['slug'] = slug
+    changed = inserts + updates
+    if not changed:
+        return
+    with transaction.atomic():
+        if method == 'copy':
+            merge_copy(changed, timezone.now())
+        else:
+            # auto_now stamps updated_at on every row, inserted or updated
+            Product.objects.bulk_create(
+                [Product(**row) for row in changed], update_conflicts=True,
+                unique_fields=['sku'], update_fields=UPDATE_FIELDS + ['updated_at'],
+            )
+        Product.objects.filter(sku__in=[row['sku'] for row in changed]).refresh_search_vector()
+    report.created += len(inserts)
+    report.updated += len(updates)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def import_products(path, format=None, method='bulk', chunk_size=1000, workers=1, dry_run=False):
+    """Import a supplier file; returns an ImportReport. A dry run writes nothing"""
+    brands = dict(Brand.objects.values_list('slug', 'id'))
+    categories = dict(Category.objects.values_list('slug', 'id'))
+    report = ImportReport()
+    for results in validated(batched(read_rows(path, format), chunk_size), brands, categories, workers):
+        import_batch(results, method, report, dry_run)
+    if (report.created or report.updated) and not dry_run:
+        bump_catalog_version()
+        purge_surrogate_keys(['product-list', 'product-detail'])
+        refresh_related()
+    return report
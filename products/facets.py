@@ -0,0 +1,120 @@
+import hashlib
+from collections import Counter
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, When, Value, Count, IntegerField, BooleanField, Q
+
+from .cache import catalog_version
+
+FACET_CACHE_TIMEOUT = 60 * 15
+
+# (key, label, lower bound, upper bound) - bounds are [low, high)
+PRICE_BANDS = [
+    ('0-25', 'Under $25', None, Decimal('25')),
+    ('25-50', '$25 to $50', Decimal('25'), Decimal('50')),
+    ('50-100', '$50 to $100', Decimal('50'), Decimal('100')),
+    ('100-250', '$100 to $250', Decimal('100'), Decimal('250')),
+    ('250-', '$250 & above', Decimal('250'), None),
+]
+PRICE_BAND_KEYS = [band[0] for band in PRICE_BANDS]
+
+
+def price_band_q(key):
+    _, _, low, high = PRICE_BANDS[PRICE_BAND_KEYS.index(key)]
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+class FacetFilters:
+    """Normalized facet selections taken from the query string"""
+    
+    def __init__(self, category_ids=(), brand_ids=(), price_bands=(), in_stock=False):
+        self.category_ids = set(category_ids)
+        self.brand_ids = set(brand_ids)
+        self.price_bands = {key for key in price_bands if key in PRICE_BAND_KEYS}
+        self.in_stock = in_stock
+    
+    def apply(self, queryset):
+        if self.category_ids:
+            queryset = queryset.filter(category_id__in=self.category_ids)
+        if self.brand_ids:
+            queryset = queryset.filter(brand_id__in=self.brand_ids)
+        if self.price_bands:
+            q = Q()
+            for key in sorted(self.price_bands):
+                q |= price_band_q(key)
+            queryset = queryset.filter(q)
+        if self.in_stock:
+            queryset = queryset.filter(stock_quantity__gt=0)
+        return queryset
+    
+    def matches(self, category_id, brand_id, band, in_stock, ignore):
+        """Whether a facet combination passes every selection except ``ignore``"""
+        return (
+            (ignore == 'category' or not self.category_ids or category_id in self.category_ids)
+            and (ignore == 'brand' or not self.brand_ids or brand_id in self.brand_ids)
+            and (ignore == 'price' or not self.price_bands or PRICE_BAND_KEYS[band] in self.price_bands)
+            and (ignore == 'in_stock' or not self.in_stock or in_stock)
+        )
+
+
+def facet_combinations(queryset):
+    """
+    Product counts per (category, brand, price band, in stock) combination.
+    
+    One GROUP BY over the search results; every facet count for any
+    selection of filters can be derived from these rows in Python.
+    """
+    price_band = Case(
+        *[When(price_band_q(key), then=Value(i)) for i, key in enumerate(PRICE_BAND_KEYS)],
+        output_field=IntegerField(),
+    )
+    in_stock = Case(
+        When(stock_quantity__gt=0, then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+    rows = (
+        queryset.order_by()
+        .annotate(facet_price_band=price_band, facet_in_stock=in_stock)
+        .values_list('category_id', 'brand_id', 'facet_price_band', 'facet_in_stock')
+        .annotate(count=Count('id'))
+    )
+    return [tuple(row) for row in rows]
+
+
+def cached_facet_combinations(queryset, search_query):
+    """facet_combinations() cached per search query and catalog version"""
+    normalized = ' '.join(search_query.lower().split())
+    digest = hashlib.md5(normalized.encode()).hexdigest()
+    key = f'products:facets:{catalog_version()}:{digest}'
+    combinations = cache.get(key)
+    if combinations is None:
+        combinations = facet_combinations(queryset)
+        cache.set(key, combinations, FACET_CACHE_TIMEOUT)
+    return combinations
+
+
+def facet_counts(combinations, filters):
+    """
+    Disjunctive counts: each facet honours every selection but its own,
+    so picking one brand still shows how many products other brands have.
+    """
+    counts = {name: Counter() for name in ('category', 'brand', 'price')}
+    in_stock = 0
+    for category_id, brand_id, band, stocked, count in combinations:
+        if filters.matches(category_id, brand_id, band, stocked, ignore='category'):
+            counts['category'][category_id] += count
+        if filters.matches(category_id, brand_id, band, stocked, ignore='brand'):
+            counts['brand'][brand_id] += count
+        if band is not None and filters.matches(category_id, brand_id, band, stocked, ignore='price'):
+            counts['price'][PRICE_BAND_KEYS[band]] += count
+        if stocked and filters.matches(category_id, brand_id, band, stocked, ignore='in_stock'):
+            in_stock += count
+    counts['in_stock'] = in_stock
+    return counts
@@ -0,0 +1,250 @@
+"""
+Product feeds for comparison-shopping channels (CSV, JSON Lines, XML).
+
+Rows are read with ``.values().iterator(chunk_size=...)``, which uses a
+server-side cursor on PostgreSQL. They are formatted and gzip-compressed
+as they arrive, so memory use is flat however large the catalog is. A
+feed can be split into N shards of contiguous id ranges. Each shard is an
+index range scan, so ``export_feed`` can write the shards in parallel
+processes, and the ``product_feed`` endpoint can serve one per request.
+The endpoint streams under ASGI as well as WSGI (see products.streaming).
+
+Channels pull the endpoint with a signed ``?token=`` naming the channel
+(``export_feed --token <channel>``). Changing SALT revokes every token.
+"""
+import csv
+import io
+import json
+import os
+import re
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import F, Max, Min
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from .models import Product, ProductImage
+from .streaming import streamed
+
+DEFAULTS = {
+    'BASE_URL': 'http://localhost:8000',  # absolute links and image URLs start with this
+    'CHUNK_SIZE': 2000,                   # rows per server-side cursor fetch
+    'MAX_SHARDS': 64,
+    'SALT': 'products.feeds',             # change to revoke every channel's token
+}
+COLUMNS = (
+    'id', 'sku', 'title', 'description', 'link', 'image_link', 'brand', 'category',
+    'price', 'original_price', 'discount_percentage', 'availability', 'stock',
+    'rating', 'rating_count',
+)
+FLUSH_ROWS = 500  # formatted rows per compressed write
+# Characters XML 1.0 forbids even when escaped
+XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+image_storage = ProductImage._meta.get_field('image').storage
+
+
+def feed_settings():
+    return {**DEFAULTS, **getattr(settings, 'PRODUCT_FEEDS', {})}
+
+
+def shard_bounds(shards):
+    """[(first id, last id)] splitting active products into ``shards`` id ranges"""
+    bounds = Product.objects.filter(is_active=True).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return [(1, 0)] * shards
+    low, high = bounds['low'], bounds['high']
+    step = (high - low) // shards + 1
+    return [(low + n * step, min(low + (n + 1) * step - 1, high)) for n in range(shards)]
+
+
+def feed_rows(first_id=None, last_id=None, base_url=None, chunk_size=None):
+    """Feed records (dicts keyed by COLUMNS) of active products, in id order"""
+    config = feed_settings()
+    base_url = (base_url or config['BASE_URL']).rstrip('/')
+    products = Product.objects.filter(is_active=True)
+    if first_id is not None:
+        products = products.filter(id__gte=first_id, id__lte=last_id)
+    rows = products.with_main_image().order_by('id').values(
+        'id', 'sku', 'name', 'slug', 'short_description', 'price', 'original_price',
+        'discount_percentage', 'stock_quantity', 'reserved_quantity', 'rating_avg', 'rating_count',
+        'main_image_path', brand_name=F('brand__name'), category_name=F('category__name'),
+    )
+    # reverse() per row is slow; every detail URL differs only by its slug
+    link = base_url + reverse('product_detail', kwargs={'slug': 'SLUG'})
+    for row in rows.iterator(chunk_size=chunk_size or config['CHUNK_SIZE']):
+        stock = max(row['stock_quantity'] - row['reserved_quantity'], 0)
+        image = row['main_image_path']
+        if image:
+            image = image_storage.url(image)
+            if image.startswith('/'):
+                image = base_url + image
+        yield {
+            'id': row['id'],
+            'sku': row['sku'],
+            'title': row['name'],
+            'description': row['short_description'],
+            'link': link.replace('SLUG', row['slug']),
+            'image_link': image or '',
+            'brand': row['brand_name'],
+            'category': row['category_name'],
+            'price': row['price'],
+            'original_price': row['original_price'] or '',
+            'discount_percentage': row['discount_percentage'],
+            'availability': 'in stock' if stock else 'out of stock',
+            'stock': stock,
+            'rating': row['rating_avg'],
+            'rating_count': row['rating_count'],
+        }
+
+
+class CsvFeed:
+    extension = 'csv'
+    
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+    
+    def header(self):
+        return self.rows([COLUMNS])
+    
+    def rows(self, records):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerows(
+            record if isinstance(record, tuple) else [record[c] for c in COLUMNS] for record in records
+        )
+        return self.buffer.getvalue()
+    
+    def footer(self):
+        return ''
+
+
+class JsonlFeed:
+    extension = 'jsonl'
+    
+    def header(self):
+        return ''
+    
+    def rows(self, records):
+        return ''.join(json.dumps(record, default=str) + '\n' for record in records)
+    
+    def footer(self):
+        return ''
+
+
+def xml_text(value):
+    """Escaped element text, without the control characters XML 1.0 cannot carry"""
+    return escape(XML_INVALID.sub('', str(value)))
+
+
+class XmlFeed:
+    extension = 'xml'
+    
+    def header(self):
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<products>\n'
+    
+    def rows(self, records):
+        return ''.join(
+            '<product>' + ''.join(f'<{c}>{xml_text(record[c])}</{c}>' for c in COLUMNS) + '</product>\n'
+            for record in records
+        )
+    
+    def footer(self):
+        return '</products>\n'
+
+
+FORMATS = {feed.extension: feed for feed in (CsvFeed, JsonlFeed, XmlFeed)}
+
+
+def feed_text(feed, records):
+    """Formatted text of ``records`` in FLUSH_ROWS batches"""
+    yield feed.header()
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == FLUSH_ROWS:
+            yield feed.rows(batch)
+            batch = []
+    if batch:
+        yield feed.rows(batch)
+    yield feed.footer()
+
+
+def gzipped(chunks, level=6):
+    """gzip stream of the UTF-8 encoded ``chunks``"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_shard(path, format, first_id, last_id, base_url=None, chunk_size=None):
+    """Write one gzipped shard; returns (rows, bytes written)
+    
+    The shard is written next to ``path`` and renamed over it when
+    complete, so a reader never sees a truncated file.
+    """
+    counted = [0]
+    
+    def counting(records):
+        for record in records:
+            counted[0] += 1
+            yield record
+    
+    records = counting(feed_rows(first_id, last_id, base_url, chunk_size))
+    written = 0
+    partial = f'{path}.tmp'
+    try:
+        with open(partial, 'wb') as f:
+            for data in gzipped(feed_text(FORMATS[format](), records)):
+                f.write(data)
+                written += len(data)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return counted[0], written
+
+
+def feed_token(channel):
+    """``?token=`` value letting ``channel`` pull the feed endpoint"""
+    return signing.Signer(salt=feed_settings()['SALT']).sign(channel)
+
+
+def token_channel(token):
+    """Channel named by a valid token, else None"""
+    try:
+        return signing.Signer(salt=feed_settings()['SALT']).unsign(token)
+    except signing.BadSignature:
+        return None
+
+
+@require_safe
+def product_feed(request, format):
+    """The gzipped feed, or shard ``?shard=`` of ``?shards=``, streamed as it is read"""
+    if format not in FORMATS or token_channel(request.GET.get('token', '')) is None:
+        raise Http404('No such feed')
+    try:
+        shards = int(request.GET.get('shards', 1))
+        shard = int(request.GET.get('shard', 0))
+    except ValueError:
+        return HttpResponseBadRequest('shard and shards must be integers')
+    if not 0 <= shard < shards <= feed_settings()['MAX_SHARDS']:
+        return HttpResponseBadRequest('shard must be in [0, shards)')
+    first_id, last_id = shard_bounds(shards)[shard] if shards > 1 else (None, None)
+    records = feed_rows(first_id, last_id, base_url=request.build_absolute_uri('/'))
+    feed = FORMATS[format]()
+    response = StreamingHttpResponse(
+        streamed(request, gzipped(feed_text(feed, records))), content_type='application/gzip'
+    )
+    name = f'products-{shard}-of-{shards}' if shards > 1 else 'products'
+    response['Content-Disposition'] = f'attachment; filename="{name}.{format}.gz"'
+    return response
@@ -0,0 +1,163 @@
+import http.client
+import importlib.util
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from products.models import Product
+
+SERVERS = {
+    # name: (module that must be importable, command line)
+    'uvicorn': ('uvicorn', [
+        '-m', 'uvicorn', 'ecommerce.asgi:application',
+        '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}',
+        '--no-access-log', '--log-level', 'warning',
+    ]),
+    'wsgi': ('gunicorn', [
+        '-m', 'gunicorn', 'ecommerce.wsgi:application',
+        '--bind', '127.0.0.1:{port}', '--workers', '{workers}',
+        '--threads', '{threads}', '--log-level', 'warning',
+    ]),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Compare catalog throughput and p99 latency under uvicorn (ASGI) and gunicorn (WSGI)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Paths to request (default: the catalog and a product page)')
+        parser.add_argument('--server', choices=sorted(SERVERS), action='append',
+                            help='Server to benchmark; repeat for several (default: all)')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per server')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Server worker processes')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker')
+        parser.add_argument('--warmup', type=int, default=50, help='Untimed requests before measuring')
+        parser.add_argument('--cached', action='store_true',
+                            help='Let anonymous pages hit the page cache (default: bust it per request)')
+    
+    def handle(self, *args, **options):
+        if settings.DATABASES['default']['ENGINE'].endswith('sqlite3') and \
+                settings.DATABASES['default']['NAME'] == ':memory:':
+            raise CommandError('The servers run in separate processes; use a database they can share.')
+        paths = options['paths'] or self.default_paths()
+        servers = options['server'] or sorted(SERVERS)
+        for name in servers:
+            if importlib.util.find_spec(SERVERS[name][0]) is None:
+                raise CommandError(f'{SERVERS[name][0]} is not installed; pip install {SERVERS[name][0]}')
+        
+        self.stdout.write(
+            f'{options["requests"]} requests per server over {options["concurrency"]} connections, '
+            f'{options["workers"]} workers, paths: {", ".join(paths)}'
+        )
+        for name in servers:
+            port = free_port()
+            process = self.start(name, port, options)
+            try:
+                self.wait_until_ready(process, port, paths[0])
+                self.run_load(port, paths, options['warmup'], options['concurrency'], options['cached'])
+                timings, errors, elapsed = self.run_load(
+                    port, paths, options['requests'], options['concurrency'], options['cached']
+                )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            self.report(name, timings, errors, elapsed)
+    
+    def default_paths(self):
+        paths = [reverse('product_list')]
+        product = Product.objects.filter(is_active=True).order_by('pk').first()
+        if product is not None:
+            paths.append(reverse('product_detail', args=[product.slug]))
+        return paths
+    
+    def start(self, name, port, options):
+        values = {'port': port, 'workers': options['workers'], 'threads': options['threads']}
+        command = [sys.executable] + [arg.format(**values) for arg in SERVERS[name][1]]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')}
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+    
+    def wait_until_ready(self, process, port, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with status {process.returncode}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', path)
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server on port {port} did not answer within {timeout}s')
+    
+    def run_load(self, port, paths, requests, concurrency, cached):
+        """Issue ``requests`` GETs over keep-alive connections; returns (timings, errors, elapsed)"""
+        counter = itertools.count()
+        lock = threading.Lock()
+        timings = []
+        errors = []
+        
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            try:
+                while True:
+                    with lock:
+                        n = next(counter)
+                    if n >= requests:
+                        return
+                    path = paths[n % len(paths)]
+                    if not cached:
+                        path += f'{"&" if "?" in path else "?"}bench={n}'
+                    started = time.perf_counter()
+                    try:
+                        connection.request('GET', path)
+                        response = connection.getresponse()
+                        response.read()
+                        status = response.status
+                    except (OSError, http.client.HTTPException) as exc:
+                        connection.close()
+                        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                        status = type(exc).__name__
+                    duration = time.perf_counter() - started
+                    with lock:
+                        if status == 200:
+                            timings.append(duration)
+                        else:
+                            errors.append(status)
+            finally:
+                connection.close()
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(client) for _ in range(concurrency)]:
+                future.result()
+        return sorted(timings), errors, time.perf_counter() - started
+    
+    def report(self, name, timings, errors, elapsed):
+        if not timings:
+            raise CommandError(f'{name}: every request failed ({errors[:5]})')
+        
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+        
+        self.stdout.write(
+            f'{name:>8}: {len(timings) / elapsed:7.1f} req/s, '
+            f'p50 {percentile(0.50):7.1f} ms, p99 {percentile(0.99):7.1f} ms, '
+            f'{len(errors)} errors'
+        )
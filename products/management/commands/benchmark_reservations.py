@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from products.models import Brand, Category, Product, StockReservation
+from products.parallel import fork_pool
+from products.reservations import hold, release_reservations
+
+HOLDER_PREFIX = 'benchmark:'
+
+
+def place_holds(product_id, quantity, worker, workers, holds):
+    """Run in a worker process: every ``workers``-th hold, timed"""
+    results = []
+    try:
+        for i in range(worker, holds, workers):
+            started = time.perf_counter()
+            held = hold(f'{HOLDER_PREFIX}{i}', product_id, quantity)
+            results.append((held, time.perf_counter() - started))
+    finally:
+        connections.close_all()
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Hammer one SKU with concurrent stock holds and report throughput and oversell'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sku', help='Existing product to reserve (default: a throwaway product)')
+        parser.add_argument('--holds', type=int, default=5000, help='Number of carts placing a hold')
+        parser.add_argument('--workers', type=int, default=16, help='Worker processes, one connection each')
+        parser.add_argument('--quantity', type=int, default=1, help='Units per hold')
+        parser.add_argument('--stock', type=int, default=None,
+                            help='Stock of the throwaway product (default: enough for half the holds)')
+    
+    def handle(self, *args, **options):
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            raise CommandError('Run this against a real database; in-memory SQLite cannot take concurrent writers.')
+        
+        created = options['sku'] is None
+        product = self.throwaway_product(options) if created else Product.objects.get(sku=options['sku'])
+        workers = options['workers']
+        
+        try:
+            # Processes rather than threads, so the GIL doesn't cap the rate
+            with fork_pool(workers) as pool:
+                started = time.perf_counter()
+                chunks = [
+                    pool.submit(place_holds, product.pk, options['quantity'], worker, workers, options['holds'])
+                    for worker in range(workers)
+                ]
+                results = [result for chunk in chunks for result in chunk.result()]
+                elapsed = time.perf_counter() - started
+            self.report(product, results, elapsed)
+        finally:
+            release_reservations(StockReservation.objects.filter(holder__startswith=HOLDER_PREFIX))
+            if created:
+                product.delete()
+    
+    def throwaway_product(self, options):
+        stock = options['stock']
+        if stock is None:
+            stock = options['holds'] * options['quantity'] // 2
+        category, _ = Category.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+        brand, _ = Brand.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+        return Product.objects.create(
+            name='Reservation benchmark', slug=f'reservation-benchmark-{time.time_ns()}',
+            sku=f'BENCH-{time.time_ns()}', category=category, brand=brand,
+            description='Throwaway product for benchmark_reservations', price=1,
+            stock_quantity=stock, max_order_quantity=options['quantity'],
+        )
+    
+    def report(self, product, results, elapsed):
+        product.refresh_from_db(fields=['stock_quantity', 'reserved_quantity'])
+        rows = StockReservation.objects.filter(product=product, variant__isnull=True)
+        held_rows = rows.aggregate(total=Sum('quantity'))['total'] or 0
+        granted = sum(held for held, _ in results)
+        timings = sorted(duration for _, duration in results)
+        mean = sum(timings) / len(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        
+        self.stdout.write(
+            f'{len(results)} holds in {elapsed:.2f}s: {len(results) / elapsed:.0f} holds/s, '
+            f'mean {mean * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms'
+        )
+        self.stdout.write(
+            f'stock {product.stock_quantity}, granted {granted}, '
+            f'counter {product.reserved_quantity}, reservation rows {held_rows}'
+        )
+        if product.reserved_quantity > product.stock_quantity or product.reserved_quantity != held_rows:
+            raise CommandError('Reservation counter out of step: stock was oversold or units leaked.')
+        self.stdout.write(self.style.SUCCESS('No oversell; counter matches reservation rows.'))
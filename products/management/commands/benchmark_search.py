@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from products.models import Product
+from products.search_index import ProductSearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Compare the in-process search index against the icontains query path'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', help='Queries to run (default: sampled from the catalog)')
+        parser.add_argument('--sample', type=int, default=20, help='Number of queries to sample')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query')
+        parser.add_argument('--seed', type=int, default=0)
+    
+    def handle(self, *args, **options):
+        index = ProductSearchIndex()
+        started = time.perf_counter()
+        docs = index.rebuild()
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f'Indexed {docs} products in {build_seconds:.2f}s '
+            f'({len(index.terms)} terms, {index.nbytes() / 1024 / 1024:.1f} MiB estimated)'
+        )
+        
+        queries = options['queries'] or self.sample_queries(index, options['sample'], options['seed'])
+        if not queries:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark: the catalog is empty.'))
+            return
+        
+        index_times, orm_times = [], []
+        for query in queries:
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                result = index.search(query)
+                index_times.append(time.perf_counter() - started)
+                
+                started = time.perf_counter()
+                matches = list(Product.objects.filter(
+                    Q(name__icontains=query) |
+                    Q(description__icontains=query) |
+                    Q(brand__name__icontains=query),
+                    is_active=True,
+                ).values_list('pk', flat=True))
+                orm_times.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'  {query!r}: index {len(result)} hits'
+                f'{f" (did you mean {result.suggestion!r})" if result.suggestion else ""}, '
+                f'icontains {len(matches)} hits'
+            )
+        
+        self.report('index', index_times)
+        self.report('icontains', orm_times)
+    
+    def sample_queries(self, index, count, seed):
+        """Random vocabulary terms, half of them with a letter dropped"""
+        rng = random.Random(seed)
+        terms = [t for t in index.terms if len(t) > 3]
+        rng.shuffle(terms)
+        queries = []
+        for term in terms[:count]:
+            if rng.random() < 0.5:
+                i = rng.randrange(len(term))
+                term = term[:i] + term[i + 1:]
+            queries.append(term)
+        return queries
+    
+    def report(self, label, timings):
+        timings = sorted(timings)
+        mean = sum(timings) / len(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{label:>10}: mean {mean * 1000:.3f} ms, p95 {p95 * 1000:.3f} ms over {len(timings)} runs'
+        ))
@@ -0,0 +1,105 @@
+import json
+import subprocess
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from products.view_benchmarks import (
+    BUDGETS_FILE, METRICS, budgets_from, check_budgets, load_budgets, run_suite, save_budgets, uncovered_urls,
+)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every products/accounts view on a generated catalog and enforce the checked-in budgets'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Size of the generated catalog')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per view')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE), help='Budget file to check against')
+        parser.add_argument('--update-budgets', action='store_true', help='Rewrite the budget file from this run')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Only enforce query budgets (time and memory vary by machine)')
+        parser.add_argument('--current-db', action='store_true',
+                            help='Run against the configured database instead of a fresh test database')
+        parser.add_argument('--force', action='store_true',
+                            help='Allow --current-db on a database whose name does not start with test_')
+    
+    def handle(self, *args, **options):
+        missing = uncovered_urls()
+        if missing:
+            raise CommandError(f'URLs without a benchmark case: {", ".join(missing)}')
+        
+        if options['current_db']:
+            name = str(connection.settings_dict['NAME'])
+            if not (name.startswith('test_') or connection.vendor == 'sqlite' and connection.is_in_memory_db()
+                    or options['force']):
+                raise CommandError(
+                    f'--current-db writes to {name!r}: it creates the benchmark shopper and rewrites '
+                    'their cart. Point it at a test database, or pass --force.'
+                )
+            results = run_suite(options['repeat'])
+        else:
+            results = self.run_in_test_database(options)
+        
+        for name, measured in results.items():
+            if 'skipped' in measured:
+                self.stdout.write(self.style.WARNING(f'  {name:<26} skipped: {measured["skipped"]}'))
+                continue
+            self.stdout.write(
+                f'  {name:<26} {measured["queries"]:>3} queries {measured["ms"]:>9.2f} ms {measured["kb"]:>7} KiB'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'commit': current_commit(),
+                    'dataset': {k: options[k] for k in ('products', 'users', 'seed')},
+                    'database': connection.vendor,
+                    'views': results,
+                }, f, indent=2, sort_keys=True)
+                f.write('\n')
+        
+        if options['update_budgets']:
+            save_budgets(budgets_from(results), options['budgets'])
+            self.stdout.write(self.style.SUCCESS(f'{connection.vendor} budgets written to {options["budgets"]}.'))
+            return
+        
+        budgets = load_budgets(options['budgets'])
+        if budgets is None:
+            raise CommandError(
+                f'{options["budgets"]} has no {connection.vendor} budgets; '
+                'record them by running with --update-budgets on this database.'
+            )
+        metrics = ('queries',) if options['queries_only'] else METRICS
+        failures = check_budgets(results, budgets, metrics)
+        if failures:
+            raise CommandError('Views over budget:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'All {len(results)} views within budget.'))
+    
+    def run_in_test_database(self, options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command(
+                'generate_catalog', products=options['products'], users=options['users'],
+                seed=options['seed'], workers=1, stdout=StringIO(),
+            )
+            return run_suite(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,35 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from products.recommender import build_index, index_directory, recommender_settings
+
+
+class Command(BaseCommand):
+    help = 'Build and publish the content-similarity index (TF-IDF vectors and top-k cosine neighbours)'
+    
+    def add_arguments(self, parser):
+        defaults = recommender_settings()
+        parser.add_argument('--dimensions', type=int, default=defaults['DIMENSIONS'],
+                            help='Hashed feature columns per product')
+        parser.add_argument('--neighbours', type=int, default=defaults['NEIGHBOURS'],
+                            help='Neighbours stored per product')
+        parser.add_argument('--block-rows', type=int, default=defaults['BLOCK_ROWS'])
+        parser.add_argument('--block-columns', type=int, default=defaults['BLOCK_COLUMNS'])
+        parser.add_argument('--workers', type=int, default=defaults['WORKERS'], help='Worker processes')
+    
+    def handle(self, *args, **options):
+        config = {
+            **recommender_settings(),
+            'DIMENSIONS': options['dimensions'],
+            'NEIGHBOURS': options['neighbours'],
+            'BLOCK_ROWS': options['block_rows'],
+            'BLOCK_COLUMNS': options['block_columns'],
+        }
+        try:
+            stats = build_index(config, workers=options['workers'])
+        except (ImproperlyConfigured, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {stats["products"]} products into {index_directory(config)}: '
+            f'vectors in {stats["vectors_s"]:.1f}s, neighbours in {stats["neighbours_s"]:.1f}s.'
+        ))
+        self.stdout.write('Run refresh_related_products --full to fold the new neighbours into related products.')
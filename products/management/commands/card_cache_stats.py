@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from products.cache import card_metrics
+
+
+class Command(BaseCommand):
+    help = 'Show hit ratio of the rendered product card cache'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after reporting')
+    
+    def handle(self, *args, **options):
+        stats = card_metrics.snapshot()
+        ratio = f"{stats['hit_ratio']:.1%}" if stats['hit_ratio'] is not None else 'n/a'
+        self.stdout.write(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit ratio: {ratio}")
+        if options['reset']:
+            card_metrics.reset()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
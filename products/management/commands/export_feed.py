@@ -0,0 +1,74 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.feeds import FORMATS, feed_settings, feed_token, shard_bounds, write_shard
+from products.parallel import fork_pool
+
+
+def export(path, format, first_id, last_id, base_url, chunk_size):
+    """Run in a worker process: write one shard, timed"""
+    try:
+        started = time.perf_counter()
+        rows, written = write_shard(path, format, first_id, last_id, base_url, chunk_size)
+        return path, rows, written, time.perf_counter() - started
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Export active products as gzipped CSV, JSON Lines or XML feeds for shopping channels'
+    
+    def add_arguments(self, parser):
+        defaults = feed_settings()
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', default='feeds', help='Directory the .gz files are written to')
+        parser.add_argument('--shards', type=int, default=1, help='Files to split the feed into, by id range')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--chunk-size', type=int, default=defaults['CHUNK_SIZE'],
+                            help='Rows per server-side cursor fetch')
+        parser.add_argument('--base-url', default=defaults['BASE_URL'], help='Prefix of product and image links')
+        parser.add_argument('--token', metavar='CHANNEL',
+                            help="Print CHANNEL's ?token= for the product_feed endpoint and exit")
+    
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(feed_token(options['token']))
+            return
+        format, shards = options['format'], max(options['shards'], 1)
+        workers = min(options['workers'], shards)
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            workers = 1  # forked workers can't see an in-memory database
+        directory = Path(options['output'])
+        directory.mkdir(parents=True, exist_ok=True)
+        bounds = shard_bounds(shards) if shards > 1 else [(None, None)]
+        jobs = [
+            (str(directory / (f'products-{n}-of-{shards}.{format}.gz' if shards > 1 else f'products.{format}.gz')),
+             format, first_id, last_id, options['base_url'], options['chunk_size'])
+            for n, (first_id, last_id) in enumerate(bounds)
+        ]
+        
+        started = time.perf_counter()
+        results = self.run(jobs, workers)
+        elapsed = time.perf_counter() - started
+        for path, rows, written, seconds in results:
+            self.stdout.write(
+                f'  {path}: {rows:>10} rows, {written / 1024:>9.0f} KB, '
+                f'{rows / seconds if seconds else 0:>9.0f} rows/s'
+            )
+        total = sum(rows for _, rows, _, _ in results)
+        written = sum(written for _, _, written, _ in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {total} products to {len(results)} {format} file(s), {written / 1024 / 1024:.1f} MB '
+            f'gzipped, in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s with {workers} workers).'
+        ))
+    
+    def run(self, jobs, workers):
+        if workers <= 1:
+            return [export(*job) for job in jobs]
+        # Children must not share the parent's connection
+        with fork_pool(workers) as pool:
+            futures = [pool.submit(export, *job) for job in jobs]
+            return [future.result() for future in futures]
@@ -0,0 +1,82 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from products.parallel import fork_pool
+from products.synthetic import PHASES, CatalogPlan, chunks, copy_supported, finish, write_chunk
+
+
+def generate(plan, table, start, stop, method):
+    """Run in a worker process: write one chunk, timed"""
+    try:
+        started = time.perf_counter()
+        return table, write_chunk(plan, table, start, stop, method), time.perf_counter() - started
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalog (products, variants, images, reviews, users, carts) for load tests'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=16)
+        parser.add_argument('--brands', type=int, default=100)
+        parser.add_argument('--reviews', type=float, default=5, help='Mean reviews per product (heavy-tailed)')
+        parser.add_argument('--cart-ratio', type=float, default=0.3, help='Share of users with a cart')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Parent rows per insert chunk')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], default='auto',
+                            help='COPY (PostgreSQL) or bulk_create; auto picks COPY when available')
+    
+    def handle(self, *args, **options):
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if copy_supported() else 'bulk'
+        elif method == 'copy' and not copy_supported():
+            raise CommandError('COPY needs PostgreSQL with psycopg2.')
+        workers = options['workers']
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            workers = 1  # forked workers can't see an in-memory database
+        
+        plan = CatalogPlan(
+            seed=options['seed'], products=options['products'], users=options['users'],
+            categories=options['categories'], brands=options['brands'], reviews=options['reviews'],
+            cart_ratio=options['cart_ratio'], chunk_size=options['chunk_size'],
+        )
+        plan.prepare()
+        self.stdout.write(f'Generating with {method}, {workers} workers, seed {plan.seed}')
+        
+        rows, busy = Counter(), Counter()
+        started = time.perf_counter()
+        for phase in PHASES:
+            jobs = [(table, start, stop) for table in phase for start, stop in chunks(plan, table)]
+            for table, count, seconds in self.run(plan, jobs, method, workers):
+                rows[table] += count
+                busy[table] += seconds
+        finish_started = time.perf_counter()
+        finish(plan)
+        elapsed = time.perf_counter() - started
+        
+        for phase in PHASES:
+            for table in phase:
+                self.stdout.write(
+                    f'  {table:>10}: {rows[table]:>10} rows, '
+                    f'{rows[table] / busy[table] if busy[table] else 0:>9.0f} rows/s per worker'
+                )
+        self.stdout.write(f'  stats, search vectors and related products refreshed in {time.perf_counter() - finish_started:.1f}s')
+        total = sum(rows.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s overall).'
+        ))
+    
+    def run(self, plan, jobs, method, workers):
+        if workers <= 1:
+            return [generate(plan, table, start, stop, method) for table, start, stop in jobs]
+        with fork_pool(workers) as pool:
+            futures = [pool.submit(generate, plan, table, start, stop, method) for table, start, stop in jobs]
+            return [future.result() for future in futures]
@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from products.catalog_import import FORMATS, import_products
+from products.synthetic import copy_supported
+
+
+class Command(BaseCommand):
+    help = 'Import products from a supplier CSV or JSON Lines file (optionally gzipped), upserting by SKU'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per validation batch and upsert')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Validation processes')
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], default='auto',
+                            help='COPY and merge (PostgreSQL) or bulk_create; auto picks COPY when available')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count without writing')
+        parser.add_argument('--show-errors', type=int, default=20, help='Row errors to print')
+    
+    def handle(self, *args, **options):
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if copy_supported() else 'bulk'
+        elif method == 'copy' and not copy_supported():
+            raise CommandError('COPY needs PostgreSQL with psycopg2.')
+        workers = options['workers']
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            workers = 1  # forked workers would close the shared in-memory database
+        
+        started = time.perf_counter()
+        try:
+            report = import_products(
+                options['path'], options['format'], method, options['chunk_size'], workers, options['dry_run'],
+            )
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+        
+        for line, message in report.errors[:options['show_errors']]:
+            self.stderr.write(f'  line {line}: {message}')
+        if report.invalid > options['show_errors']:
+            self.stderr.write(f'  ... and {report.invalid - options["show_errors"]} more invalid rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Checked" if options["dry_run"] else "Imported"} {report.rows} rows with {method} in {elapsed:.1f}s '
+            f'({report.rows / elapsed if elapsed else 0:.0f} rows/s): {report.created} created, '
+            f'{report.updated} updated, {report.unchanged} unchanged, {report.invalid} invalid.'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from ecommerce.profiling import EXTENSIONS, hot_functions, profile_directory, profiles_by_view, trigger_token
+
+
+class Command(BaseCommand):
+    help = 'Summarize request profiles per view as the top-N hottest functions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Profile directory (default: REQUEST_PROFILING["DIRECTORY"])')
+        parser.add_argument('--top', type=int, default=15, help='Functions listed per view')
+        parser.add_argument('--view', help='Only report this view name')
+        parser.add_argument('--sort', choices=['self', 'total'], default='self',
+                            help='Rank by time spent in the function itself or including its callees')
+        parser.add_argument('--token', choices=sorted(EXTENSIONS),
+                            help='Print a trigger header value for this profiler and exit')
+    
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(trigger_token(options['token']))
+            return
+        
+        directory = options['directory'] or profile_directory()
+        grouped = profiles_by_view(directory)
+        if options['view']:
+            grouped = {key: paths for key, paths in grouped.items() if key[0] == options['view']}
+        if not grouped:
+            raise CommandError(f'No profiles in {directory}')
+        
+        for (view, profiler), paths in sorted(grouped.items()):
+            unit = 'samples' if profiler == 'sampling' else 'time'
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: {len(paths)} {profiler} profile(s), % of {unit}'
+            ))
+            self.stdout.write(f'{"self %":>8} {"total %":>8}  function')
+            for label, own, total in hot_functions(paths, profiler, options['top'], options['sort']):
+                self.stdout.write(f'{own:8.1f} {total:8.1f}  {label}')
+            self.stdout.write('')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized product rating stats from approved reviews'
+    
+    def handle(self, *args, **options):
+        updated = Product.objects.refresh_rating_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rating stats for {updated} products.')
+        )
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.related import refresh_related
+
+
+class Command(BaseCommand):
+    help = 'Recompute precomputed related products for products changed since the last run'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product, not just changed ones')
+    
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refreshed = refresh_related(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed related products for {refreshed} products in {time.perf_counter() - started:.1f}s.'
+        ))
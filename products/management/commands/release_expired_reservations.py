@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products.reservations import release_expired, reservation_settings
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations in batches (run from cron during sales)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows released per transaction')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or reservation_settings()['SWEEP_BATCH']
+        total = 0
+        while True:
+            released = release_expired(batch_size)
+            total += released
+            if released < batch_size:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Released {total} expired reservations.'))
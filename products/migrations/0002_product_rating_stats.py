@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:57
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductReview = apps.get_model("products", "ProductReview")
+    approved = (
+        ProductReview.objects.filter(product=OuterRef("pk"), is_approved=True)
+        .order_by()
+        .values("product")
+    )
+    Product.objects.update(
+        rating_sum=Coalesce(Subquery(approved.annotate(t=Sum("rating")).values("t")), 0),
+        rating_count=Coalesce(Subquery(approved.annotate(t=Count("id")).values("t")), 0),
+        rating_avg=Coalesce(
+            Subquery(approved.annotate(a=Avg("rating")).values("a")),
+            Value(Decimal("0.00")),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_avg",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=3
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
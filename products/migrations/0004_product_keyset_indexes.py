@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0003_product_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["is_active", "name", "id"], name="product_active_name_id"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["is_active", "price", "id"], name="product_active_price_id"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["is_active", "created_at", "id"], name="product_active_created_id"),
+        ),
+    ]
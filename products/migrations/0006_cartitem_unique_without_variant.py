@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Concurrent adds could create several variant-less lines for one product
+    CartItem = apps.get_model("products", "CartItem")
+    duplicates = (
+        CartItem.objects.filter(variant__isnull=True)
+        .values("cart_id", "product_id")
+        .annotate(lines=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        lines = CartItem.objects.filter(
+            cart_id=row["cart_id"], product_id=row["product_id"], variant__isnull=True
+        )
+        lines.exclude(pk=row["keep"]).delete()
+        lines.update(quantity=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0005_product_cache_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("variant__isnull", True)),
+                fields=("cart", "product"),
+                name="cartitem_unique_product_without_variant",
+            ),
+        ),
+    ]
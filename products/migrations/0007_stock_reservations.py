@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_cartitem_unique_without_variant"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reserved_quantity",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="reserved_quantity",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("holder", models.CharField(max_length=64)),
+                ("quantity", models.PositiveIntegerField()),
+                ("expires_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="products.product")),
+                ("variant", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="products.productvariant")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["expires_at"], name="reservation_expires_at")],
+                "constraints": [models.UniqueConstraint(condition=models.Q(("variant__isnull", True)), fields=("holder", "product"), name="reservation_unique_product"), models.UniqueConstraint(condition=models.Q(("variant__isnull", False)), fields=("holder", "variant"), name="reservation_unique_variant")],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_stock_reservations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedProduct",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.FloatField()),
+                ("computed_at", models.DateTimeField()),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="related_entries", to="products.product")),
+                ("related", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="related_to_entries", to="products.product")),
+            ],
+            options={
+                "ordering": ["product", "rank"],
+                "constraints": [models.UniqueConstraint(fields=("product", "rank"), name="related_product_rank")],
+            },
+        ),
+    ]
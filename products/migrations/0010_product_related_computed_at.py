@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:55
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def copy_computed_at(apps, schema_editor):
+    # Products that already have a stored list keep it until they change
+    Product = apps.get_model("products", "Product")
+    RelatedProduct = apps.get_model("products", "RelatedProduct")
+    latest = (
+        RelatedProduct.objects.filter(product=OuterRef("pk")).order_by()
+        .values("product").annotate(latest=Max("computed_at")).values("latest")
+    )
+    Product.objects.update(related_computed_at=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_category_brand_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="related_computed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copy_computed_at, migrations.RunPython.noop),
+    ]
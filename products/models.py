@@ -1,10 +1,18 @@
-from django.db import models
+from django.db import models, transaction, connections
+from django.db.models import F, Avg, Count, Sum, OuterRef, Subquery, Value, Case, When, ExpressionWrapper
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.urls import reverse
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import uuid
 
+from .cache import bump_catalog_version
+from .page_cache import purge_surrogate_keys
+
 User = get_user_model()
 
 class Category(models.Model):
@@ -15,6 +23,7 @@ class Category(models.Model):
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -32,6 +41,7 @@ class Brand(models.Model):
     website = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['name']
@@ -39,6 +49,117 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
 
+SEARCH_CONFIG = 'english'
+
+# Product columns feeding the full-text search vector, with their weights
+SEARCH_WEIGHTS = {
+    'name': 'A',
+    'brand': 'A',
+    'tags': 'B',
+    'short_description': 'C',
+    'description': 'D',
+}
+SEARCH_SOURCE_FIELDS = frozenset(SEARCH_WEIGHTS) | {'brand_id'}
+
+class ProductQuerySet(models.QuerySet):
+    """Catalog queries shared by views, admin and management commands"""
+    
+    @property
+    def supports_search_vector(self):
+        return connections[self.db].vendor == 'postgresql'
+    
+    def update(self, **kwargs):
+        # Bulk edits bump updated_at like save() does, so incremental
+        # consumers (search index, caches) see them.
+        content_changed = bool(set(kwargs) - set(Product.DB_MAINTAINED_FIELDS))
+        if content_changed and 'updated_at' not in kwargs:
+            kwargs['updated_at'] = timezone.now()
+        # Keep the search vector in step with bulk edits of searchable columns,
+        # computed from the new values within the same UPDATE.
+        if ('search_vector' not in kwargs and SEARCH_SOURCE_FIELDS & kwargs.keys()
+                and self.supports_search_vector):
+            kwargs['search_vector'] = search_vector_expression(kwargs)
+        rows = super().update(**kwargs)
+        if content_changed and rows:
+            bump_catalog_version()
+            purge_surrogate_keys(['product-list', 'product-detail'])
+        return rows
+    
+    def bump_cache_version(self):
+        """Invalidate cached renderings of these products (see products.cache)"""
+        return self.order_by().update(cache_version=F('cache_version') + 1)
+    
+    def refresh_search_vector(self):
+        """Recompute the stored search vector (PostgreSQL only)"""
+        if not self.supports_search_vector:
+            return 0
+        return self.order_by().update(search_vector=search_vector_expression())
+    
+    def with_main_image(self):
+        """Annotate each product with its main image path so listings skip per-card lookups"""
+        main_image = ProductImage.objects.filter(
+            product=OuterRef('pk'), is_main=True
+        ).order_by().values('image')[:1]
+        return self.annotate(main_image_path=Subquery(main_image))
+    
+    def related_to(self, product):
+        """Active products precomputed as related to ``product``, best first (see products.related)"""
+        return self.filter(
+            related_to_entries__product=product, is_active=True
+        ).order_by('related_to_entries__rank')
+    
+    def refresh_rating_stats(self):
+        """Recompute stored rating stats for every product in one UPDATE"""
+        approved = ProductReview.objects.filter(
+            product=OuterRef('pk'), is_approved=True
+        ).order_by().values('product')
+        rating_sum = approved.annotate(total=Sum('rating')).values('total')
+        rating_count = approved.annotate(total=Count('id')).values('total')
+        rating_avg = approved.annotate(avg=Avg('rating')).values('avg')
+        return self.order_by().update(
+            cache_version=F('cache_version') + 1,
+            rating_sum=Coalesce(Subquery(rating_sum), 0),
+            rating_count=Coalesce(Subquery(rating_count), 0),
+            rating_avg=Coalesce(Subquery(rating_avg), Value(Decimal('0.00'))),
+        )
+    
+    def apply_rating_delta(self, rating_delta, count_delta):
+        """Shift stored rating stats by a delta without reading them first"""
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        return self.order_by().update(
+            cache_version=F('cache_version') + 1,
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_avg=Coalesce(
+                Cast(new_sum, models.FloatField()) / NullIf(new_count, 0),
+                Value(0.0),
+            ),
+        )
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    
+    def get_queryset(self):
+        # The search vector is only read inside SQL; don't ship it to Python
+        return super().get_queryset().defer('search_vector')
+
+def search_vector_expression(overrides=None):
+    """Weighted tsvector over a product row, preferring values from overrides"""
+    overrides = overrides or {}
+    
+    def column(name):
+        value = overrides.get(name, F(name))
+        return value if hasattr(value, 'resolve_expression') else Value(value)
+    
+    brand = overrides.get('brand', overrides.get('brand_id', OuterRef('brand_id')))
+    brand_name = Subquery(Brand.objects.filter(pk=brand).order_by().values('name')[:1])
+    vector = None
+    for name, weight in SEARCH_WEIGHTS.items():
+        source = brand_name if name == 'brand' else column(name)
+        part = SearchVector(source, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
 class Product(models.Model):
     """Main product model with all Amazon-like features"""
     
@@ -64,6 +185,8 @@ class Product(models.Model):
     stock_quantity = models.PositiveIntegerField(default=0)
     min_stock_level = models.PositiveIntegerField(default=5)
     max_order_quantity = models.PositiveIntegerField(default=10)
+    # Units held by unexpired StockReservation rows (see products.reservations)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
     
     # Product Status
     is_active = models.BooleanField(default=True)
@@ -82,10 +205,26 @@ class Product(models.Model):
     free_shipping = models.BooleanField(default=False)
     shipping_class = models.CharField(max_length=50, default='standard')
     
+    # Denormalized review statistics (approved reviews only)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal('0.00'), editable=False)
+    
+    # Full-text search document, maintained in SQL on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # Bumped when related rows shown alongside the product change
+    cache_version = models.PositiveIntegerField(default=0, editable=False)
+    
+    # When products.related last scored this product, even if nothing qualified
+    related_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductManager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -94,11 +233,36 @@ class Product(models.Model):
             models.Index(fields=['brand', 'is_active']),
             models.Index(fields=['is_featured']),
             models.Index(fields=['is_bestseller']),
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Keyset pagination: one index range scan per catalog page and sort
+            models.Index(fields=['is_active', 'name', 'id'], name='product_active_name_id'),
+            models.Index(fields=['is_active', 'price', 'id'], name='product_active_price_id'),
+            models.Index(fields=['is_active', 'created_at', 'id'], name='product_active_created_id'),
         ]
     
+    # Columns maintained by SQL UPDATEs rather than by save()
+    DB_MAINTAINED_FIELDS = (
+        'rating_sum', 'rating_count', 'rating_avg', 'search_vector', 'cache_version', 'reserved_quantity',
+        'related_computed_at',
+    )
+    
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        # Never overwrite SQL-maintained columns from a possibly stale in-memory copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.DB_MAINTAINED_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in skipped and f.name not in skipped
+            ]
+        super().save(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or SEARCH_SOURCE_FIELDS & set(update_fields):
+            Product.objects.using(self._state.db).filter(pk=self.pk).refresh_search_vector()
+    
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'slug': self.slug})
     
@@ -110,6 +274,11 @@ class Product(models.Model):
     def is_low_stock(self):
         return self.stock_quantity <= self.min_stock_level
     
+    @property
+    def available_quantity(self):
+        """Stock not held by other carts"""
+        return max(self.stock_quantity - self.reserved_quantity, 0)
+    
     @property
     def discount_amount(self):
         if self.original_price and self.discount_percentage > 0:
@@ -118,18 +287,20 @@ class Product(models.Model):
     
     @property
     def average_rating(self):
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return reviews.aggregate(avg_rating=models.Avg('rating'))['avg_rating']
-        return 0
+        return self.rating_avg
     
     @property
     def review_count(self):
-        return self.reviews.filter(is_approved=True).count()
+        return self.rating_count
     
     def get_main_image(self):
-        main_image = self.images.filter(is_main=True).first()
-        return main_image.image.url if main_image else None
+        # Populated by ProductQuerySet.with_main_image(), or cached on first lookup
+        if not hasattr(self, 'main_image_path'):
+            main_image = self.images.filter(is_main=True).first()
+            self.main_image_path = main_image.image.name if main_image else None
+        if not self.main_image_path:
+            return None
+        return ProductImage._meta.get_field('image').storage.url(self.main_image_path)
 
 class ProductImage(models.Model):
     """Product images"""
@@ -149,6 +320,17 @@ class ProductImage(models.Model):
             ProductImage.objects.filter(product=self.product, is_main=True).update(is_main=False)
         super().save(*args, **kwargs)
 
+class ProductReviewQuerySet(models.QuerySet):
+    
+    def set_approval(self, is_approved):
+        """Bulk approve/reject reviews and refresh the affected product stats"""
+        with transaction.atomic():
+            product_ids = list(self.order_by().values_list('product_id', flat=True).distinct())
+            updated = self.update(is_approved=is_approved)
+            Product.objects.filter(pk__in=product_ids).refresh_rating_stats()
+        purge_surrogate_keys([f'product-{pk}' for pk in product_ids])
+        return updated
+
 class ProductReview(models.Model):
     """Product reviews and ratings"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -162,12 +344,27 @@ class ProductReview(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductReviewQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         unique_together = ['product', 'user']  # One review per user per product
     
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.product.name} ({self.rating}/5)"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not {'product', 'rating', 'is_approved'} & instance.get_deferred_fields():
+            instance._rating_snapshot = instance.rating_contribution()
+        return instance
+    
+    def rating_contribution(self):
+        """(product_id, rating) this review adds to the product stats, or None"""
+        if not self.is_approved:
+            return None
+        return (self.product_id, self.rating)
 
 class ProductVariant(models.Model):
     """Product variants (size, color, etc.)"""
@@ -176,6 +373,7 @@ class ProductVariant(models.Model):
     variant_type = models.CharField(max_length=50)  # e.g., "Color", "Size", "Storage"
     price_adjustment = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     stock_quantity = models.PositiveIntegerField(default=0)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
     sku_suffix = models.CharField(max_length=20, blank=True)
     is_active = models.BooleanField(default=True)
     
@@ -186,9 +384,75 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.variant_type}: {self.name}"
     
+    def save(self, *args, **kwargs):
+        # reserved_quantity is maintained by SQL UPDATEs, like Product's counters
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'reserved_quantity'
+                and f.attname not in self.get_deferred_fields()
+            ]
+        super().save(*args, **kwargs)
+    
     @property
     def final_price(self):
         return self.product.price + self.price_adjustment
+    
+    @property
+    def available_quantity(self):
+        return max(self.stock_quantity - self.reserved_quantity, 0)
+
+class StockReservation(models.Model):
+    """Units of a product or variant held for a cart until ``expires_at``"""
+    holder = models.CharField(max_length=64)  # e.g. "cart:42"
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_at'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['holder', 'product'],
+                condition=models.Q(variant__isnull=True),
+                name='reservation_unique_product',
+            ),
+            models.UniqueConstraint(
+                fields=['holder', 'variant'],
+                condition=models.Q(variant__isnull=False),
+                name='reservation_unique_variant',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.holder}: {self.quantity} x {self.variant or self.product}"
+
+CENT = Decimal('0.01')
+
+def money_field():
+    return models.DecimalField(max_digits=12, decimal_places=2)
+
+class CartQuerySet(models.QuerySet):
+    
+    def with_totals(self):
+        """Annotate item count and subtotal per cart (used by the admin changelist)"""
+        unit_price = F('items__product__price') + Coalesce(
+            F('items__variant__price_adjustment'), Value(Decimal('0.00'))
+        )
+        return self.annotate(
+            annotated_total_items=Coalesce(Sum('items__quantity'), 0),
+            annotated_total_price=Coalesce(
+                Sum(ExpressionWrapper(unit_price * F('items__quantity'), output_field=money_field())),
+                Value(Decimal('0.00')),
+                output_field=money_field(),
+            ),
+        )
 
 class Cart(models.Model):
     """Shopping cart"""
@@ -196,22 +460,217 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"Cart - {self.user.get_full_name()}"
     
     @property
     def total_items(self):
-        return self.items.aggregate(total=models.Sum('quantity'))['total'] or 0
+        if hasattr(self, 'annotated_total_items'):
+            return self.annotated_total_items
+        return self.items.totals()['item_count']
     
     @property
     def total_price(self):
-        total = Decimal('0.00')
-        for item in self.items.all():
-            total += item.total_price
-        return total
+        if hasattr(self, 'annotated_total_price'):
+            return self.annotated_total_price
+        return self.items.totals()['subtotal']
+    
+    def summary(self):
+        """Lines with per-line totals plus cart totals, from one query"""
+        return CartSummary(self.items.with_totals())
     
     def clear(self):
-        self.items.all().delete()
+        """Empty the cart and give back any stock it held"""
+        from .reservations import release_holder, reservations_enabled, user_holder  # imports this module
+        
+        with transaction.atomic():
+            self.items.all().delete()
+            if reservations_enabled():
+                release_holder(user_holder(self.user))
+
+class CartItemQuerySet(models.QuerySet):
+    """Cart line pricing computed in SQL, including variant price adjustments"""
+    
+    def with_totals(self):
+        unit_price = ExpressionWrapper(
+            F('product__price') + Coalesce(F('variant__price_adjustment'), Value(Decimal('0.00'))),
+            output_field=money_field(),
+        )
+        savings = Case(
+            When(
+                product__original_price__isnull=False,
+                product__discount_percentage__gt=0,
+                then=ExpressionWrapper(
+                    (F('product__original_price') - F('product__price')) * F('quantity'),
+                    output_field=money_field(),
+                ),
+            ),
+            default=Value(Decimal('0.00')),
+            output_field=money_field(),
+        )
+        return self.select_related('product', 'variant').defer('product__search_vector').annotate(
+            annotated_unit_price=unit_price,
+            annotated_total_price=ExpressionWrapper(unit_price * F('quantity'), output_field=money_field()),
+            annotated_savings=savings,
+        )
+    
+    def _totals_expressions(self):
+        unit_price = F('product__price') + Coalesce(F('variant__price_adjustment'), Value(Decimal('0.00')))
+        return {
+            'item_count': Sum('quantity'),
+            'subtotal': Sum(ExpressionWrapper(unit_price * F('quantity'), output_field=money_field())),
+        }
+    
+    @staticmethod
+    def _totals_result(result):
+        return {
+            'item_count': result['item_count'] or 0,
+            'subtotal': (result['subtotal'] or Decimal('0')).quantize(CENT),
+        }
+    
+    def totals(self):
+        """Item count and subtotal as a single aggregate query"""
+        return self._totals_result(self.order_by().aggregate(**self._totals_expressions()))
+    
+    async def atotals(self):
+        return self._totals_result(await self.order_by().aaggregate(**self._totals_expressions()))
+    
+    def add_for_user(self, user, product_id, quantity, variant_id=None):
+        """
+        Add ``quantity`` of a product (or variant) to the user's cart.
+        
+        One INSERT ... ON CONFLICT DO UPDATE increments the line in the
+        database, capped by max_order_quantity and stock, so concurrent
+        adds neither lose increments nor collide on the unique constraint.
+        Returns (item id, quantity in cart, limit), or None when the product
+        is inactive, missing or out of stock.
+        """
+        connection = connections[self.db]
+        sql, params = self._add_sql(connection.vendor, user.pk, product_id, quantity, variant_id)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            # No cart yet (possibly being created by a concurrent add), or
+            # the product is unavailable: make sure the cart exists and retry
+            Cart.objects.using(self.db).get_or_create(user=user)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        return tuple(row) if row is not None else None
+    
+    def _line_limit_sql(self, vendor, with_variant):
+        """Subquery capping an existing line at max_order_quantity and stock"""
+        least = 'LEAST' if vendor == 'postgresql' else 'MIN'
+        item = self.model._meta.db_table
+        line_join = f'JOIN {ProductVariant._meta.db_table} v ON v.id = {item}.variant_id' if with_variant else ''
+        stock = 'v.stock_quantity' if with_variant else 'p.stock_quantity'
+        return (
+            f'(SELECT {least}(p.max_order_quantity, {stock}) FROM {Product._meta.db_table} p {line_join} '
+            f'WHERE p.id = {item}.product_id)'
+        )
+    
+    @staticmethod
+    def _conflict_target(with_variant):
+        # Matches the two partial unique constraints on cart lines
+        return '(cart_id, product_id, variant_id)' if with_variant else '(cart_id, product_id) WHERE variant_id IS NULL'
+    
+    def _add_sql(self, vendor, user_id, product_id, quantity, variant_id):
+        least = 'LEAST' if vendor == 'postgresql' else 'MIN'
+        item = self.model._meta.db_table
+        cart = Cart._meta.db_table
+        product = Product._meta.db_table
+        variant = ProductVariant._meta.db_table
+        if variant_id is None:
+            join, stock, variant_col = '', 'p.stock_quantity', 'NULL'
+            join_params = []
+        else:
+            join = f'JOIN {variant} v ON v.id = %s AND v.product_id = p.id AND v.is_active'
+            stock, variant_col = 'v.stock_quantity', 'v.id'
+            join_params = [variant_id]
+        limit = f'{least}(p.max_order_quantity, {stock})'
+        line_limit = self._line_limit_sql(vendor, variant_id is not None)
+        sql = f"""
+            INSERT INTO {item} (cart_id, product_id, variant_id, quantity, added_at, updated_at)
+            SELECT c.id, p.id, {variant_col}, {least}(%s, {limit}), CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM {cart} c
+            JOIN {product} p ON p.id = %s AND p.is_active
+            {join}
+            WHERE c.user_id = %s AND {limit} > 0
+            ON CONFLICT {self._conflict_target(variant_id is not None)} DO UPDATE SET
+                quantity = {least}({item}.quantity + %s, {line_limit}),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING id, quantity, {line_limit}
+        """
+        return sql, [quantity, product_id, *join_params, user_id, quantity]
+    
+    def upsert_lines(self, cart_id, lines):
+        """
+        Insert ``(product_id, variant_id, quantity)`` lines into a cart.
+        
+        A line that a concurrent add_for_user() inserted first is
+        incremented instead, capped like add_for_user() caps it, so the
+        insert never fails on the unique constraints. One statement per
+        kind of line (with and without a variant). Returns
+        {(product_id, variant_id): (item id, quantity)}.
+        """
+        connection = connections[self.db]
+        least = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+        item = self.model._meta.db_table
+        stored = {}
+        for with_variant in (False, True):
+            group = [line for line in lines if (line[1] is not None) == with_variant]
+            if not group:
+                continue
+            values = ', '.join(['(%s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)'] * len(group))
+            sql = f"""
+                INSERT INTO {item} (cart_id, product_id, variant_id, quantity, added_at, updated_at)
+                VALUES {values}
+                ON CONFLICT {self._conflict_target(with_variant)} DO UPDATE SET
+                    quantity = {least}({item}.quantity + excluded.quantity, {self._line_limit_sql(connection.vendor, with_variant)}),
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING id, product_id, variant_id, quantity
+            """
+            params = [value for product_id, variant_id, quantity in group
+                      for value in (cart_id, product_id, variant_id, quantity)]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                for pk, product_id, variant_id, quantity in cursor.fetchall():
+                    stored[product_id, variant_id] = (pk, quantity)
+        return stored
+
+class CartSummary:
+    """Totals for a list of cart items annotated by CartItemQuerySet.with_totals()"""
+    
+    def __init__(self, items):
+        self.lines = list(items)
+        self.item_count = sum(item.quantity for item in self.lines)
+        self.subtotal = sum((item.annotated_total_price for item in self.lines), Decimal('0')).quantize(CENT)
+        self.savings = sum((item.annotated_savings for item in self.lines), Decimal('0')).quantize(CENT)
+    
+    def __iter__(self):
+        return iter(self.lines)
+    
+    def __len__(self):
+        return len(self.lines)
+    
+    def as_json(self):
+        return {
+            'cart_total_items': self.item_count,
+            'cart_total_price': str(self.subtotal),
+            'cart_total_savings': str(self.savings),
+            'items': [
+                {
+                    'item_id': item.id,
+                    'quantity': item.quantity,
+                    'unit_price': str(item.unit_price),
+                    'item_total_price': str(item.total_price),
+                }
+                for item in self.lines
+            ],
+        }
 
 class CartItem(models.Model):
     """Items in shopping cart"""
@@ -222,8 +681,19 @@ class CartItem(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartItemQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['cart', 'product', 'variant']
+        constraints = [
+            # unique_together can't catch duplicate NULL variants; this is also
+            # the conflict target for add_for_user() on variant-less lines
+            models.UniqueConstraint(
+                fields=['cart', 'product'],
+                condition=models.Q(variant__isnull=True),
+                name='cartitem_unique_product_without_variant',
+            ),
+        ]
     
     def __str__(self):
         variant_info = f" ({self.variant.name})" if self.variant else ""
@@ -231,6 +701,8 @@ class CartItem(models.Model):
     
     @property
     def unit_price(self):
+        if hasattr(self, 'annotated_unit_price'):
+            return self.annotated_unit_price.quantize(CENT)
         if self.variant:
             return self.variant.final_price
         return self.product.price
@@ -263,4 +735,22 @@ class WishlistItem(models.Model):
         unique_together = ['wishlist', 'product']
     
     def __str__(self):
-        return f"{self.product.name} - {self.wishlist.user.get_full_name()}"
\ No newline at end of file
+        return f"{self.product.name} - {self.wishlist.user.get_full_name()}"
+
+class RelatedProduct(models.Model):
+    """Ranked related products, precomputed offline by products.related"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to_entries')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            # Also the index the detail page reads a product's list through
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product} -> {self.related} (#{self.rank})"
\ No newline at end of file
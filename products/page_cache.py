@@ -0,0 +1,153 @@
+"""
+Full-response cache for anonymous catalog pages, purged by surrogate key.
+
+Views tag their responses with surrogate keys (``product-<id>``,
+``category-<id>``, ...). Each key has a version counter in the cache;
+a cached page remembers the versions it was rendered under and is
+discarded once any of them moves, so purging a key is a single
+increment no matter how many pages carry it. The same keys go out in
+the ``Surrogate-Key`` header so a fronting CDN can purge in step by
+listening to ``surrogate_keys_purged``.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+PAGE_KEY = 'products:page:{}'
+SURROGATE_VERSION_KEY = 'products:surrogate:{}'
+
+# Sent with ``keys`` after a purge, for CDN integrations
+surrogate_keys_purged = Signal()
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def add_surrogate_keys(response, keys):
+    existing = response.headers.get(SURROGATE_KEY_HEADER, '').split()
+    response.headers[SURROGATE_KEY_HEADER] = ' '.join(dict.fromkeys(existing + list(keys)))
+    return response
+
+
+def surrogate_key_versions(keys):
+    keys = list(keys)
+    versions = cache.get_many([SURROGATE_VERSION_KEY.format(k) for k in keys])
+    result = {}
+    missing = {}
+    seed = int(time.time() * 1000)
+    for key in keys:
+        version = versions.get(SURROGATE_VERSION_KEY.format(key))
+        if version is None:
+            version = missing[SURROGATE_VERSION_KEY.format(key)] = seed
+        result[key] = version
+    if missing:
+        cache.set_many(missing, None)
+    return result
+
+
+def purge_surrogate_keys(keys):
+    """Invalidate every cached page tagged with any of ``keys``"""
+    keys = list(dict.fromkeys(keys))
+    for key in keys:
+        try:
+            cache.incr(SURROGATE_VERSION_KEY.format(key))
+        except ValueError:
+            pass  # Never issued, so no page carries it
+    if keys:
+        surrogate_keys_purged.send(sender=None, keys=keys)
+
+
+def product_surrogate_keys(product):
+    return [
+        f'product-{product.pk}',
+        f'category-{product.category_id}',
+        f'brand-{product.brand_id}',
+    ]
+
+
+def _cacheable(request, user):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not user.is_authenticated
+        # Pending flash messages are rendered into the page
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _page_key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(digest)
+
+
+def _cached_response(request):
+    entry = cache.get(_page_key(request))
+    if entry is None or surrogate_key_versions(entry['versions']) != entry['versions']:
+        return None
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response.headers[header] = value
+    return response
+
+
+def _store_response(request, response):
+    timeout = page_cache_timeout()
+    patch_cache_control(response, public=True, max_age=0, s_maxage=timeout)
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        keys = response.headers.get(SURROGATE_KEY_HEADER, '').split()
+        cache.set(_page_key(request), {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': list(response.headers.items()),
+            'versions': surrogate_key_versions(keys),
+        }, timeout)
+    return response
+
+
+def _private_response(response):
+    del response.headers[SURROGATE_KEY_HEADER]
+    patch_cache_control(response, private=True)
+    return response
+
+
+def cache_anonymous_page(view):
+    """
+    Serve anonymous GETs of ``view`` from the page cache.
+    
+    Logged-in users always reach the view and get ``private`` responses.
+    Works for both sync and async views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if not _cacheable(request, user):
+                response = await view(request, *args, **kwargs)
+                return _private_response(response) if user.is_authenticated else response
+            response = await sync_to_async(_cached_response)(request)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                response = await sync_to_async(_store_response)(request, response)
+            return response
+        
+        return async_wrapper
+    
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request, request.user):
+            response = view(request, *args, **kwargs)
+            return _private_response(response) if request.user.is_authenticated else response
+        response = _cached_response(request)
+        if response is None:
+            response = _store_response(request, view(request, *args, **kwargs))
+        return response
+    
+    return wrapper
@@ -0,0 +1,154 @@
+import json
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import Q
+
+CURSOR_SALT = 'products.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset"""
+    
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, approximate_count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __len__(self):
+        return len(self.object_list)
+    
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def has_previous(self):
+        return self.previous_cursor is not None
+    
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a fixed ordering, tie-broken on ``id``.
+    
+    Each page is a single ``LIMIT per_page + 1`` range query seeking past
+    the last row of the previous page, so deep pages cost the same as the
+    first one. Cursors are signed, so clients can't forge arbitrary keys,
+    and name the ordering they were made for: replayed against another
+    sort they are rejected instead of seeking on the wrong keys.
+    """
+    
+    def __init__(self, queryset, ordering, per_page):
+        # ordering: e.g. ('-price',); all keys must share one direction
+        self.queryset = queryset
+        self.fields = [key.lstrip('-') for key in ordering]
+        if self.fields[-1] != 'id':
+            self.fields.append('id')
+        self.descending = ordering[0].startswith('-')
+        self.per_page = per_page
+        self.ordering_key = ','.join(self._order())
+    
+    def _order(self, reverse=False):
+        descending = self.descending != reverse
+        return [f'-{field}' if descending else field for field in self.fields]
+    
+    def _encode(self, obj, direction):
+        values = []
+        for field in self.fields:
+            # Model instances, or dicts from .values()
+            value = obj[field] if isinstance(obj, dict) else getattr(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return signing.dumps([direction, self.ordering_key] + values, salt=CURSOR_SALT, compress=True)
+    
+    def _decode(self, cursor):
+        try:
+            direction, ordering_key, *raw = signing.loads(cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if direction not in ('next', 'prev') or ordering_key != self.ordering_key or len(raw) != len(self.fields):
+            raise InvalidCursor(cursor)
+        model = self.queryset.model
+        try:
+            values = [model._meta.get_field(f).to_python(v) for f, v in zip(self.fields, raw)]
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        return direction, values
+    
+    def _seek(self, values, forward):
+        """Rows strictly after (forward) or before the given key values"""
+        after = forward != self.descending
+        op = 'gt' if after else 'lt'
+        # Lexicographic (a, b, id) > (va, vb, vid), with a leading bound on
+        # the first column so the planner gets an index range.
+        condition = Q(**{f'{self.fields[-1]}__{op}': values[-1]})
+        for field, value in zip(reversed(self.fields[:-1]), reversed(values[:-1])):
+            condition = Q(**{f'{field}__{op}': value}) | (Q(**{field: value}) & condition)
+        lead = 'gte' if after else 'lte'
+        return Q(**{f'{self.fields[0]}__{lead}': values[0]}) & condition
+    
+    def next_cursor(self, obj):
+        """Cursor for the rows after ``obj``"""
+        return self._encode(obj, 'next')
+    
+    def page_queryset(self, cursor=None):
+        """
+        (direction, seek values, queryset) for one page: up to ``per_page + 1``
+        rows in fetch order, so a caller can stream them and detect a next
+        page from the extra row.
+        """
+        direction, values = ('next', None)
+        if cursor:
+            direction, values = self._decode(cursor)
+        forward = direction == 'next'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        return direction, values, queryset.order_by(*self._order(reverse=not forward))[:self.per_page + 1]
+    
+    def get_page(self, cursor=None):
+        direction, values, queryset = self.page_queryset(cursor)
+        forward = direction == 'next'
+        rows = list(queryset)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        
+        if not rows:
+            return KeysetPage(rows)
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = True, has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self._encode(rows[-1], 'next') if has_next else None,
+            previous_cursor=self._encode(rows[0], 'prev') if has_previous else None,
+        )
+
+
+def approximate_count(queryset):
+    """
+    Row estimate from the PostgreSQL planner, or None elsewhere.
+    
+    Avoids the full COUNT(*) that Paginator issues on every request.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+    except (DatabaseError, ValueError):
+        return None
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan['Plan']['Plan Rows'])
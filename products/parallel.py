@@ -0,0 +1,23 @@
+"""
+Process pools for the catalog's bulk jobs.
+
+Imports, exports, catalog generation, the recommender build and the
+reservation benchmark all spread work over forked worker processes. A
+forked child inherits the parent's open database sockets. Two processes
+talking over one socket corrupt the session, so ``fork_pool()`` closes
+every connection first and each child opens its own on first use.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+@contextmanager
+def fork_pool(workers):
+    """A ProcessPoolExecutor of ``workers`` forked processes that share no connections with the parent"""
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        yield pool
@@ -0,0 +1,321 @@
+"""
+Content-similarity recommender over product text (NumPy, in requirements.txt).
+
+``build_index()`` turns each product's tags, short description, features
+and specifications into a TF-IDF weighted vector. Terms are signed-hashed
+into DIMENSIONS float32 columns and rows are L2-normalized. The matrix is
+written as a memory-mapped ``.npy`` file. The top NEIGHBOURS cosine
+neighbours of every row are then found with blocked matrix multiplies:
+BLOCK_ROWS queries against BLOCK_COLUMNS candidates at a time, with row
+blocks spread over a process pool. The pool shares the matrix through the
+page cache.
+
+Each build goes to a fresh directory under DIRECTORY. It is published by
+atomically rewriting DIRECTORY/CURRENT, so readers never see a partial
+index. ``similar_products()`` and ``recommend_for_products()`` map the
+neighbour files read-only. Each lookup is a binary search plus one row
+read, well under a millisecond.
+
+DIMENSIONS trades quality for cost. Hashed terms that share a column add
+spurious similarity, and a catalog has tens of thousands of distinct
+terms, so 128 columns let unrelated products look alike. 1024 keeps that
+noise small, at 8x the memory and multiply-adds of 128.
+
+At the defaults, 1M products need a 4 GB matrix and 240 MB of neighbours.
+The all-pairs pass is about 1e15 multiply-adds. 19k products take 11 s on
+one core, so 1M products take roughly 8 CPU-hours, split over WORKERS
+processes. If NumPy is missing anyway, the lookups return nothing and the
+build raises ImproperlyConfigured, which build_recommender reports.
+"""
+import hashlib
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import Product
+from .parallel import fork_pool
+from .search_index import parse_tags, tokenize
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+DEFAULTS = {
+    'DIRECTORY': 'recommender',
+    'DIMENSIONS': 1024,
+    'NEIGHBOURS': 20,
+    'BLOCK_ROWS': 512,          # queries per matrix multiply
+    # Candidates per matrix multiply. A worker holds BLOCK_ROWS x this x 12
+    # bytes at once: float32 scores and argpartition's int64 indices
+    'BLOCK_COLUMNS': 16384,
+    'WORKERS': os.cpu_count(),
+    'CHUNK_SIZE': 5000,
+    'RELOAD_INTERVAL': 30,      # seconds between checks for a newly published build
+    'KEEP_BUILDS': 2,           # the previous one may still be mapped by readers
+}
+# Tags say most about what a product is; descriptions least
+FIELD_WEIGHTS = {'tags': 3.0, 'features': 1.5, 'specifications': 1.5, 'short_description': 1.0}
+FIELDS = ('id', 'tags', 'short_description', 'features', 'specifications')
+
+
+def recommender_settings():
+    return {**DEFAULTS, **getattr(settings, 'RECOMMENDER', {})}
+
+
+def index_directory(config=None):
+    return Path(settings.BASE_DIR) / (config or recommender_settings())['DIRECTORY']
+
+
+def document_terms(tags, short_description, features, specifications):
+    """Field-weighted term counts for one product"""
+    terms = Counter()
+    for tag in parse_tags(tags):
+        terms['tag:' + tag] += FIELD_WEIGHTS['tags']
+    for token in tokenize(short_description):
+        terms[token] += FIELD_WEIGHTS['short_description']
+    for feature in features if isinstance(features, list) else ():
+        for token in tokenize(str(feature)):
+            terms[token] += FIELD_WEIGHTS['features']
+    for key, value in specifications.items() if isinstance(specifications, dict) else ():
+        terms[f'spec:{str(key).lower()}={str(value).lower()}'] += FIELD_WEIGHTS['specifications']
+    return terms
+
+
+def hashed(term, dimensions):
+    """(column, sign) of a term; stable across processes, unlike hash()"""
+    value = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), 'little')
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+def _documents(config):
+    rows = Product.objects.filter(is_active=True).order_by('id').values_list(*FIELDS)
+    for pk, *fields in rows.iterator(chunk_size=config['CHUNK_SIZE']):
+        yield pk, document_terms(*fields)
+
+
+def write_vectors(directory, config):
+    """Pass over the catalog twice: document frequencies, then hashed TF-IDF rows"""
+    ids, document_frequency = [], Counter()
+    for pk, terms in _documents(config):
+        ids.append(pk)
+        document_frequency.update(terms.keys())
+    if not ids:
+        raise ValueError('No active products to index.')
+    ids = np.array(ids, dtype=np.int64)
+    np.save(directory / 'ids.npy', ids)
+    count, dimensions = len(ids), config['DIMENSIONS']
+    idf = {term: math.log((count + 1) / (df + 1)) + 1 for term, df in document_frequency.items()}
+    columns = {}
+    
+    vectors = np.lib.format.open_memmap(directory / 'vectors.npy', 'w+', np.float32, (count, dimensions))
+    chunk_rows, chunk_columns, chunk_values = [], [], []
+    
+    def flush():
+        if chunk_rows:
+            np.add.at(vectors, (np.array(chunk_rows), np.array(chunk_columns)), np.array(chunk_values))
+            chunk_rows.clear()
+            chunk_columns.clear()
+            chunk_values.clear()
+    
+    for pk, terms in _documents(config):
+        row = int(np.searchsorted(ids, pk))
+        if row == count or ids[row] != pk:
+            continue  # created between the passes; picked up by the next build
+        for term, weight in terms.items():
+            if term not in idf:
+                continue
+            if term not in columns:
+                columns[term] = hashed(term, dimensions)
+            column, sign = columns[term]
+            chunk_rows.append(row)
+            chunk_columns.append(column)
+            chunk_values.append(sign * weight * idf[term])
+        if len(chunk_rows) >= config['CHUNK_SIZE'] * 32:
+            flush()
+    flush()
+    
+    for start in range(0, count, config['CHUNK_SIZE']):
+        block = vectors[start:start + config['CHUNK_SIZE']]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=block, where=norms > 0)
+    vectors.flush()
+    return count
+
+
+def neighbour_block(directory, start, stop, k, block_columns):
+    """Run in a worker process: top-``k`` cosine neighbours of rows [start, stop)"""
+    vectors = np.load(directory / 'vectors.npy', mmap_mode='r')
+    count = len(vectors)
+    queries = np.asarray(vectors[start:stop])
+    best_scores = np.full((stop - start, k), -np.inf, dtype=np.float32)
+    best_rows = np.full((stop - start, k), -1, dtype=np.int64)
+    for column in range(0, count, block_columns):
+        end = min(column + block_columns, count)
+        tile = queries @ vectors[column:end].T
+        # A product is not its own neighbour
+        first, last = max(start, column), min(stop, end)
+        if first < last:
+            diagonal = np.arange(first, last)
+            tile[diagonal - start, diagonal - column] = -np.inf
+        # Cut the tile to its own top k before merging, so the merge (and the
+        # row ids) only ever cover 2k columns
+        if end - column > k:
+            np.negative(tile, out=tile)
+            part = np.argpartition(tile, k - 1, axis=1)[:, :k]
+            tile = -np.take_along_axis(tile, part, axis=1)
+            tile_rows = part + column
+        else:
+            tile_rows = np.broadcast_to(np.arange(column, end), tile.shape)
+        scores = np.concatenate([best_scores, tile], axis=1)
+        rows = np.concatenate([best_rows, tile_rows], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_rows = np.take_along_axis(rows, top, axis=1)
+    
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+    ids = np.load(directory / 'ids.npy', mmap_mode='r')
+    found = (best_rows >= 0) & (best_scores > 0)
+    neighbours = np.load(directory / 'neighbours.npy', mmap_mode='r+')
+    neighbours[start:stop] = np.where(found, ids[np.maximum(best_rows, 0)], -1)
+    scores = np.load(directory / 'scores.npy', mmap_mode='r+')
+    scores[start:stop] = np.where(found, best_scores, 0)
+    neighbours.flush()
+    scores.flush()
+    return stop - start
+
+
+def write_neighbours(directory, count, config, workers):
+    k = max(min(config['NEIGHBOURS'], count - 1), 1)
+    np.lib.format.open_memmap(directory / 'neighbours.npy', 'w+', np.int64, (count, k)).flush()
+    np.lib.format.open_memmap(directory / 'scores.npy', 'w+', np.float32, (count, k)).flush()
+    blocks = [
+        (directory, start, min(start + config['BLOCK_ROWS'], count), k, config['BLOCK_COLUMNS'])
+        for start in range(0, count, config['BLOCK_ROWS'])
+    ]
+    if workers <= 1:
+        for block in blocks:
+            neighbour_block(*block)
+        return
+    with fork_pool(workers) as pool:
+        for future in [pool.submit(neighbour_block, *block) for block in blocks]:
+            future.result()
+
+
+def publish(root, name, keep):
+    """Point CURRENT at build ``name`` and delete all but the newest ``keep`` builds"""
+    pointer = root / 'CURRENT.tmp'
+    pointer.write_text(name)
+    os.replace(pointer, root / 'CURRENT')
+    builds = sorted(path for path in root.iterdir() if path.is_dir() and path.name.startswith('build-'))
+    for path in builds[:-keep]:
+        if path.name != name:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_index(config=None, workers=None):
+    """Build and publish a new index; returns {'products', 'vectors_s', 'neighbours_s'}"""
+    if np is None:
+        raise ImproperlyConfigured('The recommender needs NumPy; pip install -r requirements.txt')
+    config = config or recommender_settings()
+    root = index_directory(config)
+    # Sorts by time, so publish() knows which builds are oldest
+    name = f'build-{time.strftime("%Y%m%dT%H%M%S")}-{time.time_ns() % 10**9:09d}'
+    directory = root / name
+    directory.mkdir(parents=True)
+    try:
+        started = time.perf_counter()
+        count = write_vectors(directory, config)
+        vectors_done = time.perf_counter()
+        write_neighbours(directory, count, config, workers or config['WORKERS'])
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    publish(root, name, config['KEEP_BUILDS'])
+    reset_index()
+    return {
+        'products': count,
+        'vectors_s': vectors_done - started,
+        'neighbours_s': time.perf_counter() - vectors_done,
+    }
+
+
+class NeighbourIndex:
+    """Read-only view of one published build"""
+    
+    def __init__(self, directory):
+        self.ids = np.load(directory / 'ids.npy', mmap_mode='r')
+        self.neighbours = np.load(directory / 'neighbours.npy', mmap_mode='r')
+        self.scores = np.load(directory / 'scores.npy', mmap_mode='r')
+    
+    def neighbours_of(self, product_id):
+        """[(product id, cosine)] best first; empty for products not in the build"""
+        row = int(np.searchsorted(self.ids, product_id))
+        if row == len(self.ids) or self.ids[row] != product_id:
+            return []
+        return [
+            (int(pk), float(score))
+            for pk, score in zip(self.neighbours[row], self.scores[row]) if pk >= 0
+        ]
+
+
+_loaded = {'name': None, 'index': None, 'checked': -math.inf}
+_lock = threading.Lock()
+
+
+def current_index():
+    """The published index, re-read when CURRENT changes; None if none is built"""
+    if np is None:
+        return None
+    config = recommender_settings()
+    now = time.monotonic()
+    if now - _loaded['checked'] < config['RELOAD_INTERVAL']:
+        return _loaded['index']
+    with _lock:
+        root = index_directory(config)
+        try:
+            name = (root / 'CURRENT').read_text().strip()
+        except FileNotFoundError:
+            name = None
+        if name != _loaded['name']:
+            _loaded['index'] = NeighbourIndex(root / name) if name else None
+            _loaded['name'] = name
+        _loaded['checked'] = now
+    return _loaded['index']
+
+
+def reset_index():
+    """Forget the loaded build (tests, or after deleting DIRECTORY)"""
+    with _lock:
+        _loaded.update(name=None, index=None, checked=-math.inf)
+
+
+def similar_products(product_id, limit=6):
+    """Ids of the products whose text is most like this one's, best first"""
+    index = current_index()
+    if index is None:
+        return []
+    return [pk for pk, _ in index.neighbours_of(product_id)[:limit]]
+
+
+def recommend_for_products(product_ids, limit=6):
+    """Ids most similar to a set of products (e.g. a cart), excluding the set itself"""
+    index = current_index()
+    if index is None:
+        return []
+    product_ids = set(product_ids)
+    totals = defaultdict(float)
+    for product_id in product_ids:
+        for pk, score in index.neighbours_of(product_id):
+            if pk not in product_ids:
+                totals[pk] += score
+    return sorted(totals, key=lambda pk: (-totals[pk], pk))[:limit]
@@ -0,0 +1,249 @@
+"""
+Precomputed related products.
+
+``refresh_related()`` scores candidates for each active product and
+stores the best KEEP as RelatedProduct rows. product_detail then reads
+a ranked list with one indexed query, instead of scanning the category
+on every page view.
+
+Candidates for a product come from five sources:
+
+* the CANDIDATES nearest in price within its category;
+* the CANDIDATES nearest in price within its brand;
+* products sharing one of its tags;
+* products that appear with it in carts and wishlists;
+* its nearest neighbours in the recommender index, when one is built.
+
+Each candidate is scored as a weighted sum of shared category, shared
+brand, tag overlap (Jaccard), price proximity, co-occurrence count and
+recommender cosine similarity.
+
+Runs are incremental. Only products whose ``updated_at`` moved past
+their ``related_computed_at`` are rescored, along with the products whose
+lists point at them and the products they are candidates for.
+"""
+import math
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CartItem, Product, RelatedProduct, WishlistItem
+from .page_cache import purge_surrogate_keys
+from .recommender import current_index
+from .search_index import parse_tags
+
+DEFAULTS = {
+    'KEEP': 12,                 # rows per product; the page shows 6, the rest cover deactivations
+    'CANDIDATES': 40,           # nearest-priced products taken from the category and from the brand
+    'MAX_TAG_PRODUCTS': 500,    # tags on more products than this propose no candidates
+    'MAX_BASKET': 50,           # larger carts and wishlists are ignored for co-occurrence
+    'CHUNK_SIZE': 1000,
+    'WEIGHTS': {'category': 3.0, 'brand': 1.5, 'tags': 2.0, 'price': 1.0, 'co_occurrence': 4.0, 'content': 2.0},
+}
+
+
+def related_settings():
+    config = {**DEFAULTS, **getattr(settings, 'RELATED_PRODUCTS', {})}
+    config['WEIGHTS'] = {**DEFAULTS['WEIGHTS'], **config['WEIGHTS']}
+    return config
+
+
+def nearest(group, price, limit):
+    """Up to ``limit`` ids from ``group`` ((prices, ids), sorted) closest to ``price``"""
+    prices, ids = group
+    hi = bisect_left(prices, price)
+    lo = hi - 1
+    found = []
+    while len(found) < limit and (lo >= 0 or hi < len(prices)):
+        if hi >= len(prices) or (lo >= 0 and price - prices[lo] <= prices[hi] - price):
+            found.append(ids[lo])
+            lo -= 1
+        else:
+            found.append(ids[hi])
+            hi += 1
+    return found
+
+
+def _baskets(model, column, targets, chunk_size):
+    """{basket id: {product id}} for every basket of ``model``, or only those holding one of ``targets``"""
+    rows = model.objects.order_by().values_list(column, 'product_id')
+    if targets is None:
+        queries = [rows]
+    else:
+        targets = list(targets)
+        ids = set()
+        for start in range(0, len(targets), chunk_size):
+            ids.update(
+                model.objects.filter(product_id__in=targets[start:start + chunk_size])
+                .order_by().values_list(column, flat=True)
+            )
+        ids = sorted(ids)
+        queries = [
+            rows.filter(**{f'{column}__in': ids[start:start + chunk_size]})
+            for start in range(0, len(ids), chunk_size)
+        ]
+    baskets = defaultdict(set)
+    for query in queries:
+        for basket, product in query.iterator():
+            baskets[basket].add(product)
+    return baskets
+
+
+def co_occurrence(targets, max_basket, chunk_size, full=False):
+    """{product id: Counter(other id: carts and wishlists holding both)} for ``targets``
+    
+    Only baskets holding a target are read, unless ``full`` says the
+    targets are the whole catalog anyway.
+    """
+    restrict = None if full else targets
+    baskets = [
+        *_baskets(CartItem, 'cart_id', restrict, chunk_size).values(),
+        *_baskets(WishlistItem, 'wishlist_id', restrict, chunk_size).values(),
+    ]
+    counts = defaultdict(Counter)
+    for items in baskets:
+        if not 1 < len(items) <= max_basket:
+            continue
+        for product in items & targets:
+            counts[product].update(items - {product})
+    return counts
+
+
+class Catalog:
+    """Scoring features of every active product, grouped for candidate lookups"""
+    
+    def __init__(self, config, content_index=None):
+        self.config = config
+        self.content_index = content_index
+        self.features = {}
+        by_category, by_brand, by_tag = defaultdict(list), defaultdict(list), defaultdict(list)
+        rows = Product.objects.filter(is_active=True).order_by().values_list(
+            'id', 'category_id', 'brand_id', 'tags', 'price'
+        )
+        for pk, category, brand, tags, price in rows.iterator(chunk_size=config['CHUNK_SIZE']):
+            tags = parse_tags(tags)
+            price = float(price)
+            self.features[pk] = (category, brand, tags, price)
+            by_category[category].append((price, pk))
+            by_brand[brand].append((price, pk))
+            for tag in tags:
+                by_tag[tag].append(pk)
+        self.by_category = {key: self._sorted(group) for key, group in by_category.items()}
+        self.by_brand = {key: self._sorted(group) for key, group in by_brand.items()}
+        self.by_tag = {tag: ids for tag, ids in by_tag.items() if len(ids) <= config['MAX_TAG_PRODUCTS']}
+    
+    @staticmethod
+    def _sorted(group):
+        group.sort()
+        return [price for price, _ in group], [pk for _, pk in group]
+    
+    def content_scores(self, pk):
+        if self.content_index is None:
+            return {}
+        return dict(self.content_index.neighbours_of(pk))
+    
+    def candidates(self, pk, co_counts, content):
+        category, brand, tags, price = self.features[pk]
+        limit = self.config['CANDIDATES'] + 1  # the product itself is among the nearest
+        found = set(nearest(self.by_category[category], price, limit))
+        found.update(nearest(self.by_brand[brand], price, limit))
+        for tag in tags:
+            found.update(self.by_tag.get(tag, ()))
+        found.update(other for other in co_counts if other in self.features)
+        found.update(other for other in content if other in self.features)
+        found.discard(pk)
+        return found
+    
+    def score(self, pk, other, co_count, similarity=0.0):
+        weights = self.config['WEIGHTS']
+        category, brand, tags, price = self.features[pk]
+        other_category, other_brand, other_tags, other_price = self.features[other]
+        score = 0.0
+        if category == other_category:
+            score += weights['category']
+        if brand == other_brand:
+            score += weights['brand']
+        if tags and other_tags:
+            score += weights['tags'] * len(tags & other_tags) / len(tags | other_tags)
+        if price > 0 and other_price > 0:
+            score += weights['price'] / (1 + abs(math.log(price / other_price)))
+        if co_count:
+            score += weights['co_occurrence'] * co_count / (co_count + 2)
+        if similarity > 0:
+            score += weights['content'] * similarity
+        return score
+    
+    def ranked(self, pk, co_counts):
+        """[(score, related id)] best first, at most KEEP"""
+        content = self.content_scores(pk)
+        scored = [
+            (self.score(pk, other, co_counts.get(other, 0), content.get(other, 0.0)), other)
+            for other in self.candidates(pk, co_counts, content)
+        ]
+        scored.sort(key=lambda entry: (-entry[0], entry[1]))
+        return scored[:self.config['KEEP']]
+
+
+def stale_products():
+    """Ids of products changed since they were last scored, or active and never scored"""
+    return set(
+        Product.objects.order_by()
+        .filter(Q(related_computed_at__isnull=True, is_active=True) | Q(updated_at__gt=F('related_computed_at')))
+        .values_list('id', flat=True)
+    )
+
+
+def dependents(product_ids, chunk_size):
+    """Ids of products whose stored lists include any of ``product_ids``"""
+    product_ids = list(product_ids)
+    found = set()
+    for start in range(0, len(product_ids), chunk_size):
+        found.update(
+            RelatedProduct.objects.filter(related_id__in=product_ids[start:start + chunk_size])
+            .values_list('product_id', flat=True)
+        )
+    return found
+
+
+def refresh_related(full=False, config=None):
+    """Recompute stored related lists; returns the number of products refreshed"""
+    config = config or related_settings()
+    # Taken before reading, so edits made during the run are picked up by the next one
+    computed_at = timezone.now()
+    if full:
+        targets = set(Product.objects.values_list('id', flat=True))
+    else:
+        stale = stale_products()
+        targets = stale | dependents(stale, config['CHUNK_SIZE'])
+    if not targets:
+        return 0
+    
+    catalog = Catalog(config, current_index())
+    if not full:
+        # Candidacy is symmetric: a new or changed product belongs in the
+        # lists of its own candidates, which no stored row points to yet
+        stale &= catalog.features.keys()
+        stale_counts = co_occurrence(stale, config['MAX_BASKET'], config['CHUNK_SIZE'])
+        for pk in stale:
+            targets |= catalog.candidates(pk, stale_counts.get(pk, {}), catalog.content_scores(pk))
+    co_counts = co_occurrence(targets, config['MAX_BASKET'], config['CHUNK_SIZE'], full)
+    ordered = sorted(targets)
+    for start in range(0, len(ordered), config['CHUNK_SIZE']):
+        chunk = ordered[start:start + config['CHUNK_SIZE']]
+        rows = [
+            RelatedProduct(product_id=pk, related_id=other, rank=rank, score=round(score, 4),
+                           computed_at=computed_at)
+            for pk in chunk if pk in catalog.features
+            for rank, (score, other) in enumerate(catalog.ranked(pk, co_counts.get(pk, {})), 1)
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(rows, batch_size=config['CHUNK_SIZE'])
+            # Also marks products with no candidates, so they are not rescored every run
+            Product.objects.filter(pk__in=chunk).update(related_computed_at=computed_at)
+        purge_surrogate_keys([f'product-{pk}' for pk in chunk])
+    return len(targets)
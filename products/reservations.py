@@ -0,0 +1,233 @@
+"""
+Time-limited stock holds for carts during high-demand sales.
+
+``reserved_quantity`` on Product and ProductVariant always equals the sum
+of the StockReservation rows for that SKU, so availability is
+``stock_quantity - reserved_quantity``: one column, no scan. A hold is a
+conditional UPDATE of that counter plus an upsert of the holder's row in
+one short transaction, so a hot SKU serializes on its counter row only
+for the length of those statements and can never be oversold.
+
+Expired rows keep counting until they are swept, in bulk: when a hold on
+the SKU comes up short, at most every SWEEP_INTERVAL seconds from any
+hold, and from the ``release_expired_reservations`` command.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import CartItem, Product, ProductVariant, StockReservation
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TTL': 15 * 60,         # seconds a hold lasts after its last change
+    'SWEEP_INTERVAL': 30,   # seconds between opportunistic sweeps per process
+    'SWEEP_BATCH': 1000,    # expired rows released per sweep transaction
+}
+
+_last_sweep = 0.0
+
+
+def reservation_settings():
+    return {**DEFAULTS, **getattr(settings, 'STOCK_RESERVATIONS', {})}
+
+
+def reservations_enabled():
+    return reservation_settings()['ENABLED']
+
+
+def user_holder(user):
+    """Holder key for a user's cart"""
+    return f'user:{user.pk}'
+
+
+def _counter(product_id, variant_id):
+    if variant_id:
+        return ProductVariant.objects.filter(pk=variant_id)
+    return Product.objects.filter(pk=product_id)
+
+
+def _holds(holder, product_id, variant_id):
+    if variant_id:
+        return StockReservation.objects.filter(holder=holder, variant_id=variant_id)
+    return StockReservation.objects.filter(holder=holder, product_id=product_id, variant__isnull=True)
+
+
+def _take(counter, wanted, attempts=3):
+    """Reserve up to ``wanted`` more units on a counter row; returns units taken"""
+    for _ in range(attempts):
+        if wanted <= 0:
+            return 0
+        taken = counter.filter(stock_quantity__gte=F('reserved_quantity') + wanted).update(
+            reserved_quantity=F('reserved_quantity') + wanted
+        )
+        if taken:
+            return wanted
+        row = counter.values_list('stock_quantity', 'reserved_quantity').first()
+        if row is None:
+            return 0
+        wanted = min(wanted, row[0] - row[1])
+    return 0
+
+
+def _write_hold(existing, holder, product_id, variant_id, quantity, expires_at):
+    """Create, update or delete the holder's row; returns the row or None"""
+    if quantity == 0:
+        if existing:
+            existing.delete()
+        return None
+    if existing:
+        StockReservation.objects.filter(pk=existing.pk).update(quantity=quantity, expires_at=expires_at)
+        existing.quantity = quantity
+        return existing
+    return StockReservation.objects.create(
+        holder=holder, product_id=product_id, variant_id=variant_id,
+        quantity=quantity, expires_at=expires_at,
+    )
+
+
+def _hold(holder, product_id, variant_id, quantity, ttl):
+    existing = _holds(holder, product_id, variant_id).select_for_update().first()
+    held = existing.quantity if existing else 0
+    counter = _counter(product_id, variant_id)
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    
+    # The holder's own row is written first: concurrent holds on a hot SKU
+    # queue on the counter row, so it is locked last and only until commit.
+    reservation = _write_hold(existing, holder, product_id, variant_id, quantity, expires_at)
+    if quantity < held:
+        counter.update(reserved_quantity=F('reserved_quantity') - (held - quantity))
+    elif quantity > held:
+        wanted = quantity - held
+        taken = _take(counter, wanted)
+        if taken < wanted:
+            # Lapsed holds may be all that's in the way
+            release_expired(product_id=product_id, variant_id=variant_id)
+            taken += _take(counter, wanted - taken)
+        if taken < wanted:
+            _write_hold(reservation, holder, product_id, variant_id, held + taken, expires_at)
+            return held + taken
+    return quantity
+
+
+def hold(holder, product_id, quantity, variant_id=None, ttl=None):
+    """
+    Set the holder's reservation for a product (or variant) to ``quantity``.
+    
+    When fewer units are free, holds as many as it can. Returns the number
+    of units now held; a quantity of 0 releases the hold. Every call
+    restarts the TTL.
+    """
+    config = reservation_settings()
+    ttl = config['TTL'] if ttl is None else ttl
+    maybe_release_expired()
+    try:
+        with transaction.atomic():
+            return _hold(holder, product_id, variant_id, quantity, ttl)
+    except IntegrityError:
+        # The same holder raced us to create its row; it's there now
+        with transaction.atomic():
+            return _hold(holder, product_id, variant_id, quantity, ttl)
+
+
+def release(holder, product_id, variant_id=None):
+    return hold(holder, product_id, 0, variant_id)
+
+
+def held_quantities(holder):
+    """{(product_id, variant_id): units} currently held by ``holder``"""
+    return {
+        (product_id, variant_id): quantity
+        for product_id, variant_id, quantity in StockReservation.objects.filter(holder=holder).values_list(
+            'product_id', 'variant_id', 'quantity'
+        )
+    }
+
+
+def _release_rows(rows):
+    """Delete (pk, product_id, variant_id, quantity) rows and give their units back"""
+    products, variants = Counter(), Counter()
+    for _, product_id, variant_id, quantity in rows:
+        if variant_id:
+            variants[variant_id] += quantity
+        else:
+            products[product_id] += quantity
+    for model, totals in ((Product, products), (ProductVariant, variants)):
+        if totals:
+            # One UPDATE per model, whatever the number of SKUs
+            released = Case(
+                *[When(pk=pk, then=Value(units)) for pk, units in sorted(totals.items())],
+                default=Value(0),
+                output_field=models.PositiveIntegerField(),
+            )
+            model.objects.filter(pk__in=totals).update(reserved_quantity=F('reserved_quantity') - released)
+    StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def release_reservations(reservations):
+    """Release a queryset of reservations in bulk"""
+    with transaction.atomic():
+        rows = list(
+            reservations.select_for_update()
+            .values_list('pk', 'product_id', 'variant_id', 'quantity')
+        )
+        return _release_rows(rows)
+
+
+def release_holder(holder):
+    """Drop every hold of ``holder``, e.g. when its cart is emptied"""
+    return release_reservations(StockReservation.objects.filter(holder=holder))
+
+
+def release_expired(limit=None, product_id=None, variant_id=None):
+    """
+    Release up to ``limit`` expired holds, optionally for one SKU.
+    
+    Rows locked by a concurrent sweep are skipped rather than waited for.
+    """
+    limit = limit or reservation_settings()['SWEEP_BATCH']
+    expired = StockReservation.objects.filter(expires_at__lte=timezone.now())
+    if variant_id:
+        expired = expired.filter(variant_id=variant_id)
+    elif product_id:
+        expired = expired.filter(product_id=product_id, variant__isnull=True)
+    with transaction.atomic():
+        rows = list(
+            expired.select_for_update(skip_locked=True).order_by('expires_at')
+            .values_list('pk', 'product_id', 'variant_id', 'quantity')[:limit]
+        )
+        return _release_rows(rows)
+
+
+def maybe_release_expired():
+    """Sweep expired holds if this process hasn't done so recently"""
+    global _last_sweep
+    config = reservation_settings()
+    now = time.monotonic()
+    if now - _last_sweep < config['SWEEP_INTERVAL']:
+        return 0
+    _last_sweep = now
+    return release_expired(config['SWEEP_BATCH'])
+
+
+def hold_cart_line(holder, item_id, product_id, variant_id, quantity):
+    """
+    Hold stock for a cart line at ``quantity``.
+    
+    A line that can only be partly covered is trimmed to the units held,
+    or deleted when none are. Returns the units held.
+    """
+    held = hold(holder, product_id, quantity, variant_id)
+    if held < quantity:
+        lines = CartItem.objects.filter(pk=item_id)
+        if held:
+            lines.update(quantity=held)
+        else:
+            lines.delete()
+    return held
@@ -0,0 +1,47 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q, Case, When, Value, IntegerField
+
+from .models import SEARCH_CONFIG
+from .search_index import get_search_index, index_settings
+
+
+def search_products(queryset, query):
+    """
+    Filter a product queryset by a free-text query.
+    
+    Returns ``(queryset, suggestion)``. The in-process index is used when
+    enabled, then the weighted search vector on PostgreSQL; both annotate
+    ``search_rank``. Other databases fall back to ``icontains`` matching.
+    Only the in-process index offers a "did you mean" suggestion.
+    """
+    index = get_search_index()
+    if index is not None:
+        result = index.search(query, index_settings()['MAX_RESULTS'])
+        tiers = {}
+        for pk, score in result.scores.items():
+            tiers.setdefault(score, []).append(pk)
+        rank = Case(
+            *[When(pk__in=pks, then=Value(score)) for score, pks in tiers.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=result.ids).annotate(search_rank=rank), result.suggestion
+    
+    if queryset.supports_search_vector:
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ), None
+    
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(brand__name__icontains=query)
+    ), None
+
+
+def order_by_relevance(queryset):
+    """Order search results by rank when available, otherwise by name"""
+    if 'search_rank' in queryset.query.annotations:
+        return queryset.order_by('-search_rank', 'id')
+    return queryset.order_by('name', 'id')
@@ -0,0 +1,411 @@
+"""
+In-process inverted index over product name, tags and brand.
+
+Used by read-only catalog replicas (e.g. SQLite edge nodes) to answer
+``product_list`` searches without a database round trip.  Postings are
+kept in compact ``array('I')`` buffers keyed by a dense document number,
+and fuzzy matching runs over a trigram index of the vocabulary rather
+than over documents, so memory grows with the number of postings instead
+of with per-document Python objects.
+
+Updates are incremental: products past the (updated_at, pk) watermark
+are tombstoned and re-indexed under a new document number. The index is
+compacted by a full rebuild once tombstones pile up. Each build or refresh
+produces a new IndexSnapshot, copying on write only the buffers it
+touches. Searches read whichever snapshot was current when they started,
+so they never see a half-applied update.
+
+Builds stop with IndexTooLarge once the estimated size passes MAX_BYTES.
+The process-wide index then stays off and searches fall back to the
+database. ``benchmark_search`` reports the size: a generated 20k-product
+catalog takes about 3 MiB, so 1M products need roughly 150 MiB.
+Lookups build and refresh in a background thread and use the database
+until the first build is ready; ``warm_search_index()`` builds in the
+foreground (tests, startup scripts).
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'REFRESH_INTERVAL': 60,     # seconds between updated_at polls
+    'MAX_TERMS_PER_DOC': 64,    # caps postings per product
+    'MAX_RESULTS': 1000,        # caps ids handed back to the ORM
+    'MAX_DEAD_RATIO': 0.25,     # tombstone share that triggers a rebuild
+    'CHUNK_SIZE': 5000,
+    'MAX_BYTES': 512 * 1024 * 1024,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def index_settings():
+    return {**DEFAULTS, **getattr(settings, 'PRODUCT_SEARCH_INDEX', {})}
+
+
+def tokenize(text):
+    """Lowercase word tokens of two or more characters"""
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def parse_tags(tags):
+    """Distinct lowercased tags of a comma-separated ``Product.tags``"""
+    return frozenset(tag.strip().lower() for tag in tags.split(',') if tag.strip())
+
+
+def trigrams(term):
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, giving up early once it exceeds ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(term):
+    return 1 if len(term) <= 5 else 2
+
+
+class SearchResult:
+    """Matching product ids (best first) and an optional corrected query"""
+    
+    def __init__(self, ids, scores, suggestion=None):
+        self.ids = ids
+        self.scores = scores
+        self.suggestion = suggestion
+    
+    def __len__(self):
+        return len(self.ids)
+
+
+class IndexTooLarge(Exception):
+    pass
+
+
+class IndexSnapshot:
+    """One state of the index; never changed once published"""
+    
+    def __init__(self, max_terms_per_doc=64):
+        self.max_terms_per_doc = max_terms_per_doc
+        self.term_ids = {}          # term -> term id
+        self.terms = []             # term id -> term
+        self.postings = []          # term id -> array('I') of doc numbers
+        self.trigram_terms = {}     # trigram -> array('I') of term ids
+        self.doc_pks = array('Q')   # doc number -> product pk
+        self.alive = bytearray()    # doc number -> 1 while current
+        self.base_count = 0         # doc numbers below this are pk-sorted
+        self.reindexed = {}         # pk -> doc number for docs added after a build
+        self.dead = 0
+        self.watermark = None       # (updated_at, pk) of the last change applied
+        self.entries = 0            # postings plus trigram entries, for size estimates
+        self.term_bytes = 0
+        self._shared = None         # buffers still shared with the parent snapshot
+    
+    def derive(self):
+        """A copy to apply changes to; posting arrays are copied when first written"""
+        child = IndexSnapshot(self.max_terms_per_doc)
+        vars(child).update(vars(self))
+        child.term_ids = dict(self.term_ids)
+        child.terms = list(self.terms)
+        child.postings = list(self.postings)
+        child.trigram_terms = dict(self.trigram_terms)
+        child.doc_pks = array('Q', self.doc_pks)
+        child.alive = bytearray(self.alive)
+        child.reindexed = dict(self.reindexed)
+        child._shared = {'postings': set(range(len(self.postings))), 'grams': set(self.trigram_terms)}
+        return child
+    
+    def _writable(self, kind, key, table):
+        if self._shared is not None and key in self._shared[kind]:
+            self._shared[kind].discard(key)
+            table[key] = array('I', table[key])
+        return table[key]
+    
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+            self.postings.append(array('I'))
+            self.term_bytes += sys.getsizeof(term) + 160  # dict and list slots, array object
+            for gram in trigrams(term):
+                if gram in self.trigram_terms:
+                    self._writable('grams', gram, self.trigram_terms).append(term_id)
+                else:
+                    self.trigram_terms[gram] = array('I', [term_id])
+                self.entries += 1
+        return term_id
+    
+    def _add(self, pk, name, tags, brand_name):
+        doc = len(self.doc_pks)
+        self.doc_pks.append(pk)
+        self.alive.append(1)
+        terms = dict.fromkeys(tokenize(f'{name} {tags.replace(",", " ")} {brand_name}'))
+        for term in list(terms)[:self.max_terms_per_doc]:
+            self._writable('postings', self._term_id(term), self.postings).append(doc)
+            self.entries += 1
+        return doc
+    
+    def _doc_for(self, pk):
+        doc = self.reindexed.get(pk)
+        if doc is not None:
+            return doc
+        i = bisect_left(self.doc_pks, pk, 0, self.base_count)
+        if i < self.base_count and self.doc_pks[i] == pk:
+            return i
+        return None
+    
+    def _advance(self, updated_at, pk):
+        if self.watermark is None or (updated_at, pk) > self.watermark:
+            self.watermark = (updated_at, pk)
+    
+    def nbytes(self):
+        """Estimated size: posting and trigram buffers, doc tables and vocabulary"""
+        return self.entries * 4 + len(self.doc_pks) * 9 + self.term_bytes + len(self.trigram_terms) * 200
+    
+    # Querying
+    
+    def _candidates(self, term, limit=50):
+        """Vocabulary terms within edit distance of ``term``, closest first"""
+        shared = Counter()
+        for gram in trigrams(term):
+            shared.update(self.trigram_terms.get(gram, ()))
+        allowed = max_edits(term)
+        matches = []
+        for term_id, _ in shared.most_common(limit):
+            distance = edit_distance(term, self.terms[term_id], allowed)
+            if distance <= allowed:
+                matches.append((distance, -len(self.postings[term_id]), term_id))
+        return [term_id for _, _, term_id in sorted(matches)]
+    
+    def _docs(self, term_ids):
+        docs = set()
+        for term_id in term_ids:
+            docs.update(self.postings[term_id])
+        return docs
+    
+    def search(self, query, max_results=1000):
+        """All query tokens must match, exactly or within a small edit distance"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return SearchResult([], {})
+        
+        # Every token is corrected, so the suggestion keeps the whole query
+        # even when ranking stops at a token nothing matches
+        lookups, corrected = [], []
+        for token in tokens:
+            term_id = self.term_ids.get(token)
+            candidates = [c for c in self._candidates(token) if c != term_id]
+            lookups.append((term_id, candidates))
+            if term_id is not None or not candidates:
+                corrected.append(token)
+            else:
+                corrected.append(self.terms[candidates[0]])
+        
+        scores = None
+        for term_id, candidates in lookups:
+            # Exact postings score a point; close spellings still match
+            exact = set(self.postings[term_id]) if term_id is not None else set()
+            matched = exact | self._docs(candidates)
+            if scores is None:
+                scores = dict.fromkeys(matched, 0)
+            else:
+                scores = {doc: score for doc, score in scores.items() if doc in matched}
+            for doc in exact & scores.keys():
+                scores[doc] += 1
+            if not scores:
+                break
+        
+        alive = self.alive
+        ranked = sorted(
+            (doc for doc in scores if alive[doc]),
+            key=lambda doc: (-scores[doc], doc),
+        )[:max_results]
+        suggestion = ' '.join(corrected) if corrected != tokens else None
+        return SearchResult(
+            [self.doc_pks[doc] for doc in ranked],
+            {self.doc_pks[doc]: scores[doc] for doc in ranked},
+            suggestion,
+        )
+    
+    def __len__(self):
+        return len(self.doc_pks) - self.dead
+
+
+class ProductSearchIndex:
+    """Inverted index of active products with typo-tolerant lookup"""
+    
+    def __init__(self, max_terms_per_doc=64, chunk_size=5000, max_bytes=None):
+        self.max_terms_per_doc = max_terms_per_doc
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.snapshot = IndexSnapshot()
+        self.built = False
+        self._lock = threading.Lock()   # one writer at a time; readers take self.snapshot
+    
+    def _source(self, since=None):
+        products = Product.objects.order_by('pk')
+        if since is not None:
+            updated_at, pk = since
+            products = products.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk))
+        return products.values_list(
+            'pk', 'name', 'tags', 'brand__name', 'is_active', 'updated_at'
+        ).iterator(chunk_size=self.chunk_size)
+    
+    def _check_size(self, snapshot):
+        if self.max_bytes and snapshot.nbytes() > self.max_bytes:
+            raise IndexTooLarge(
+                f'Search index passed {self.max_bytes} bytes after {len(snapshot.doc_pks)} products'
+            )
+    
+    def rebuild(self):
+        """Index every active product from scratch, then swap it in"""
+        with self._lock:
+            fresh = IndexSnapshot(self.max_terms_per_doc)
+            for n, (pk, name, tags, brand_name, is_active, updated_at) in enumerate(self._source(), 1):
+                fresh._advance(updated_at, pk)
+                if is_active:
+                    fresh._add(pk, name, tags, brand_name)
+                if n % self.chunk_size == 0:
+                    self._check_size(fresh)
+            self._check_size(fresh)
+            fresh.base_count = len(fresh.doc_pks)
+            self.snapshot = fresh
+            self.built = True
+        return fresh.base_count
+    
+    def refresh(self):
+        """Apply products changed since the last build or refresh"""
+        if not self.built:
+            return self.rebuild()
+        with self._lock:
+            current = self.snapshot
+            changes = list(self._source(current.watermark))
+            if not changes:
+                return 0
+            snapshot = current.derive()
+            for pk, name, tags, brand_name, is_active, updated_at in changes:
+                snapshot._advance(updated_at, pk)
+                doc = snapshot._doc_for(pk)
+                if doc is not None and snapshot.alive[doc]:
+                    snapshot.alive[doc] = 0
+                    snapshot.dead += 1
+                if is_active:
+                    snapshot.reindexed[pk] = snapshot._add(pk, name, tags, brand_name)
+                else:
+                    snapshot.reindexed.pop(pk, None)
+            snapshot._shared = None
+            self._check_size(snapshot)
+            self.snapshot = snapshot
+            needs_compaction = snapshot.dead > len(snapshot.doc_pks) * index_settings()['MAX_DEAD_RATIO']
+        if needs_compaction:
+            self.rebuild()
+        return len(changes)
+    
+    def search(self, query, max_results=1000):
+        return self.snapshot.search(query, max_results)
+    
+    @property
+    def terms(self):
+        return self.snapshot.terms
+    
+    def nbytes(self):
+        return self.snapshot.nbytes()
+    
+    def __len__(self):
+        return len(self.snapshot)
+
+
+_index = None
+_index_lock = threading.Lock()
+_maintenance = {'last': 0.0, 'thread': None, 'too_large': False}
+
+
+def reset_search_index():
+    """Drop the process-wide index; the next lookup rebuilds it"""
+    global _index
+    with _index_lock:
+        _index = None
+        _maintenance.update(last=0.0, thread=None, too_large=False)
+
+
+def _new_index(config):
+    return ProductSearchIndex(config['MAX_TERMS_PER_DOC'], config['CHUNK_SIZE'], config['MAX_BYTES'])
+
+
+def _maintain(index):
+    """Run in a background thread: build or refresh the process-wide index"""
+    try:
+        index.refresh()
+    except IndexTooLarge as exc:
+        logger.warning('%s; searches use the database until it is reset', exc)
+        _maintenance['too_large'] = True
+    except Exception:
+        logger.exception('Search index refresh failed')
+    finally:
+        _maintenance['thread'] = None
+        connections.close_all()  # this thread's connections only
+
+
+def warm_search_index():
+    """Build the process-wide index in the foreground, if enabled; returns it"""
+    global _index
+    config = index_settings()
+    if not config['ENABLED']:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = _new_index(config)
+        index = _index
+        _maintenance['last'] = time.monotonic()
+    index.refresh()
+    return index
+
+
+def get_search_index():
+    """The process-wide index once built, else None; refreshed in the background"""
+    global _index
+    config = index_settings()
+    if not config['ENABLED'] or _maintenance['too_large']:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = _new_index(config)
+        index = _index
+        now = time.monotonic()
+        if _maintenance['thread'] is None and now - _maintenance['last'] >= config['REFRESH_INTERVAL']:
+            _maintenance['last'] = now
+            thread = threading.Thread(target=_maintain, args=(index,), name='search-index', daemon=True)
+            _maintenance['thread'] = thread
+            thread.start()
+    return index if index.built else None
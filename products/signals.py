@@ -0,0 +1,76 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .page_cache import purge_surrogate_keys, product_surrogate_keys
+from .models import Brand, Category, Product, ProductImage, ProductReview, ProductVariant
+
+_UNKNOWN = object()
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_stats_on_save(sender, instance, created, **kwargs):
+    """Apply the change in this review's contribution to its product's stats"""
+    previous = None if created else getattr(instance, '_rating_snapshot', _UNKNOWN)
+    current = instance.rating_contribution()
+    instance._rating_snapshot = current
+    
+    if previous is _UNKNOWN:
+        # Loaded without the fields we track; fall back to a recount
+        Product.objects.filter(pk=instance.product_id).refresh_rating_stats()
+        return
+    if previous == current:
+        return
+    if previous and current and previous[0] == current[0]:
+        Product.objects.filter(pk=current[0]).apply_rating_delta(current[1] - previous[1], 0)
+        return
+    if previous:
+        Product.objects.filter(pk=previous[0]).apply_rating_delta(-previous[1], -1)
+    if current:
+        Product.objects.filter(pk=current[0]).apply_rating_delta(current[1], 1)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review's contribution from its product's stats"""
+    previous = getattr(instance, '_rating_snapshot', _UNKNOWN)
+    if previous is _UNKNOWN:
+        Product.objects.filter(pk=instance.product_id).refresh_rating_stats()
+    elif previous:
+        Product.objects.filter(pk=previous[0]).apply_rating_delta(-previous[1], -1)
+
+
+@receiver(post_save, sender=Brand)
+def refresh_search_vector_on_brand_save(sender, instance, created, **kwargs):
+    """Brand names are part of the product search vector and product cards"""
+    if not created:
+        products = Product.objects.filter(brand=instance)
+        products.refresh_search_vector()
+        products.bump_cache_version()
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+def invalidate_catalog_caches(sender, instance, **kwargs):
+    """Catalog-wide cached data (e.g. facet counts) is keyed on this version"""
+    bump_catalog_version()
+    if sender is Product:
+        keys = product_surrogate_keys(instance)
+    else:
+        keys = [f'{sender._meta.model_name}-{instance.pk}']
+    purge_surrogate_keys(keys + ['product-list'])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductVariant)
+def bump_product_cache_version(sender, instance, **kwargs):
+    """Images and variants are rendered with their product"""
+    Product.objects.filter(pk=instance.product_id).bump_cache_version()
+    purge_surrogate_keys([f'product-{instance.product_id}'])
+
+
+@receiver([post_save, post_delete], sender=ProductReview)
+def purge_reviewed_product_pages(sender, instance, **kwargs):
+    """Product pages list the latest reviews"""
+    purge_surrogate_keys([f'product-{instance.product_id}'])
@@ -0,0 +1,32 @@
+"""
+Streamed response bodies that stay streamed under ASGI.
+
+Given a sync iterator, Django's ASGI handler collects it with
+``sync_to_async(list)`` before sending anything, so a whole feed or page
+would be built in memory. ``streamed()`` hands ASGI requests an async
+iterator instead. It pulls one chunk at a time on the thread-sensitive
+executor, where the ORM (and any server-side cursor) lives.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_done = object()
+
+
+async def _pulled(chunks):
+    chunks = iter(chunks)
+    pull = sync_to_async(next)
+    try:
+        while (chunk := await pull(chunks, _done)) is not _done:
+            yield chunk
+    finally:
+        # A client that disconnects early must not leave a cursor open
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close)()
+
+
+def streamed(request, chunks):
+    """``chunks`` as StreamingHttpResponse content for ``request``, whichever handler serves it"""
+    if isinstance(request, ASGIRequest):
+        return _pulled(chunks)
+    return chunks
@@ -0,0 +1,382 @@
+"""
+Deterministic synthetic catalog for load and performance testing.
+
+Every chunk of rows is a pure function of the seed and its position, so
+the same seed and chunk size give the same catalog however many worker
+processes share the work.
+Primary keys are assigned up front from the current maximum, which lets
+children (variants, images, cart lines) point at parents generated by
+another worker without a lookup. Popularity is skewed: a few brands,
+categories, products and users account for most reviews and carts.
+"""
+import hashlib
+import io
+import json
+import math
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, models
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cache import bump_catalog_version
+from .models import Brand, Cart, CartItem, Category, Product, ProductImage, ProductReview, ProductVariant
+from .page_cache import purge_surrogate_keys
+from .related import refresh_related
+
+User = get_user_model()
+
+MAX_VARIANTS = 4    # id slots reserved per product
+MAX_IMAGES = 3
+MAX_CART_LINES = 5
+MAX_REVIEWS = 2000  # per product
+
+ADJECTIVES = [
+    'Wireless', 'Portable', 'Premium', 'Classic', 'Smart', 'Compact', 'Ultra', 'Organic', 'Vintage',
+    'Ergonomic', 'Waterproof', 'Lightweight', 'Heavy-Duty', 'Deluxe', 'Eco', 'Modern', 'Rustic',
+    'Foldable', 'Insulated', 'Adjustable', 'Cordless', 'Handmade', 'Digital', 'Professional',
+]
+NOUNS = [
+    'Headphones', 'Speaker', 'Backpack', 'Jacket', 'Lamp', 'Blender', 'Kettle', 'Watch', 'Camera',
+    'Keyboard', 'Mouse', 'Monitor', 'Chair', 'Desk', 'Tent', 'Bottle', 'Sneakers', 'Notebook',
+    'Charger', 'Drone', 'Router', 'Mattress', 'Pillow', 'Yoga Mat', 'Skillet', 'Planter', 'Novel',
+    'Cookbook', 'Helmet', 'Bicycle', 'Sunglasses', 'Wallet', 'Tablet', 'Thermostat', 'Vacuum',
+]
+DEPARTMENTS = [
+    'Electronics', 'Clothing', 'Home & Garden', 'Sports & Outdoors', 'Books', 'Toys', 'Beauty',
+    'Grocery', 'Automotive', 'Health', 'Office', 'Pets', 'Music', 'Tools', 'Jewelry', 'Baby',
+]
+BRAND_WORDS = ['Tech', 'Style', 'Home', 'Sport', 'Book', 'Gadget', 'Nova', 'Peak', 'Urban', 'Terra', 'Zen', 'Volt']
+BRAND_SUFFIXES = ['Pro', 'Max', 'Works', 'Hub', 'Co', 'Labs', 'Line', 'Craft']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Rowan', 'Drew']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Novak', 'Okafor', 'Silva', 'Muller', 'Rossi', 'Haddad', 'Sato']
+COLORS = ['Black', 'White', 'Red', 'Blue', 'Green', 'Grey']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+WORDS = (
+    'durable comfortable reliable stylish quiet fast efficient versatile sturdy elegant soft bright '
+    'battery design quality everyday travel home office outdoor performance warranty premium materials'
+).split()
+RATING_WEIGHTS = [5, 7, 12, 30, 46]  # 1..5 stars, skewed positive
+
+
+def unit(seed, *parts):
+    """Deterministic float in [0, 1) for a seed and a position"""
+    digest = hashlib.blake2b(repr((seed,) + parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def skewed_index(u, count, skew=3.0):
+    """Map a uniform draw to [0, count) with low indexes far more likely"""
+    return min(int(count * u ** skew), count - 1)
+
+
+def _numbered(names, count):
+    """``count`` distinct names, cycling through ``names`` with a suffix"""
+    return [
+        names[n % len(names)] + (f' {n // len(names) + 1}' if n >= len(names) else '')
+        for n in range(count)
+    ]
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+class CatalogPlan:
+    """Sizes, seed and primary-key bases for one generated catalog"""
+    
+    def __init__(self, seed=0, products=10000, users=5000, categories=16, brands=100,
+                 reviews=5, cart_ratio=0.3, chunk_size=5000):
+        self.seed = seed
+        self.products = products
+        self.users = users
+        self.category_count = categories
+        self.brand_count = brands
+        self.reviews = reviews
+        self.cart_ratio = cart_ratio
+        self.chunk_size = chunk_size
+        self.now = timezone.now()
+        self.password = make_password('synthetic-password')
+    
+    def prepare(self):
+        """Create categories and brands and reserve primary-key ranges"""
+        self.category_ids = self._ensure(Category, _numbered(DEPARTMENTS, self.category_count))
+        brand_names = [word + suffix for suffix in BRAND_SUFFIXES for word in BRAND_WORDS]
+        self.brand_ids = self._ensure(Brand, _numbered(brand_names, self.brand_count))
+        self.product_base = self._next_id(Product)
+        self.user_base = self._next_id(User)
+        self.variant_base = self._next_id(ProductVariant)
+        self.image_base = self._next_id(ProductImage)
+        self.cart_base = self._next_id(Cart)
+    
+    @staticmethod
+    def _next_id(model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+    
+    @staticmethod
+    def _ensure(model, names):
+        model.objects.bulk_create(
+            [model(name=name, slug=slugify(name), description=f'Synthetic {name}') for name in names],
+            ignore_conflicts=True,
+        )
+        by_name = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+        return [by_name[name] for name in names]
+    
+    # Shapes shared by the tables that reference each other
+    
+    def product_id(self, i):
+        return self.product_base + i
+    
+    def user_id(self, u):
+        return self.user_base + u
+    
+    def variant_count(self, i):
+        u = unit(self.seed, 'variants', i)
+        return 0 if u < 0.6 else 2 + int((u - 0.6) / 0.4 * (MAX_VARIANTS - 1))
+    
+    def variant_id(self, i, j):
+        return self.variant_base + i * MAX_VARIANTS + j
+    
+    def has_cart(self, u):
+        return unit(self.seed, 'cart', u) < self.cart_ratio
+    
+    def cart_id(self, u):
+        return self.cart_base + u
+    
+    def created_at(self, *parts):
+        return self.now - timedelta(days=730 * unit(self.seed, 'created', *parts))
+
+
+def _rng(plan, table, start):
+    return random.Random(f'{plan.seed}:{table}:{start}')
+
+
+def product_rows(plan, start, stop):
+    rng = _rng(plan, 'products', start)
+    for i in range(start, stop):
+        pk = plan.product_id(i)
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randint(100, 9999)}'
+        price = Decimal(min(max(math.exp(rng.gauss(3.4, 1.1)), 1), 5000)).quantize(Decimal('0.01'))
+        discount = rng.choice([0, 0, 0, 10, 15, 20, 25, 40])
+        stock = 0 if rng.random() < 0.08 else int(rng.paretovariate(1.3) * 5)
+        yield {
+            'id': pk,
+            'name': name,
+            'slug': f'{name.lower().replace(" ", "-")}-{pk}',
+            'sku': f'SYN-{pk:010d}',
+            'brand_id': plan.brand_ids[skewed_index(rng.random(), len(plan.brand_ids))],
+            'category_id': plan.category_ids[skewed_index(rng.random(), len(plan.category_ids), 2.0)],
+            'description': ' '.join(_sentence(rng) for _ in range(4)),
+            'short_description': _sentence(rng),
+            'features': [_sentence(rng, 4) for _ in range(3)],
+            'specifications': {'Weight': f'{rng.randint(1, 50) / 10} kg', 'Warranty': f'{rng.randint(1, 3)} years'},
+            'price': price,
+            'original_price': (price * 100 / (100 - discount)).quantize(Decimal('0.01')) if discount else None,
+            'discount_percentage': discount,
+            'stock_quantity': min(stock, 100000),
+            'is_active': rng.random() < 0.97,
+            'is_featured': rng.random() < 0.03,
+            'is_bestseller': rng.random() < 0.02,
+            'is_new_arrival': rng.random() < 0.05,
+            'tags': ', '.join(rng.sample(WORDS, 3)),
+            'free_shipping': rng.random() < 0.3,
+            'created_at': plan.created_at('product', i),
+            'updated_at': plan.now,
+        }
+
+
+def variant_rows(plan, start, stop):
+    rng = _rng(plan, 'variants', start)
+    for i in range(start, stop):
+        count = plan.variant_count(i)
+        kind, names = ('Color', COLORS) if i % 2 else ('Size', SIZES)
+        for j, name in enumerate(rng.sample(names, count)):
+            yield {
+                'id': plan.variant_id(i, j),
+                'product_id': plan.product_id(i),
+                'name': name,
+                'variant_type': kind,
+                'price_adjustment': Decimal(rng.choice([0, 0, 5, 10, 20])),
+                'stock_quantity': rng.randint(0, 50),
+                'sku_suffix': name[:3].upper(),
+            }
+
+
+def image_rows(plan, start, stop):
+    rng = _rng(plan, 'images', start)
+    for i in range(start, stop):
+        for j in range(rng.randint(1, MAX_IMAGES)):
+            yield {
+                'id': plan.image_base + i * MAX_IMAGES + j,
+                'product_id': plan.product_id(i),
+                'image': f'products/synthetic/{rng.randrange(500)}.jpg',
+                'alt_text': f'Product {plan.product_id(i)} image {j + 1}',
+                'is_main': j == 0,
+                'order': j,
+                'created_at': plan.created_at('product', i),
+            }
+
+
+def review_rows(plan, start, stop):
+    rng = _rng(plan, 'reviews', start)
+    for i in range(start, stop):
+        # Heavy-tailed: most products have a few reviews, a few have thousands
+        count = min(int((rng.paretovariate(1.2) - 1) * plan.reviews * 0.2), plan.users, MAX_REVIEWS)
+        reviewers = {skewed_index(rng.random(), plan.users, 2.0) for _ in range(count)}
+        for u in sorted(reviewers):
+            yield {
+                'product_id': plan.product_id(i),
+                'user_id': plan.user_id(u),
+                'rating': rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                'title': ' '.join(rng.sample(WORDS, 3)).capitalize(),
+                'review': _sentence(rng, 20),
+                'is_approved': rng.random() < 0.95,
+                'is_verified_purchase': rng.random() < 0.6,
+                'helpful_count': int(rng.paretovariate(2)) - 1,
+                'created_at': plan.created_at('review', i, u),
+                'updated_at': plan.now,
+            }
+
+
+def user_rows(plan, start, stop):
+    rng = _rng(plan, 'users', start)
+    for u in range(start, stop):
+        pk = plan.user_id(u)
+        joined = plan.created_at('user', u)
+        yield {
+            'id': pk,
+            'username': f'shopper{pk}',
+            'email': f'shopper{pk}@example.test',
+            'password': plan.password,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'date_joined': joined,
+            'created_at': joined,
+            'updated_at': plan.now,
+        }
+
+
+def cart_rows(plan, start, stop):
+    for u in range(start, stop):
+        if plan.has_cart(u):
+            yield {'id': plan.cart_id(u), 'user_id': plan.user_id(u), 'created_at': plan.now, 'updated_at': plan.now}
+
+
+def cart_item_rows(plan, start, stop):
+    rng = _rng(plan, 'cart_items', start)
+    for u in range(start, stop):
+        if not plan.has_cart(u):
+            continue
+        lines = {skewed_index(rng.random(), plan.products) for _ in range(rng.randint(1, MAX_CART_LINES))}
+        for i in sorted(lines):
+            variants = plan.variant_count(i)
+            yield {
+                'cart_id': plan.cart_id(u),
+                'product_id': plan.product_id(i),
+                'variant_id': plan.variant_id(i, rng.randrange(variants)) if variants else None,
+                'quantity': rng.randint(1, 3),
+                'added_at': plan.now,
+                'updated_at': plan.now,
+            }
+
+
+# table: (model, row builder, what the chunks range over)
+TABLES = {
+    'products': (Product, product_rows, 'products'),
+    'users': (User, user_rows, 'users'),
+    'variants': (ProductVariant, variant_rows, 'products'),
+    'images': (ProductImage, image_rows, 'products'),
+    'reviews': (ProductReview, review_rows, 'products'),
+    'carts': (Cart, cart_rows, 'users'),
+    'cart_items': (CartItem, cart_item_rows, 'users'),
+}
+# Each phase only references rows committed by earlier ones
+PHASES = [['products', 'users'], ['variants', 'images', 'reviews', 'carts'], ['cart_items']]
+
+
+def complete_row(model, row, now):
+    """Fill the columns a row leaves out with their model defaults"""
+    for field in model._meta.concrete_fields:
+        if field.attname in row or field.primary_key:
+            continue
+        if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add):
+            row[field.attname] = now
+        else:
+            row[field.attname] = field.get_default()
+    return row
+
+
+def _copy_value(field, value):
+    if value is None:
+        return ''  # unquoted empty is NULL in CSV mode
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+def copy_rows(model, rows, table=None):
+    """Load rows with PostgreSQL COPY ... FROM STDIN, into ``table`` or the model's own"""
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_copy_value(field, row[field.attname]) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {quote(table or model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def copy_supported():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        return hasattr(cursor, 'copy_expert')
+
+
+def write_chunk(plan, table, start, stop, method):
+    """Generate and insert one chunk of a table; returns the rows written"""
+    model, build, _ = TABLES[table]
+    rows = [complete_row(model, row, plan.now) for row in build(plan, start, stop)]
+    if not rows:
+        return 0
+    if method == 'copy':
+        copy_rows(model, rows)
+    else:
+        # auto_now fields are stamped at insert time on this path
+        model._base_manager.bulk_create([model(**row) for row in rows], batch_size=1000)
+    return len(rows)
+
+
+def chunks(plan, table):
+    total = plan.products if TABLES[table][2] == 'products' else plan.users
+    return [(start, min(start + plan.chunk_size, total)) for start in range(0, total, plan.chunk_size)]
+
+
+def finish(plan, batch=50000):
+    """Reset sequences past the assigned keys and derive maintained columns and tables"""
+    sql = connection.ops.sequence_reset_sql(no_style(), [Product, User, ProductVariant, ProductImage, Cart])
+    with connection.cursor() as cursor:
+        for statement in sql:
+            cursor.execute(statement)
+    stop = plan.product_id(plan.products)
+    for start in range(plan.product_base, stop, batch):
+        products = Product.objects.filter(pk__gte=start, pk__lt=min(start + batch, stop))
+        products.refresh_rating_stats()
+        products.refresh_search_vector()
+    refresh_related(full=True)
+    bump_catalog_version()
+    purge_surrogate_keys(['product-list', 'product-detail'])
@@ -1,3 +1,1407 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ecommerce.profiling import StackSampler, _cprofile_lock, trigger_token
+from ecommerce.sql_instrumentation import collect_queries
+from .models import (
+    Brand, Category, Product, ProductImage, ProductReview, ProductVariant, Cart, CartItem, RelatedProduct,
+    StockReservation,
+)
+from .search import search_products, order_by_relevance
+from .search_index import IndexTooLarge, ProductSearchIndex, reset_search_index, warm_search_index
+from .pagination import InvalidCursor, KeysetPaginator
+from .api import PRODUCTS
+from .catalog_import import clean_row, import_products
+from .feeds import feed_token
+from .views import CATALOG_ORDERINGS
+from .facets import FacetFilters, facet_combinations, facet_counts
+from .cache import card_metrics, render_product_cards
+from .cart import CartBatch
+from .recommender import (
+    build_index, index_directory, np, recommend_for_products, recommender_settings, reset_index, similar_products,
+)
+from .related import refresh_related
+from .reservations import hold, release, release_expired
+from .synthetic import CatalogPlan, product_rows
+from .view_benchmarks import check_budgets, load_budgets, run_suite, uncovered_urls
+
+User = get_user_model()
+
+
+def make_user(n):
+    return User.objects.create_user(
+        username=f'user{n}', email=f'user{n}@example.com', password='Secret#123'
+    )
+
+
+class CatalogTestCase(TestCase):
+    """Shared fixtures for catalog tests"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Electronics', slug='electronics')
+        cls.brand = Brand.objects.create(name='TechPro', slug='techpro')
+    
+    @classmethod
+    def make_product(cls, n, **kwargs):
+        defaults = {
+            'name': f'Product {n}',
+            'slug': f'product-{n}',
+            'sku': f'SKU-{n}',
+            'brand': cls.brand,
+            'category': cls.category,
+            'description': f'Description {n}',
+            'short_description': f'Short {n}',
+            'price': Decimal('10.00'),
+            'stock_quantity': 20,
+        }
+        defaults.update(kwargs)
+        return Product.objects.create(**defaults)
+
+
+class RatingStatsTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.product = self.make_product(1)
+        self.users = [make_user(i) for i in range(3)]
+    
+    def review(self, user, rating, **kwargs):
+        return ProductReview.objects.create(
+            product=self.product, user=user, rating=rating, title='t', review='r', **kwargs
+        )
+    
+    def assertStats(self, rating_sum, rating_count, rating_avg):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, rating_sum)
+        self.assertEqual(self.product.review_count, rating_count)
+        self.assertEqual(self.product.average_rating, Decimal(rating_avg))
+    
+    def test_create_edit_and_delete_keep_stats_in_sync(self):
+        self.review(self.users[0], 5)
+        second = self.review(self.users[1], 2)
+        self.assertStats(7, 2, '3.50')
+        
+        second = ProductReview.objects.get(pk=second.pk)
+        second.rating = 4
+        second.save()
+        self.assertStats(9, 2, '4.50')
+        
+        second.is_approved = False
+        second.save()
+        self.assertStats(5, 1, '5.00')
+        
+        ProductReview.objects.filter(pk=second.pk).delete()
+        self.assertStats(5, 1, '5.00')
+        
+        ProductReview.objects.all().delete()
+        self.assertStats(0, 0, '0.00')
+    
+    def test_stats_read_without_queries(self):
+        self.review(self.users[0], 4)
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.average_rating, Decimal('4.00'))
+            self.assertEqual(product.review_count, 1)
+    
+    def test_bulk_approval_refreshes_stats(self):
+        self.review(self.users[0], 5, is_approved=False)
+        self.review(self.users[1], 3, is_approved=False)
+        self.assertStats(0, 0, '0.00')
+        
+        ProductReview.objects.all().set_approval(True)
+        self.assertStats(8, 2, '4.00')
+        
+        ProductReview.objects.filter(rating=5).set_approval(False)
+        self.assertStats(3, 1, '3.00')
+    
+    def test_stale_product_save_keeps_stats(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.users[0], 5)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertStats(5, 1, '5.00')
+    
+    def test_rebuild_command(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_avg=0)
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        self.assertStats(9, 2, '4.50')
+
+
+class MainImageTests(CatalogTestCase):
+    
+    def make_products(self, count, start=0):
+        for n in range(start, start + count):
+            product = self.make_product(n)
+            ProductImage.objects.create(product=product, image=f'products/{n}.jpg', is_main=True)
+            ProductImage.objects.create(product=product, image=f'products/{n}-alt.jpg')
+    
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+    
+    def test_with_main_image_resolves_without_queries(self):
+        self.make_products(3)
+        products = list(Product.objects.with_main_image().order_by('slug'))
+        with self.assertNumQueries(0):
+            urls = [product.get_main_image() for product in products]
+        self.assertEqual(urls, ['/media/products/0.jpg', '/media/products/1.jpg', '/media/products/2.jpg'])
+    
+    def test_get_main_image_caches_fallback_lookup(self):
+        self.make_products(1)
+        product = Product.objects.get()
+        with self.assertNumQueries(1):
+            product.get_main_image()
+            self.assertEqual(product.get_main_image(), '/media/products/0.jpg')
+    
+    def test_product_list_query_count_independent_of_page_size(self):
+        self.make_products(2)
+        small_page = self.count_queries(reverse('product_list'))
+        self.make_products(10, start=2)
+        full_page = self.count_queries(reverse('product_list'))
+        self.assertEqual(small_page, full_page)
+    
+    def test_product_detail_query_count_independent_of_related(self):
+        self.make_products(2)
+        refresh_related()
+        url = reverse('product_detail', kwargs={'slug': 'product-0'})
+        few_related = self.count_queries(url)
+        self.make_products(6, start=2)
+        refresh_related()
+        self.assertEqual(few_related, self.count_queries(url))
+
+
+class SearchTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.headphones = self.make_product(1, name='Wireless Headphones', tags='audio,bluetooth')
+        self.speaker = self.make_product(2, name='Desk Speaker', description='Pairs with headphones')
+        self.shirt = self.make_product(3, name='Cotton Shirt')
+    
+    def search(self, query):
+        products, _ = search_products(Product.objects.all(), query)
+        return list(order_by_relevance(products))
+    
+    def test_search_matches_name_and_description(self):
+        self.assertEqual(set(self.search('headphones')), {self.headphones, self.speaker})
+    
+    def test_product_list_defaults_to_relevance_when_searching(self):
+        response = self.client.get(reverse('product_list'), {'search': 'headphones'})
+        self.assertEqual(response.context['sort_by'], 'relevance')
+        self.assertEqual(set(response.context['page_obj']), {self.headphones, self.speaker})
+    
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full-text search only')
+    def test_postgres_ranks_and_refreshes_vector(self):
+        # Name matches (weight A) outrank description matches (weight D)
+        self.assertEqual(self.search('headphones'), [self.headphones, self.speaker])
+        
+        Product.objects.filter(pk=self.shirt.pk).update(tags='bluetooth')
+        self.assertIn(self.shirt, self.search('bluetooth'))
+        
+        self.brand.name = 'Acoustica'
+        self.brand.save()
+        self.assertEqual(len(self.search('acoustica')), 3)
+
+
+class SearchIndexTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.headphones = self.make_product(1, name='Wireless Headphones', tags='audio,bluetooth')
+        self.speaker = self.make_product(2, name='Bluetooth Speaker')
+        self.shirt = self.make_product(3, name='Cotton Shirt', is_active=False)
+        self.index = ProductSearchIndex()
+        self.index.rebuild()
+    
+    def test_exact_and_fuzzy_matches(self):
+        self.assertEqual(self.index.search('bluetooth').ids, [self.headphones.pk, self.speaker.pk])
+        result = self.index.search('wireles headphnes')
+        self.assertEqual(result.ids, [self.headphones.pk])
+        self.assertEqual(result.suggestion, 'wireless headphones')
+        self.assertIsNone(self.index.search('headphones').suggestion)
+        # No product matches both early tokens; the last one is still corrected
+        result = self.index.search('wireles speakr headphnes')
+        self.assertEqual(result.ids, [])
+        self.assertEqual(result.suggestion, 'wireless speaker headphones')
+    
+    def test_exact_matches_rank_above_fuzzy(self):
+        self.make_product(4, name='Speakers Stand')
+        self.index.refresh()
+        result = self.index.search('speaker')
+        self.assertEqual(result.ids[0], self.speaker.pk)
+        self.assertEqual(len(result), 2)
+    
+    def test_incremental_refresh(self):
+        Product.objects.filter(pk=self.speaker.pk).update(name='Desk Lamp')
+        Product.objects.filter(pk=self.shirt.pk).update(is_active=True)
+        self.index.refresh()
+        self.assertEqual(self.index.search('speaker').ids, [])
+        self.assertEqual(self.index.search('lamp').ids, [self.speaker.pk])
+        self.assertEqual(self.index.search('cotton').ids, [self.shirt.pk])
+    
+    def test_refresh_without_changes_keeps_snapshot(self):
+        # Rows sharing the watermark's updated_at are told apart by pk
+        Product.objects.update(updated_at=self.speaker.updated_at)
+        self.index.rebuild()
+        before = self.index.snapshot
+        self.assertEqual(self.index.refresh(), 0)
+        self.assertIs(self.index.snapshot, before)
+        
+        Product.objects.filter(pk=self.speaker.pk).update(name='Desk Lamp')
+        self.index.refresh()
+        # A search holding the old snapshot still sees a consistent state
+        self.assertEqual(before.search('speaker').ids, [self.speaker.pk])
+        self.assertEqual(self.index.search('speaker').ids, [])
+        self.assertEqual(len(self.index), 2)
+    
+    def test_build_stops_at_size_budget(self):
+        with self.assertRaises(IndexTooLarge):
+            ProductSearchIndex(max_bytes=64).rebuild()
+    
+    @override_settings(PRODUCT_SEARCH_INDEX={'ENABLED': True})
+    def test_product_list_uses_index(self):
+        reset_search_index()
+        self.addCleanup(reset_search_index)
+        warm_search_index()
+        response = self.client.get(reverse('product_list'), {'search': 'bluetoth'})
+        self.assertEqual(list(response.context['page_obj']), [self.headphones, self.speaker])
+        self.assertEqual(response.context['search_suggestion'], 'bluetooth')
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    
+    def setUp(self):
+        # Repeated prices and names exercise the id tie-break
+        for n in range(11):
+            self.make_product(n, name=f'Item {n % 4}', price=Decimal(10 + n % 3))
+    
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+    
+    def test_every_sort_visits_each_product_once_in_order(self):
+        for sort, ordering in CATALOG_ORDERINGS.items():
+            with self.subTest(sort=sort):
+                queryset = Product.objects.filter(is_active=True)
+                paginator = KeysetPaginator(queryset, ordering, 3)
+                tie_break = '-id' if ordering[0].startswith('-') else 'id'
+                expected = list(queryset.order_by(*ordering, tie_break))
+                pages = self.walk(paginator)
+                self.assertEqual([p for page in pages for p in page], expected)
+                self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+    
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), ('-price',), 4)
+        pages = self.walk(paginator)
+        self.assertFalse(pages[0].has_previous())
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+        first = paginator.get_page(back.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+    
+    def test_product_list_cursor_mode_skips_count(self):
+        for n in range(11, 14):
+            self.make_product(n)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product_list'), {'sort': 'price_high'})
+        self.assertTrue(response.context['use_cursor'])
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in ctx.captured_queries))
+        
+        page = response.context['page_obj']
+        response = self.client.get(reverse('product_list'), {'sort': 'price_high', 'cursor': page.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(second) & set(page))
+        self.assertContains(response, 'cursor=')
+    
+    def test_cursor_is_bound_to_its_ordering(self):
+        queryset = Product.objects.all()
+        cursor = KeysetPaginator(queryset, CATALOG_ORDERINGS['price_low'], 3).get_page().next_cursor
+        for sort in ('newest', 'price_high'):
+            with self.subTest(sort=sort):
+                with self.assertRaises(InvalidCursor):
+                    KeysetPaginator(queryset, CATALOG_ORDERINGS[sort], 3).page_queryset(cursor)
+    
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('product_list'), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class FacetTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.other_brand = Brand.objects.create(name='BookWorld', slug='bookworld')
+        self.make_product(1, price=Decimal('10.00'))
+        self.make_product(2, price=Decimal('60.00'), stock_quantity=0)
+        self.make_product(3, price=Decimal('30.00'), category=self.books, brand=self.other_brand)
+        self.make_product(4, price=Decimal('300.00'), category=self.books)
+        self.make_product(5, price=Decimal('20.00'), is_active=False)
+    
+    def counts(self, **filters):
+        return facet_counts(facet_combinations(Product.objects.filter(is_active=True)), FacetFilters(**filters))
+    
+    def test_counts_without_filters(self):
+        counts = self.counts()
+        self.assertEqual(counts['category'], {self.category.id: 2, self.books.id: 2})
+        self.assertEqual(counts['brand'], {self.brand.id: 3, self.other_brand.id: 1})
+        self.assertEqual(counts['price'], {'0-25': 1, '25-50': 1, '50-100': 1, '250-': 1})
+        self.assertEqual(counts['in_stock'], 3)
+    
+    def test_facets_ignore_their_own_selection(self):
+        counts = self.counts(brand_ids=[self.brand.id], in_stock=True)
+        self.assertEqual(counts['category'], {self.category.id: 1, self.books.id: 1})
+        self.assertEqual(counts['brand'], {self.brand.id: 2, self.other_brand.id: 1})
+        self.assertEqual(counts['price'], {'0-25': 1, '250-': 1})
+        self.assertEqual(counts['in_stock'], 2)
+    
+    def test_combinations_are_one_query(self):
+        with self.assertNumQueries(1):
+            facet_combinations(Product.objects.filter(is_active=True))
+    
+    def test_product_list_filters_and_caches_facets(self):
+        url = reverse('product_list')
+        response = self.client.get(url, {'brand': 'techpro', 'price': ['0-25', '250-']})
+        self.assertEqual({p.slug for p in response.context['page_obj']}, {'product-1', 'product-4'})
+        
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(url, {'category': 'books'})
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in cached.captured_queries))
+        
+        Product.objects.filter(slug='product-2').update(stock_quantity=5)
+        response = self.client.get(url)
+        self.assertEqual(response.context['in_stock_count'], 4)
+
+
+class ProductCardCacheTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.product = self.make_product(1)
+        card_metrics.reset()
+    
+    def render(self):
+        product = Product.objects.with_main_image().select_related('brand').get(pk=self.product.pk)
+        before = card_metrics.snapshot()
+        html = render_product_cards([product])[0][1]
+        after = card_metrics.snapshot()
+        return html, after['hits'] > before['hits']
+    
+    def assertInvalidated(self, change):
+        self.render()
+        self.assertTrue(self.render()[1])
+        change()
+        html, hit = self.render()
+        self.assertFalse(hit)
+        return html
+    
+    def test_repeat_render_is_a_cache_hit(self):
+        html, hit = self.render()
+        self.assertFalse(hit)
+        self.assertIn('Product 1', html)
+        self.assertEqual(self.render(), (html, True))
+        self.assertEqual(card_metrics.snapshot()['hit_ratio'], 0.5)
+    
+    def test_product_save_invalidates(self):
+        def rename():
+            self.product.name = 'Renamed'
+            self.product.save()
+        self.assertIn('Renamed', self.assertInvalidated(rename))
+    
+    def test_image_variant_review_and_brand_changes_invalidate(self):
+        user = make_user(1)
+        changes = [
+            lambda: ProductImage.objects.create(product=self.product, image='products/new.jpg', is_main=True),
+            lambda: ProductVariant.objects.create(product=self.product, name='Red', variant_type='Color'),
+            lambda: ProductReview.objects.create(product=self.product, user=user, rating=4, title='t', review='r'),
+            lambda: ProductReview.objects.all().set_approval(False),
+            lambda: Brand.objects.get(pk=self.brand.pk).save(),
+        ]
+        for change in changes:
+            self.assertInvalidated(change)
+    
+    def test_listing_serves_cached_cards(self):
+        for n in range(2, 5):
+            self.make_product(n)
+        # Logged in, so the anonymous page cache doesn't short-circuit the view
+        self.client.force_login(make_user(1))
+        self.client.get(reverse('product_list'))
+        card_metrics.reset()
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(card_metrics.snapshot()['hits'], 4)
+        self.assertContains(response, 'Product 3')
+
+
+class AnonymousPageCacheTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.product = self.make_product(1)
+        self.other = self.make_product(2)
+        refresh_related()
+        self.detail_url = reverse('product_detail', kwargs={'slug': 'product-1'})
+    
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        return response, len(ctx.captured_queries)
+    
+    def test_anonymous_detail_served_from_cache_with_headers(self):
+        response, queries = self.get(self.detail_url)
+        self.assertGreater(queries, 0)
+        self.assertEqual(
+            response['Surrogate-Key'].split(),
+            ['product-detail', f'product-{self.product.pk}', f'category-{self.category.pk}',
+             f'brand-{self.brand.pk}', f'product-{self.other.pk}'],
+        )
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=600', response['Cache-Control'])
+        
+        cached, queries = self.get(self.detail_url)
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Surrogate-Key'], response['Surrogate-Key'])
+    
+    def test_saves_purge_only_affected_pages(self):
+        other_url = reverse('product_detail', kwargs={'slug': 'product-2'})
+        self.get(self.detail_url)
+        self.get(other_url)
+        
+        ProductImage.objects.create(product=self.product, image='products/1.jpg', is_main=True)
+        self.assertGreater(self.get(self.detail_url)[1], 0)
+        # product-2 lists product-1 as related, so it is purged as well
+        self.assertGreater(self.get(other_url)[1], 0)
+        
+        unrelated = Category.objects.create(name='Books', slug='books')
+        unrelated.save()
+        self.assertEqual(self.get(self.detail_url)[1], 0)
+        
+        self.product.price = Decimal('5.00')
+        self.product.save()
+        response, queries = self.get(self.detail_url)
+        self.assertGreater(queries, 0)
+        self.assertContains(response, '$5.00')
+    
+    def test_listing_purged_by_catalog_writes(self):
+        self.get(reverse('product_list'))
+        self.assertEqual(self.get(reverse('product_list'))[1], 0)
+        self.make_product(3)
+        response, queries = self.get(reverse('product_list'))
+        self.assertGreater(queries, 0)
+        self.assertContains(response, 'Product 3')
+    
+    def test_logged_in_users_bypass_cache(self):
+        self.get(self.detail_url)
+        user = make_user(1)
+        self.client.force_login(user)
+        response, queries = self.get(self.detail_url)
+        self.assertGreater(queries, 0)
+        self.assertContains(response, user.username)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('Surrogate-Key', response)
+
+
+class CartTotalsTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.user = make_user(1)
+        self.cart = Cart.objects.create(user=self.user)
+        discounted = self.make_product(
+            1, price=Decimal('8.00'), original_price=Decimal('10.00'), discount_percentage=20
+        )
+        plain = self.make_product(2, price=Decimal('5.50'))
+        variant = ProductVariant.objects.create(
+            product=plain, name='Large', price_adjustment=Decimal('1.25'), stock_quantity=5
+        )
+        self.discounted_item = CartItem.objects.create(cart=self.cart, product=discounted, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=plain, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=plain, variant=variant, quantity=2)
+    
+    def test_summary_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = self.cart.summary()
+            lines = [(item.unit_price, item.total_price) for item in summary]
+        self.assertEqual(summary.item_count, 6)
+        # 3 x 8.00 + 5.50 + 2 x (5.50 + 1.25)
+        self.assertEqual(summary.subtotal, Decimal('43.00'))
+        self.assertEqual(summary.savings, Decimal('6.00'))
+        self.assertIn((Decimal('6.75'), Decimal('13.50')), lines)
+    
+    def test_totals_match_python_pricing(self):
+        with self.assertNumQueries(1):
+            totals = self.cart.items.totals()
+        expected = sum(item.total_price for item in CartItem.objects.all())
+        self.assertEqual(totals, {'item_count': 6, 'subtotal': expected})
+        self.assertEqual(CartItem.objects.none().totals(), {'item_count': 0, 'subtotal': Decimal('0.00')})
+    
+    def test_cart_views_report_sql_totals(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('update_cart_quantity'),
+            {'item_id': self.discounted_item.pk, 'quantity': 1},
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cart_total_items'], 4)
+        self.assertEqual(data['cart_total_price'], '27.00')
+        self.assertEqual(data['item_total_price'], '8.00')
+        
+        response = self.client.post(
+            reverse('remove_from_cart'), {'item_id': self.discounted_item.pk},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['cart_total_price'], '19.00')
+    
+    def test_admin_changelist_annotates_totals(self):
+        cart = Cart.objects.with_totals().get(pk=self.cart.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.total_items, 6)
+            self.assertEqual(cart.total_price, Decimal('43.00'))
+
+
+class AddToCartTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.user = make_user(1)
+        self.product = self.make_product(1, stock_quantity=8, max_order_quantity=5)
+        self.client.force_login(self.user)
+    
+    def add(self, quantity=1, **extra):
+        payload = {'product_id': self.product.pk, 'quantity': quantity, **extra}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('add_to_cart'), payload, content_type='application/json')
+        # Session and user lookups aside
+        catalog_queries = [q for q in ctx.captured_queries if 'products_' in q['sql']]
+        return response.json(), len(catalog_queries)
+    
+    def test_first_add_creates_cart_and_line(self):
+        data, _ = self.add(2)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['item_quantity'], 2)
+        self.assertEqual(data['cart_total_items'], 2)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+    
+    def test_repeat_add_increments_in_two_queries(self):
+        self.add(1)
+        data, queries = self.add(2)
+        self.assertEqual(queries, 2)
+        self.assertEqual(data['item_quantity'], 3)
+        self.assertEqual(data['cart_total_price'], '30.00')
+        self.assertEqual(CartItem.objects.count(), 1)
+    
+    def test_quantity_capped_by_max_order_and_stock(self):
+        data, _ = self.add(4)
+        data, _ = self.add(4)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['item_quantity'], 5)
+        self.assertIn('Only 5', data['message'])
+        
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=3)
+        data, _ = self.add(1)
+        self.assertEqual(data['item_quantity'], 3)
+    
+    def test_variant_lines_are_separate(self):
+        variant = ProductVariant.objects.create(product=self.product, name='Red', stock_quantity=2)
+        self.add(1)
+        data, _ = self.add(5, variant_id=variant.pk)
+        self.assertEqual(data['item_quantity'], 2)
+        self.assertEqual(data['cart_total_items'], 3)
+        self.assertEqual(CartItem.objects.count(), 2)
+    
+    def test_unavailable_and_invalid_requests(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        data, _ = self.add(1)
+        self.assertFalse(data['success'])
+        self.assertFalse(CartItem.objects.exists())
+        
+        response = self.client.post(
+            reverse('add_to_cart'), {'product_id': 'x'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RelatedProductTests(CatalogTestCase):
+    """Precomputed related products and their incremental refresh"""
+    
+    def setUp(self):
+        self.other_brand = Brand.objects.create(name='Acme', slug='acme')
+        self.other_category = Category.objects.create(name='Books', slug='books')
+        self.product = self.make_product(1, tags='wireless, audio')
+        self.close = self.make_product(2, price=Decimal('11.00'), tags='audio')
+        self.far = self.make_product(3, price=Decimal('90.00'), brand=self.other_brand)
+        self.bought_with = self.make_product(4, category=self.other_category, brand=self.other_brand)
+        self.hidden = self.make_product(5, is_active=False)
+        for n in range(3):
+            user = make_user(n)
+            CartItem.objects.add_for_user(user, self.product.pk, 1)
+            CartItem.objects.add_for_user(user, self.bought_with.pk, 1)
+    
+    def related(self, product):
+        return list(Product.objects.related_to(product).values_list('slug', flat=True))
+    
+    def test_ranked_by_score_and_read_in_one_query(self):
+        self.assertEqual(refresh_related(), 4)
+        # Bought together thrice outranks sharing only the category
+        self.assertEqual(self.related(self.product), ['product-2', 'product-4', 'product-3'])
+        with self.assertNumQueries(1):
+            # Same category and nearer in price, then same brand
+            self.assertEqual(self.related(self.far), ['product-2', 'product-1', 'product-4'])
+        
+        response = self.client.get(reverse('product_detail', kwargs={'slug': 'product-1'}))
+        self.assertEqual([p.slug for p in response.context['related_products']], self.related(self.product))
+    
+    def test_unscored_product_falls_back_to_its_category(self):
+        url = reverse('product_detail', kwargs={'slug': 'product-1'})
+        response = self.client.get(url)
+        self.assertEqual(
+            sorted(p.slug for p in response.context['related_products']), ['product-2', 'product-3'],
+        )
+    
+    def test_products_without_candidates_are_not_rescored(self):
+        Product.objects.filter(pk__in=[self.close.pk, self.far.pk, self.bought_with.pk]).delete()
+        self.assertEqual(refresh_related(), 1)  # product-5 is inactive
+        self.assertFalse(RelatedProduct.objects.exists())
+        self.assertEqual(refresh_related(), 0)
+    
+    def test_incremental_refresh_rescores_changed_products_and_their_dependents(self):
+        refresh_related()
+        self.assertEqual(refresh_related(), 0)
+        
+        self.far.category = self.other_category
+        self.far.save()
+        # product-3 itself plus every list that included it
+        self.assertEqual(refresh_related(), 4)
+        self.assertEqual(self.related(self.far)[0], 'product-4')
+        
+        Product.objects.filter(pk=self.close.pk).update(is_active=False)
+        refresh_related()
+        self.assertNotIn('product-2', self.related(self.product))
+        self.assertFalse(RelatedProduct.objects.filter(product=self.close).exists())
+    
+    def test_incremental_refresh_lists_new_products(self):
+        refresh_related()
+        self.make_product(6, price=Decimal('10.50'), tags='wireless, audio')
+        refresh_related()
+        self.assertEqual(self.related(self.product)[0], 'product-6')
+        self.assertIn('product-1', self.related(Product.objects.get(slug='product-6')))
+
+
+@skipUnless(np, 'NumPy is not installed')
+class RecommenderTests(CatalogTestCase):
+    """Content-similarity index: blocked top-k neighbours and lookups"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(RECOMMENDER={'DIRECTORY': directory.name, 'WORKERS': 1})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(reset_index)
+        self.products = [
+            self.make_product(n, tags=tags, short_description=text, specifications=specs)
+            for n, (tags, text, specs) in enumerate([
+                ('audio, wireless, bluetooth', 'Wireless over-ear headphones', {'connectivity': 'Bluetooth'}),
+                ('audio, wireless', 'Wireless earbuds with charging case', {'connectivity': 'Bluetooth'}),
+                ('audio, speaker', 'Portable speaker', {}),
+                ('kitchen, blender', 'Glass jar blender', {'power': '600W'}),
+                ('kitchen, blender, mixer', 'Hand blender and mixer', {'power': '600W'}),
+                ('garden', 'Hose reel', {}),
+            ])
+        ]
+    
+    def test_blocked_neighbours_match_brute_force(self):
+        build_index({**recommender_settings(), 'BLOCK_ROWS': 2, 'BLOCK_COLUMNS': 4, 'NEIGHBOURS': 10})
+        build = index_directory() / (index_directory() / 'CURRENT').read_text()
+        ids = np.load(build / 'ids.npy')
+        vectors = np.load(build / 'vectors.npy')
+        similarity = vectors @ vectors.T
+        np.fill_diagonal(similarity, -np.inf)
+        
+        neighbours = np.load(build / 'neighbours.npy')
+        scores = np.load(build / 'scores.npy')
+        for row in range(len(ids)):
+            expected = {int(ids[j]) for j in range(len(ids)) if similarity[row, j] > 0}
+            self.assertEqual({int(pk) for pk in neighbours[row] if pk >= 0}, expected)
+            found = scores[row][neighbours[row] >= 0]
+            self.assertTrue(np.all(found[:-1] >= found[1:]))
+    
+    def test_similar_and_cart_lookups(self):
+        headphones, earbuds, speaker, blender, mixer, hose = self.products
+        self.assertEqual(similar_products(headphones.pk), [])  # nothing built yet
+        build_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(similar_products(headphones.pk, limit=2), [earbuds.pk, speaker.pk])
+            self.assertEqual(similar_products(hose.pk), [])
+        self.assertEqual(recommend_for_products([blender.pk, headphones.pk], limit=2), [mixer.pk, earbuds.pk])
+
+
+class CatalogApiTests(CatalogTestCase):
+    """Streamed JSON listings with field selection, cursors and conditional GET"""
+    
+    def setUp(self):
+        self.products = [self.make_product(n, price=Decimal(f'{20 - n}.00')) for n in range(5)]
+    
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, json.loads(b''.join(response.streaming_content))
+    
+    def test_cursor_pages_cover_every_product_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, 'sort': 'price_low', 'fields': 'slug'}
+            if cursor:
+                params['cursor'] = cursor
+            _, page = self.get_json(reverse('api_products'), **params)
+            self.assertTrue(all(row.keys() == {'slug'} for row in page['results']))
+            seen += [row['slug'] for row in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'product-{n}' for n in range(4, -1, -1)])
+        
+        _, page = self.get_json(reverse('api_products'), limit=2, sort='price_low')
+        response = self.client.get(reverse('api_products'), {'sort': 'name', 'cursor': page['next_cursor']})
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.get(reverse('api_products'), {'fields': 'slug,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+    
+    def test_unchanged_listing_is_not_modified(self):
+        url = reverse('api_products')
+        response, page = self.get_json(url)
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(set(page['results'][0]), set(PRODUCTS.default_fields))
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        # Reviews move rating stats without touching updated_at
+        ProductReview.objects.create(
+            product=self.products[0], user=make_user(1), rating=5, title='Great', review='Great',
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_page_etag_covers_only_its_rows(self):
+        url = reverse('api_products')
+        params = {'limit': 2, 'sort': 'price_low'}
+        response, _ = self.get_json(url, **params)
+        etag = response['ETag']
+        # The most expensive product is not on the cheapest page
+        self.products[0].name = 'Renamed'
+        self.products[0].save()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.products[-1].name = 'Renamed'
+        self.products[-1].save()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    async def test_pages_stream_under_asgi(self):
+        response = await self.async_client.get(reverse('api_products'), {'limit': 2, 'fields': 'slug'})
+        self.assertTrue(response.is_async)
+        page = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNotNone(page['next_cursor'])
+    
+    def test_page_etag_changes_when_a_row_drops_out(self):
+        url = reverse('api_products')
+        params = {'limit': 2, 'sort': 'price_low'}
+        response, _ = self.get_json(url, **params)
+        # update() leaves updated_at alone; the next product moves onto the page
+        Product.objects.filter(pk=self.products[3].pk).update(is_active=False)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+    
+    def test_product_item_and_taxonomies(self):
+        url = reverse('api_product', kwargs={'slug': 'product-1'})
+        response = self.client.get(url, {'fields': 'name,price,features'})
+        self.assertEqual(response.json(), {'name': 'Product 1', 'price': '19.00', 'features': []})
+        self.assertEqual(self.client.get(url, {'fields': 'name,price,features'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('api_product', kwargs={'slug': 'missing'})).status_code, 404)
+        
+        _, page = self.get_json(reverse('api_categories'))
+        self.assertEqual([row['slug'] for row in page['results']], ['electronics'])
+        _, page = self.get_json(reverse('api_brands'), fields='name,website')
+        self.assertEqual(page['results'], [{'name': 'TechPro', 'website': ''}])
+
+
+class ProductFeedTests(CatalogTestCase):
+    """Gzipped channel feeds from the export command and the streaming endpoint"""
+    
+    def setUp(self):
+        self.products = [self.make_product(n, price=Decimal(f'{10 + n}.00')) for n in range(7)]
+        self.make_product(99, is_active=False)
+        self.products[0].stock_quantity = 0
+        self.products[0].save()
+        ProductImage.objects.create(product=self.products[1], image='products/one.jpg', is_main=True)
+    
+    def test_export_shards_cover_active_products_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            out = StringIO()
+            call_command('export_feed', format='csv', shards=3, workers=1, output=directory,
+                         base_url='https://shop.example', stdout=out)
+            self.assertIn('Exported 7 products to 3 csv file(s)', out.getvalue())
+            # Shards are renamed into place; no partial files are left behind
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).iterdir()),
+                [f'products-{n}-of-3.csv.gz' for n in range(3)],
+            )
+            rows = []
+            for n in range(3):
+                with gzip.open(Path(directory) / f'products-{n}-of-3.csv.gz', 'rt', newline='') as f:
+                    rows += list(csv.DictReader(f))
+        self.assertEqual([row['sku'] for row in rows], [f'SKU-{n}' for n in range(7)])
+        self.assertEqual(rows[0]['availability'], 'out of stock')
+        self.assertEqual(rows[1]['link'], 'https://shop.example' + reverse('product_detail', kwargs={'slug': 'product-1'}))
+        self.assertTrue(rows[1]['image_link'].startswith('https://shop.example/'))
+        self.assertEqual((rows[1]['brand'], rows[1]['category'], rows[1]['price']), ('TechPro', 'Electronics', '11.00'))
+    
+    def test_endpoint_streams_gzip_to_token_holders(self):
+        url = reverse('product_feed', kwargs={'format': 'jsonl'})
+        self.assertEqual(self.client.get(url, {'token': 'forged'}).status_code, 404)
+        response = self.client.get(url, {'token': feed_token('comparer'), 'shard': 1, 'shards': 2})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([r['sku'] for r in records], ['SKU-4', 'SKU-5', 'SKU-6'])
+        self.assertEqual(records[0]['link'], 'http://testserver' + reverse('product_detail', kwargs={'slug': 'product-4'}))
+        
+        # Supplier text can carry control characters that XML 1.0 cannot
+        Product.objects.filter(pk=self.products[2].pk).update(short_description='Tab\tand\x0bvertical\x00tab')
+        response = self.client.get(reverse('product_feed', kwargs={'format': 'xml'}), {'token': feed_token('comparer')})
+        root = ElementTree.fromstring(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(len(root.findall('product')), 7)
+        self.assertEqual(root.findall('product')[2].findtext('description'), 'Tab\tandverticaltab')
+        self.assertEqual(self.client.get(url, {'token': feed_token('comparer'), 'shard': 2, 'shards': 2}).status_code, 400)
+    
+    async def test_endpoint_streams_under_asgi(self):
+        url = reverse('product_feed', kwargs={'format': 'csv'})
+        response = await self.async_client.get(url, {'token': feed_token('comparer')})
+        # A sync iterator would be collected whole before the first byte goes out
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(gzip.decompress(body).decode().splitlines()), 8)  # header and 7 products
+
+
+class ProductImportTests(CatalogTestCase):
+    """Supplier file upserts by SKU with bulk slugs and per-batch queries"""
+    
+    def write(self, directory, name, text):
+        path = Path(directory) / name
+        path.write_text(text)
+        return path
+    
+    def test_csv_upserts_by_sku_and_reports_bad_rows(self):
+        self.make_product(1, name='Desk Lamp', slug='desk-lamp', stock_quantity=3)
+        header = 'sku,name,brand,category,price,stock_quantity,features\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'supplier.csv', header + (
+                'SKU-1,,,,,9,\n'
+                'NEW-1,Desk Lamp,techpro,electronics,24.50,5,LED|Dimmable\n'
+                'NEW-2,Desk Lamp,techpro,electronics,19.00,5,\n'
+                'NEW-3,Chair,nobody,electronics,abc,1,\n'
+                'NEW-4,Chair,techpro,electronics,,1,\n'
+            ))
+            out = StringIO()
+            call_command('import_products', str(path), workers=1, stdout=out, stderr=StringIO())
+            self.assertIn('5 rows with bulk', out.getvalue())
+            self.assertIn('2 created, 1 updated, 0 unchanged, 2 invalid', out.getvalue())
+            
+            self.assertEqual(Product.objects.get(sku='SKU-1').stock_quantity, 9)
+            lamps = Product.objects.filter(sku__startswith='NEW').order_by('sku')
+            self.assertEqual([p.slug for p in lamps], ['desk-lamp-new-1', 'desk-lamp-new-2'])
+            self.assertEqual((lamps[0].price, lamps[0].features), (Decimal('24.50'), ['LED', 'Dimmable']))
+            
+            report = import_products(path, workers=1)
+        self.assertEqual((report.created, report.updated, report.unchanged), (0, 0, 3))
+        self.assertEqual([line for line, _ in report.errors], [5, 6])
+        self.assertIn('Unknown brand', report.errors[0][1])
+        self.assertIn('price: Required for new products', report.errors[1][1])
+    
+    def test_boolean_spellings(self):
+        brands, categories = {'techpro': 1}, {'electronics': 1}
+        values, errors = clean_row(
+            {'sku': 'A', 'is_active': 'false', 'is_featured': 'Yes', 'free_shipping': '0', 'is_bestseller': 't'},
+            brands, categories,
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            [values[name] for name in ('is_active', 'is_featured', 'free_shipping', 'is_bestseller')],
+            [False, True, False, True],
+        )
+        self.assertEqual(clean_row('{"sku": "A", "is_active": false}', brands, categories)[0]['is_active'], False)
+        _, errors = clean_row({'sku': 'A', 'is_new_arrival': 'maybe'}, brands, categories)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('is_new_arrival: '))
+    
+    def test_queries_do_not_grow_with_rows(self):
+        def jsonl(skus):
+            return ''.join(
+                json.dumps({'sku': sku, 'name': 'Mug', 'brand': 'techpro', 'category': 'electronics',
+                            'price': 4.5, 'specifications': {'volume': '300ml'}}) + '\n'
+                for sku in skus
+            )
+        
+        counts = []
+        with tempfile.TemporaryDirectory() as directory:
+            for n, size in enumerate((2, 20)):
+                path = self.write(directory, f'mugs-{n}.jsonl', jsonl(f'MUG-{n}-{i}' for i in range(size)))
+                # Related lists are refreshed afterwards, per stored row batch
+                with mock.patch('products.catalog_import.refresh_related'), \
+                        CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(import_products(path, workers=1).created, size)
+                counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Product.objects.filter(slug__startswith='mug').count(), 22)
+
+
+class AsyncViewTests(CatalogTestCase):
+    """The catalog and cart views served through the async request path"""
+    
+    def setUp(self):
+        self.product = self.make_product(1, stock_quantity=8, max_order_quantity=5)
+        ProductVariant.objects.create(product=self.product, name='Red', stock_quantity=2)
+        self.make_product(2)
+        refresh_related()
+    
+    async def test_catalog_pages(self):
+        response = await self.async_client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['product_cards']), 2)
+        
+        response = await self.async_client.get(reverse('product_detail', kwargs={'slug': self.product.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([v.name for v in response.context['variants']], ['Red'])
+        self.assertEqual(len(response.context['related_products']), 1)
+    
+    async def test_cart_endpoints(self):
+        user = await User.objects.acreate_user(username='async', email='async@example.com', password='Secret#123')
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.post(
+            reverse('add_to_cart'), {'product_id': self.product.pk, 'quantity': 2}, content_type='application/json'
+        )
+        data = response.json()
+        self.assertEqual((data['item_quantity'], data['cart_total_items']), (2, 2))
+        
+        response = await self.async_client.post(
+            reverse('update_cart_quantity'), {'item_id': data['item_id'], 'quantity': 4},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['cart_total_items'], 4)
+        
+        response = await self.async_client.post(
+            reverse('remove_from_cart'), {'item_id': data['item_id']}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['cart_total_items'], 0)
+        self.assertFalse(await CartItem.objects.filter(cart__user=user).aexists())
+
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+    
+    ADDS = 200
+    
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Shared-cache memory databases fail fast with "table is locked"
+            self.skipTest('needs a database that can queue concurrent writers')
+    
+    def test_parallel_adds_do_not_lose_increments(self):
+        user = make_user(1)
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        brand = Brand.objects.create(name='TechPro', slug='techpro')
+        product = Product.objects.create(
+            name='Widget', slug='widget', sku='W-1', brand=brand, category=category,
+            description='Widget', price=Decimal('1.00'),
+            stock_quantity=1000, max_order_quantity=150,
+        )
+        
+        def add(_):
+            try:
+                return CartItem.objects.add_for_user(user, product.pk, 1)
+            finally:
+                connections.close_all()
+        
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(add, range(self.ADDS)))
+        
+        self.assertTrue(all(results))
+        self.assertEqual(CartItem.objects.count(), 1)
+        # Every add landed until the cap, none past it
+        self.assertEqual(CartItem.objects.get().quantity, 150)
+        self.assertEqual(sorted(r[1] for r in results)[-1], 150)
+
+
+class CartBatchTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.user = make_user(1)
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [self.make_product(i, stock_quantity=5, max_order_quantity=4) for i in range(1, 4)]
+        self.line = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        self.other_line = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=2)
+    
+    def batch(self, *operations):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse('cart_batch'), {'operations': list(operations)}, content_type='application/json'
+            )
+        return response, len(ctx.captured_queries)
+    
+    def test_operations_applied_with_one_summary(self):
+        response, _ = self.batch(
+            {'op': 'update', 'item_id': self.line.pk, 'quantity': 3},
+            {'op': 'remove', 'item_id': self.other_line.pk},
+            {'op': 'add', 'product_id': self.products[2].pk, 'quantity': 2},
+            {'op': 'add', 'product_id': self.products[2].pk, 'quantity': 1},
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([r['success'] for r in data['results']], [True] * 4)
+        new_line = CartItem.objects.get(product=self.products[2])
+        self.assertEqual(data['results'][2]['item_id'], new_line.pk)
+        self.assertEqual(new_line.quantity, 3)
+        self.assertEqual(data['cart_total_items'], 6)
+        self.assertEqual(data['cart_total_price'], '60.00')
+        self.assertEqual(len(data['items']), 2)
+        self.assertFalse(CartItem.objects.filter(pk=self.other_line.pk).exists())
+    
+    def test_per_operation_errors_use_existing_messages(self):
+        response, _ = self.batch(
+            {'op': 'update', 'item_id': self.line.pk, 'quantity': 6},
+            {'op': 'update', 'item_id': self.line.pk, 'quantity': 5},
+            {'op': 'remove', 'item_id': 999},
+            {'op': 'explode'},
+            {'op': 'update', 'item_id': self.other_line.pk, 'quantity': 4},
+        )
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual([r['message'] for r in data['results'][:4]], [
+            'Only 5 items available in stock.',
+            'Maximum order quantity is 4.',
+            'Item not found in cart.',
+            'Invalid operation.',
+        ])
+        self.assertTrue(data['results'][4]['success'])
+        self.assertEqual(CartItem.objects.get(pk=self.line.pk).quantity, 1)
+        self.assertEqual(CartItem.objects.get(pk=self.other_line.pk).quantity, 4)
+    
+    def test_query_count_does_not_grow_with_operations(self):
+        _, small = self.batch({'op': 'update', 'item_id': self.line.pk, 'quantity': 2})
+        _, large = self.batch(*[
+            {'op': 'update', 'item_id': line.pk, 'quantity': q}
+            for q in (1, 2, 3) for line in (self.line, self.other_line)
+        ], *[{'op': 'add', 'product_id': p.pk} for p in self.products])
+        self.assertLessEqual(large, small + 2)
+    
+    def test_line_added_concurrently_is_merged(self):
+        operation = {'op': 'add', 'product_id': self.products[2].pk, 'quantity': 2, 'variant_id': None}
+        batch = CartBatch(self.cart, [operation])
+        result = batch.apply(operation)
+        # add_for_user() doesn't take the cart lock, so it can insert the line first
+        CartItem.objects.add_for_user(self.user, self.products[2].pk, 1)
+        batch.save()
+        line = CartItem.objects.get(cart=self.cart, product=self.products[2])
+        self.assertEqual((result['item_id'], result['item_quantity'], line.quantity), (line.pk, 3, 3))
+    
+    def test_malformed_batch_rejected(self):
+        response, _ = self.batch()
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('cart_batch'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.product = self.make_product(1, stock_quantity=10)
+        self.variant = ProductVariant.objects.create(product=self.product, name='Red', stock_quantity=3)
+    
+    def counters(self):
+        self.product.refresh_from_db()
+        self.variant.refresh_from_db()
+        return self.product.reserved_quantity, self.variant.reserved_quantity
+    
+    def test_holds_never_exceed_stock(self):
+        self.assertEqual(hold('cart:1', self.product.pk, 6), 6)
+        self.assertEqual(hold('cart:2', self.product.pk, 6), 4)
+        self.assertEqual(hold('cart:3', self.product.pk, 1), 0)
+        self.assertEqual(hold('cart:2', self.variant.product_id, 2, self.variant.pk), 2)
+        self.assertEqual(self.counters(), (10, 2))
+        self.assertEqual(self.product.available_quantity, 0)
+        self.assertFalse(StockReservation.objects.filter(holder='cart:3').exists())
+    
+    def test_shrinking_and_releasing_return_units(self):
+        hold('cart:1', self.product.pk, 6)
+        self.assertEqual(hold('cart:1', self.product.pk, 2), 2)
+        self.assertEqual(self.counters()[0], 2)
+        release('cart:1', self.product.pk)
+        self.assertEqual(self.counters()[0], 0)
+        self.assertFalse(StockReservation.objects.exists())
+    
+    def test_expired_holds_released_lazily_and_in_bulk(self):
+        hold('cart:1', self.product.pk, 10, ttl=-1)
+        hold('cart:1', self.product.pk, 3, self.variant.pk, ttl=-1)
+        # Short on stock: the lapsed hold on this SKU is swept first
+        self.assertEqual(hold('cart:2', self.product.pk, 4), 4)
+        self.assertEqual(self.counters(), (4, 3))
+        
+        # Savepoint, select, one UPDATE per counter table, delete, release
+        with self.assertNumQueries(5):
+            self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.counters(), (4, 0))
+    
+    def test_saves_do_not_clobber_counters(self):
+        stale_product = Product.objects.get(pk=self.product.pk)
+        stale_variant = ProductVariant.objects.get(pk=self.variant.pk)
+        hold('cart:1', self.product.pk, 5)
+        hold('cart:1', self.product.pk, 1, self.variant.pk)
+        stale_product.name = 'Renamed'
+        stale_product.save()
+        stale_variant.stock_quantity = 4
+        stale_variant.save()
+        self.assertEqual(self.counters(), (5, 1))
+    
+    def test_release_command(self):
+        hold('cart:1', self.product.pk, 2, ttl=-1)
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 1', out.getvalue())
+        self.assertEqual(self.counters()[0], 0)
+
+
+@override_settings(STOCK_RESERVATIONS={'ENABLED': True, 'TTL': 60})
+class CartReservationTests(CatalogTestCase):
+    
+    def setUp(self):
+        self.product = self.make_product(1, stock_quantity=5, max_order_quantity=5)
+        self.users = [make_user(i) for i in range(2)]
+    
+    def post(self, user, name, payload):
+        self.client.force_login(user)
+        response = self.client.post(reverse(name), payload, content_type='application/json')
+        return response.json()
+    
+    def test_carts_cannot_oversell(self):
+        data = self.post(self.users[0], 'add_to_cart', {'product_id': self.product.pk, 'quantity': 4})
+        self.assertEqual(data['item_quantity'], 4)
+        data = self.post(self.users[1], 'add_to_cart', {'product_id': self.product.pk, 'quantity': 3})
+        self.assertEqual(data['item_quantity'], 1)
+        self.assertEqual(CartItem.objects.get(cart__user=self.users[1]).quantity, 1)
+        data = self.post(self.users[1], 'add_to_cart', {'product_id': self.product.pk})
+        self.assertEqual(data['item_quantity'], 1)
+        self.assertIn('Only 1', data['message'])
+        
+        item = CartItem.objects.get(cart__user=self.users[1])
+        data = self.post(self.users[1], 'update_cart_quantity', {'item_id': item.pk, 'quantity': 2})
+        self.assertEqual(data['message'], 'Only 1 items available in stock.')
+        
+        first = CartItem.objects.get(cart__user=self.users[0])
+        self.post(self.users[0], 'remove_from_cart', {'item_id': first.pk})
+        data = self.post(self.users[1], 'update_cart_quantity', {'item_id': item.pk, 'quantity': 5})
+        self.assertTrue(data['success'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 5)
+    
+    def test_batch_respects_other_holds(self):
+        hold('user:0', self.product.pk, 3)
+        data = self.post(self.users[0], 'cart_batch', {'operations': [
+            {'op': 'add', 'product_id': self.product.pk, 'quantity': 5},
+        ]})
+        self.assertEqual(data['results'][0]['item_quantity'], 2)
+        self.assertEqual(StockReservation.objects.get(holder=f'user:{self.users[0].pk}').quantity, 2)
+    
+    def test_emptied_cart_releases_its_holds(self):
+        self.post(self.users[0], 'add_to_cart', {'product_id': self.product.pk, 'quantity': 4})
+        hold('user:other', self.product.pk, 1)
+        Cart.objects.get(user=self.users[0]).clear()
+        self.assertFalse(CartItem.objects.filter(cart__user=self.users[0]).exists())
+        self.assertEqual(list(StockReservation.objects.values_list('holder', flat=True)), ['user:other'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 1)
+
+
+class SyntheticCatalogTests(TestCase):
+    
+    def test_generated_catalog_is_consistent(self):
+        out = StringIO()
+        call_command(
+            'generate_catalog', products=60, users=30, reviews=4, chunk_size=25, workers=1, stdout=out
+        )
+        self.assertIn('Generated', out.getvalue())
+        self.assertEqual(Product.objects.count(), 60)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(ProductImage.objects.filter(is_main=True).count(), 60)
+        # Maintained columns were derived after the load
+        for product in Product.objects.filter(rating_count__gt=0)[:5]:
+            self.assertEqual(product.rating_count, product.reviews.filter(is_approved=True).count())
+        # Cart lines only point at variants of their own product
+        self.assertFalse(CartItem.objects.exclude(variant=None).exclude(variant__product=F('product')).exists())
+        # Keys were assigned explicitly; new rows must still get fresh ones
+        last = Product.objects.order_by('pk').last()
+        product = Product.objects.create(
+            name='After', slug='after', sku='AFTER', brand=last.brand, category=last.category,
+            description='x', price=1,
+        )
+        self.assertGreater(product.pk, last.pk)
+    
+    def test_same_seed_same_rows(self):
+        def rows(seed):
+            plan = CatalogPlan(seed=seed)
+            plan.product_base, plan.brand_ids, plan.category_ids = 1, [1, 2, 3], [1, 2]
+            return [(row['name'], row['price'], row['brand_id']) for row in product_rows(plan, 0, 20)]
+        
+        self.assertEqual(rows(7), rows(7))
+        self.assertNotEqual(rows(7), rows(8))
+
+
+class ViewBudgetTests(TestCase):
+    """Query budgets from benchmarks/view_budgets.json, for this database vendor, hold on a small catalog"""
+    
+    def test_views_within_query_budgets(self):
+        call_command('generate_catalog', products=80, users=20, workers=1, stdout=StringIO())
+        self.assertEqual(uncovered_urls(), [])
+        budgets = load_budgets()
+        if budgets is None:
+            self.skipTest(f'No {connection.vendor} budgets recorded')
+        results = run_suite(repeat=1)
+        self.assertEqual(check_budgets(results, budgets, metrics=('queries',)), [])
+
+
+@override_settings(SQL_INSTRUMENTATION={'SAMPLE_RATE': 1})
+class SQLInstrumentationTests(CatalogTestCase):
+    """Per-request query reporting and N+1 detection"""
+    
+    def setUp(self):
+        self.products = [self.make_product(n) for n in range(6)]
+    
+    def test_sampled_request_reports_queries(self):
+        url = reverse('product_detail', kwargs={'slug': 'product-1'})
+        with self.assertLogs('ecommerce.sql', 'INFO') as logs:
+            response = self.client.get(url)
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ queries", app;dur=')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status']), (url, 200))
+        self.assertGreater(record['queries'], 0)
+    
+    @override_settings(SQL_INSTRUMENTATION={'SAMPLE_RATE': 0})
+    def test_unsampled_request_untouched(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('product_list')))
+    
+    def test_repeated_query_shape_flagged_with_call_site(self):
+        with collect_queries(threshold=5) as collector:
+            for product in self.products:
+                ProductImage.objects.filter(product=product).count()
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]))
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products]))
+        self.assertEqual(collector.count, 8)
+        [duplicate] = collector.duplicates()
+        self.assertEqual(duplicate['count'], 6)
+        self.assertIn('products_productimage', duplicate['sql'])
+        self.assertRegex(duplicate['site'], r'^products/tests\.py:\d+ in test_repeated_query_shape')
+
+
+class RequestProfilingTests(CatalogTestCase):
+    """Profiles written for sampled or triggered requests, and the report over them"""
+    
+    def setUp(self):
+        self.make_product(1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+    
+    def profiling(self, **config):
+        return override_settings(REQUEST_PROFILING={'DIRECTORY': str(self.directory), **config})
+    
+    def test_signed_trigger_profiles_request(self):
+        url = reverse('product_detail', kwargs={'slug': 'product-1'})
+        with self.profiling():
+            self.client.get(url, HTTP_X_PROFILE_REQUEST='cprofile:forged')
+            self.assertEqual(list(self.directory.iterdir()), [])
+            self.client.get(url, HTTP_X_PROFILE_REQUEST=trigger_token('cprofile'))
+        [profile] = self.directory.iterdir()
+        self.assertTrue(profile.name.startswith('product_detail--'))
+        self.assertEqual(profile.suffix, '.prof')
+        
+        out = StringIO()
+        call_command('profile_report', directory=str(self.directory), top=5, stdout=out)
+        self.assertIn('product_detail: 1 cprofile profile(s)', out.getvalue())
+        self.assertEqual(len(out.getvalue().strip().splitlines()), 7)  # heading, columns, 5 functions
+    
+    def test_sampled_profiles_rotate(self):
+        with self.profiling(SAMPLE_RATE=1, MAX_FILES=2, INTERVAL=0.001):
+            for _ in range(3):
+                self.client.get(reverse('product_list'))
+        profiles = list(self.directory.iterdir())
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual({p.suffix for p in profiles}, {'.folded'})
+    
+    def test_overlapping_cprofile_request_runs_unprofiled(self):
+        url = reverse('product_detail', kwargs={'slug': 'product-1'})
+        with self.profiling(), _cprofile_lock:
+            response = self.client.get(url, HTTP_X_PROFILE_REQUEST=trigger_token('cprofile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.directory.iterdir()), [])
+    
+    async def test_async_request_samples_the_thread_doing_its_sync_work(self):
+        url = reverse('product_detail', kwargs={'slug': 'product-1'})
+        with self.profiling(INTERVAL=0.0005):
+            for _ in range(5):
+                await self.async_client.get(url, headers={'X-Profile-Request': trigger_token('sampling')})
+        stacks = ''.join(path.read_text() for path in self.directory.iterdir())
+        # Queries and rendering run through sync_to_async, off the event loop
+        self.assertIn('thread_handler (asgiref/sync.py', stacks)
+    
+    def test_sampler_skips_other_threads(self):
+        stopped = threading.Event()
+        
+        def elsewhere():
+            while not stopped.is_set():
+                sum(range(100))
+        
+        other = threading.Thread(target=elsewhere)
+        other.start()
+        self.addCleanup(other.join)
+        self.addCleanup(stopped.set)
+        sampler = StackSampler(0.001)
+        sampler.start()
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            sum(range(100))
+        sampler.stop()
+        self.assertTrue(sampler.stacks)
+        self.assertFalse(any('elsewhere' in stack for stack in sampler.stacks))
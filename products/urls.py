@@ -1,11 +1,17 @@
 from django.urls import path
-from . import views
+from . import api, feeds, views
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
     path('cart/', views.cart_view, name='cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('update-cart-quantity/', views.update_cart_quantity, name='update_cart_quantity'),
     path('remove-from-cart/', views.remove_from_cart, name='remove_from_cart'),
+    path('api/products/', api.product_collection, name='api_products'),
+    path('api/products/<slug:slug>/', api.product_item, name='api_product'),
+    path('api/categories/', api.category_collection, name='api_categories'),
+    path('api/brands/', api.brand_collection, name='api_brands'),
+    path('feeds/products.<str:format>.gz', feeds.product_feed, name='product_feed'),
 ]
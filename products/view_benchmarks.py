@@ -0,0 +1,284 @@
+"""
+Per-view benchmark suite with query, latency and memory budgets.
+
+Every URL in products/urls.py and accounts/urls.py has at least one case.
+Cases run against the current database, normally a generated catalog
+(see generate_catalog), and record the SQL query count, the median wall
+time of the timed runs and the peak memory allocated during one extra
+traced run. BUDGETS_FILE is checked in next to the code, so a view that
+starts issuing a query per row fails the suite in the commit that does
+it. Budgets are kept per database vendor: query counts differ between
+backends (on PostgreSQL, approximate_count() adds an EXPLAIN to catalog
+pages), so each vendor's are recorded on that vendor with
+``benchmark_views --update-budgets``.
+
+The suite runs against a private in-memory cache, so clearing it between
+cases never touches the page cache, cached users or throttle counters of a
+shared environment.
+"""
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+
+from accounts import urls as account_urls
+from accounts.throttle import local_buckets
+from . import urls as product_urls
+from .api import PRODUCTS
+from .feeds import feed_token
+from .models import CartItem, Product
+
+User = get_user_model()
+
+BUDGETS_FILE = Path(settings.BASE_DIR) / 'benchmarks' / 'view_budgets.json'
+METRICS = ('queries', 'ms', 'kb')
+SHOPPER_EMAIL = 'bench-shopper@example.test'
+SHOPPER_PASSWORD = 'Bench#12345'
+CART_LINES = 5
+
+
+class ViewCase:
+    """One request to benchmark; arguments may be callables taking the fixtures"""
+    
+    def __init__(self, name, url_name, method='get', kwargs=None, query='', data=None,
+                 client='shopper', setup=None, status=200):
+        self.name = name
+        self.url_name = url_name
+        self.method = method
+        self.kwargs = kwargs
+        self.query = query
+        self.data = data
+        self.client = client
+        self.setup = setup
+        self.status = status
+    
+    def prepare(self, fixtures):
+        """Run the setup and resolve (url, data); kept out of the measurements"""
+        if self.setup:
+            self.setup(fixtures)
+        kwargs = self.kwargs(fixtures) if callable(self.kwargs) else self.kwargs
+        query = self.query(fixtures) if callable(self.query) else self.query
+        data = self.data(fixtures) if callable(self.data) else self.data
+        return reverse(self.url_name, kwargs=kwargs) + query, data
+    
+    def send(self, client, url, data):
+        if self.method == 'get':
+            response = client.get(url)
+        elif self.url_name == 'login':
+            response = client.post(url, data)
+        else:
+            response = client.post(url, data, content_type='application/json')
+        if response.streaming:
+            # Streamed bodies run their queries as they are read
+            b''.join(response.streaming_content)
+        return response
+
+
+class Fixtures(dict):
+    """Users, clients and rows the cases point at"""
+    
+    def __init__(self):
+        super().__init__()
+        shopper = User.objects.filter(email=SHOPPER_EMAIL).first()
+        if shopper is None:
+            shopper = User.objects.create_user(
+                username='bench-shopper', email=SHOPPER_EMAIL, password=SHOPPER_PASSWORD,
+            )
+        self['shopper'] = shopper
+        in_stock = Product.objects.filter(is_active=True, stock_quantity__gte=10, variants__isnull=True)
+        popular = list(in_stock.order_by('-rating_count', 'pk')[:CART_LINES + 2])
+        if len(popular) < CART_LINES + 2:
+            raise ValueError('Generate a catalog first: the suite needs in-stock products.')
+        CartItem.objects.filter(cart__user=shopper).delete()
+        for product in popular[:CART_LINES]:
+            CartItem.objects.add_for_user(shopper, product.pk, 1)
+        self['cart_product'] = popular[0]
+        self['removable'] = popular[CART_LINES]
+        self['addable'] = popular[CART_LINES + 1]
+        self['detail'] = Product.objects.filter(is_active=True).order_by('-rating_count', 'pk').first()
+        self['search'] = self['detail'].name.split()[1]
+        
+        self['clients'] = {'anonymous': Client(), 'shopper': Client(), 'session': Client()}
+        self['clients']['shopper'].force_login(shopper)
+    
+    def cart_item(self, product):
+        return CartItem.objects.get(cart__user=self['shopper'], product=product).pk
+
+
+def _cold_cache(fixtures):
+    # Anonymous pages would otherwise come straight from the (private) page cache
+    cache.clear()
+
+
+def _restore_removable(fixtures):
+    CartItem.objects.add_for_user(fixtures['shopper'], fixtures['removable'].pk, 1)
+    fixtures['removable_item'] = fixtures.cart_item(fixtures['removable'])
+
+
+def _logged_out(fixtures):
+    fixtures['clients']['session'].logout()
+    local_buckets.clear()
+    cache.clear()
+
+
+def _logged_in(fixtures):
+    fixtures['clients']['session'].force_login(fixtures['shopper'])
+
+
+CASES = [
+    ViewCase('product_list:anonymous', 'product_list', client='anonymous', setup=_cold_cache),
+    ViewCase('product_list:shopper', 'product_list'),
+    ViewCase('product_list:search', 'product_list', query=lambda f: f'?search={f["search"]}'),
+    ViewCase('product_detail:anonymous', 'product_detail', kwargs=lambda f: {'slug': f['detail'].slug},
+             client='anonymous', setup=_cold_cache),
+    ViewCase('product_detail:shopper', 'product_detail', kwargs=lambda f: {'slug': f['detail'].slug}),
+    ViewCase('cart', 'cart'),
+    ViewCase('add_to_cart', 'add_to_cart', 'post', data=lambda f: {'product_id': f['addable'].pk, 'quantity': 1}),
+    ViewCase('update_cart_quantity', 'update_cart_quantity', 'post',
+             data=lambda f: {'item_id': f.cart_item(f['cart_product']), 'quantity': 2}),
+    ViewCase('remove_from_cart', 'remove_from_cart', 'post', setup=_restore_removable,
+             data=lambda f: {'item_id': f['removable_item']}),
+    ViewCase('cart_batch', 'cart_batch', 'post', data=lambda f: {'operations': [
+        {'op': 'update', 'item_id': f.cart_item(f['cart_product']), 'quantity': 1},
+        {'op': 'add', 'product_id': f['addable'].pk, 'quantity': 1},
+    ]}),
+    ViewCase('signup', 'signup', client='anonymous'),
+    ViewCase('login', 'login', client='anonymous'),
+    ViewCase('login:submit', 'login', 'post', client='session', setup=_logged_out, status=302,
+             data={'username': SHOPPER_EMAIL, 'password': SHOPPER_PASSWORD}),
+    ViewCase('logout', 'logout', client='session', setup=_logged_in, status=302),
+    ViewCase('profile', 'profile'),
+    ViewCase('profile_update', 'profile_update'),
+    ViewCase('api_products', 'api_products', client='anonymous', query='?limit=100'),
+    ViewCase('api_products:all_fields', 'api_products', client='anonymous',
+             query=lambda f: f'?limit=100&sort=price_low&fields={",".join(PRODUCTS.fields)}'),
+    ViewCase('api_product', 'api_product', kwargs=lambda f: {'slug': f['detail'].slug}, client='anonymous'),
+    ViewCase('api_categories', 'api_categories', client='anonymous'),
+    ViewCase('api_brands', 'api_brands', client='anonymous'),
+    ViewCase('product_feed', 'product_feed', kwargs={'format': 'csv'}, client='anonymous',
+             query=lambda f: f'?shards=4&token={feed_token("bench")}'),
+]
+
+
+def uncovered_urls():
+    """Names in products/urls.py and accounts/urls.py without a case"""
+    names = {
+        pattern.name for module in (product_urls, account_urls)
+        for pattern in module.urlpatterns if isinstance(pattern, URLPattern)
+    }
+    return sorted(names - {case.url_name for case in CASES})
+
+
+def measure(case, fixtures, repeat=5):
+    """{'queries', 'ms', 'kb'} for one case"""
+    client = fixtures['clients'][case.client]
+    
+    def run():
+        url, data = case.prepare(fixtures)
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = case.send(client, url, data)
+            elapsed = time.perf_counter() - started
+        if response.status_code != case.status:
+            raise AssertionError(f'{case.name}: expected {case.status}, got {response.status_code}')
+        return len(ctx.captured_queries), elapsed
+    
+    try:
+        run()  # warm up connections, templates and caches
+    except TemplateDoesNotExist as exc:
+        # products/cart.html has never been checked in; report instead of failing
+        return {'skipped': f'template {exc} does not exist'}
+    queries, timings = zip(*[run() for _ in range(repeat)])
+    
+    url, data = case.prepare(fixtures)
+    tracemalloc.start()
+    try:
+        case.send(client, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': max(queries),
+        'ms': round(statistics.median(timings) * 1000, 2),
+        'kb': round(peak / 1024),
+    }
+
+
+def private_caches():
+    """Settings override giving every cache alias its own empty LocMem store"""
+    return override_settings(CACHES={
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'view-benchmarks-{alias}'}
+        for alias in settings.CACHES
+    })
+
+
+def run_suite(repeat=5, cases=CASES):
+    # Skipped cases raise inside the view; the suite reports them itself
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    try:
+        with private_caches():
+            fixtures = Fixtures()
+            return {case.name: measure(case, fixtures, repeat) for case in cases}
+    finally:
+        logger.setLevel(level)
+
+
+def load_budgets(path=BUDGETS_FILE, vendor=None):
+    """Budgets recorded on ``vendor`` (default: the configured database's), or None"""
+    with open(path) as f:
+        return json.load(f).get(vendor or connection.vendor)
+
+
+def save_budgets(budgets, path=BUDGETS_FILE, vendor=None):
+    """Replace one vendor's budgets in the file, keeping the others"""
+    try:
+        with open(path) as f:
+            recorded = json.load(f)
+    except FileNotFoundError:
+        recorded = {}
+    recorded[vendor or connection.vendor] = budgets
+    with open(path, 'w') as f:
+        json.dump(recorded, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def check_budgets(results, budgets, metrics=METRICS):
+    """Messages for every case over budget or without one"""
+    failures = []
+    for name, measured in results.items():
+        if 'skipped' in measured:
+            continue
+        budget = budgets.get(name)
+        if budget is None:
+            failures.append(f'{name}: no budget')
+            continue
+        for metric in metrics:
+            if measured[metric] > budget[metric]:
+                failures.append(f'{name}: {metric} {measured[metric]} > budget {budget[metric]}')
+    return failures
+
+
+def budgets_from(results):
+    """Budgets for a run: exact query counts, generous time and memory headroom"""
+    return {
+        name: {
+            'queries': measured['queries'],
+            'ms': round(measured['ms'] * 3 + 50),
+            'kb': round(measured['kb'] * 1.5 + 256),
+        }
+        for name, measured in sorted(results.items())
+        if 'skipped' not in measured
+    }
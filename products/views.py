@@ -1,82 +1,146 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.core.paginator import Paginator
+from django.conf import settings
 from django.db.models import Q, Avg, Count
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 
 from .models import (
     Product, Category, Brand, Cart, CartItem, Wishlist, WishlistItem,
     ProductReview, ProductVariant
 )
+from .search import search_products, order_by_relevance
+from .pagination import KeysetPaginator, InvalidCursor, approximate_count
+from .facets import FacetFilters, PRICE_BANDS, cached_facet_combinations, facet_counts
+from .cache import render_product_cards
+from .cart import InvalidOperations, parse_operations, apply_cart_operations
+from .reservations import reservations_enabled, user_holder, hold, hold_cart_line, release
+from .page_cache import cache_anonymous_page, add_surrogate_keys, product_surrogate_keys
+from .recommender import recommend_for_products
 
-def product_list(request):
+# sort option -> ordering; ties are broken on id (see Product.Meta.indexes)
+CATALOG_ORDERINGS = {
+    'name': ('name',),
+    'price_low': ('price',),
+    'price_high': ('-price',),
+    'newest': ('-created_at',),
+}
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+def _catalog_page(products, sort_by, params):
+    """The requested page of products, with their rendered cards"""
+    # Keyset pagination for every fixed ordering; relevance ranking and
+    # legacy ?page= links keep the offset paginator.
+    use_cursor = (
+        settings.CATALOG_PAGINATION == 'cursor'
+        and sort_by in CATALOG_ORDERINGS
+        and 'page' not in params
+    )
+    if use_cursor:
+        paginator = KeysetPaginator(products, CATALOG_ORDERINGS[sort_by], 12)
+        try:
+            page_obj = paginator.get_page(params.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.get_page()
+        # Planner estimate instead of COUNT(*); None off PostgreSQL
+        page_obj.approximate_count = approximate_count(products)
+    else:
+        if sort_by == 'relevance':
+            products = order_by_relevance(products)
+        else:
+            products = products.order_by(*CATALOG_ORDERINGS[sort_by], 'id')
+        paginator = Paginator(products, 12)  # 12 products per page
+        page_obj = paginator.get_page(params.get('page'))
+    return page_obj, use_cursor, render_product_cards(page_obj)
+
+@cache_anonymous_page
+async def product_list(request):
     """Product catalog page with filtering and search"""
-    products = Product.objects.filter(is_active=True).select_related('brand', 'category')
-    categories = Category.objects.filter(is_active=True)
-    brands = Brand.objects.filter(is_active=True)
+    products = Product.objects.filter(is_active=True).select_related('brand', 'category').with_main_image()
+    categories, brands = await asyncio.gather(
+        _alist(Category.objects.filter(is_active=True)),
+        _alist(Brand.objects.filter(is_active=True)),
+    )
     
     # Search functionality
     search_query = request.GET.get('search', '')
+    search_suggestion = None
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__name__icontains=search_query)
-        )
+        products, search_suggestion = await sync_to_async(search_products)(products, search_query)
     
-    # Category filter
-    category_slug = request.GET.get('category', '')
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
-    
-    # Sort options
-    sort_by = request.GET.get('sort', 'name')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('name')
+    # Category, brand, price band and stock filters
+    category_slugs = set(request.GET.getlist('category')) - {''}
+    brand_slugs = set(request.GET.getlist('brand')) - {''}
+    filters = FacetFilters(
+        category_ids=[c.id for c in categories if c.slug in category_slugs],
+        brand_ids=[b.id for b in brands if b.slug in brand_slugs],
+        price_bands=request.GET.getlist('price'),
+        in_stock=request.GET.get('in_stock') == '1',
+    )
+    
+    # Sort options (searches default to relevance)
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'name')
+    if sort_by not in CATALOG_ORDERINGS and sort_by != 'relevance':
+        sort_by = 'name'
     
-    # Pagination
-    paginator = Paginator(products, 12)  # 12 products per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Facet counts come from the unfiltered search results (one cached GROUP BY)
+    combinations, (page_obj, use_cursor, product_cards) = await asyncio.gather(
+        sync_to_async(cached_facet_combinations)(products, search_query),
+        sync_to_async(_catalog_page)(filters.apply(products), sort_by, request.GET),
+    )
+    facets = facet_counts(combinations, filters)
     
     context = {
         'page_obj': page_obj,
+        'product_cards': product_cards,
         'categories': categories,
         'brands': brands,
+        'category_facets': [(c, facets['category'][c.id], c.slug in category_slugs) for c in categories],
+        'brand_facets': [(b, facets['brand'][b.id], b.slug in brand_slugs) for b in brands],
+        'price_facets': [
+            (key, label, facets['price'][key], key in filters.price_bands)
+            for key, label, _, _ in PRICE_BANDS
+        ],
+        'in_stock_count': facets['in_stock'],
+        'in_stock_only': filters.in_stock,
         'search_query': search_query,
+        'search_suggestion': search_suggestion,
         'sort_by': sort_by,
+        'use_cursor': use_cursor,
     }
     
-    return render(request, 'products/product_list.html', context)
+    response = await sync_to_async(render)(request, 'products/product_list.html', context)
+    return add_surrogate_keys(response, ['product-list'] + [f'product-{p.pk}' for p in page_obj])
 
-def product_detail(request, slug):
+@cache_anonymous_page
+async def product_detail(request, slug):
     """Detailed product page with all Amazon-like features"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    
-    # Get product images
-    images = product.images.all().order_by('order', 'created_at')
-    
-    # Get product variants
-    variants = product.variants.filter(is_active=True)
+    product = await aget_object_or_404(
+        Product.objects.select_related('brand', 'category').with_main_image(),
+        slug=slug, is_active=True
+    )
     
-    # Get reviews
-    reviews = product.reviews.filter(is_approved=True).select_related('user').order_by('-created_at')[:10]
-    
-    # Related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:6]
+    # Images, variants, reviews and related products don't depend on each other
+    images, variants, reviews, related_products = await asyncio.gather(
+        _alist(product.images.all().order_by('order', 'created_at')),
+        _alist(product.variants.filter(is_active=True)),
+        _alist(product.reviews.filter(is_approved=True).select_related('user').order_by('-created_at')[:10]),
+        _alist(Product.objects.related_to(product).with_main_image()[:6]),
+    )
+    if product.related_computed_at is None:
+        # Not scored yet (new product, or before the first refresh_related_products run)
+        related_products = await _alist(Product.objects.filter(
+            category_id=product.category_id,
+            is_active=True
+        ).exclude(id=product.id).with_main_image()[:6])
     
     context = {
         'product': product,
@@ -86,63 +150,71 @@ def product_detail(request, slug):
         'related_products': related_products,
     }
     
-    return render(request, 'products/product_detail.html', context)
+    response = await sync_to_async(render)(request, 'products/product_detail.html', context)
+    return add_surrogate_keys(
+        response,
+        ['product-detail'] + product_surrogate_keys(product) + [f'product-{p.pk}' for p in related_products]
+    )
 
 @login_required
 @require_POST
-def add_to_cart(request):
+async def add_to_cart(request):
     """Add product to cart via AJAX"""
     try:
         data = json.loads(request.body)
-        product_id = data.get('product_id')
+        product_id = int(data.get('product_id'))
         quantity = int(data.get('quantity', 1))
-        
-        product = get_object_or_404(Product, id=product_id, is_active=True)
-        
-        # Check stock
-        if product.stock_quantity < quantity:
-            return JsonResponse({
-                'success': False,
-                'message': f'Only {product.stock_quantity} items available.'
-            })
-        
-        # Get or create cart
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Get or create cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
+        variant_id = int(data['variant_id']) if data.get('variant_id') else None
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+    if quantity < 1:
+        return JsonResponse({'success': False, 'message': 'Quantity must be at least 1.'}, status=400)
+    
+    user = await request.auser()
+    added = await sync_to_async(CartItem.objects.add_for_user)(user, product_id, quantity, variant_id)
+    if added is not None and reservations_enabled():
+        # Other carts may hold part of the stock; keep what we can hold
+        item_id, cart_quantity, limit = added
+        held = await sync_to_async(hold_cart_line)(
+            user_holder(user), item_id, product_id, variant_id, cart_quantity
         )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        
-        return JsonResponse({
-            'success': True,
-            'message': 'Product added to cart!',
-            'cart_total_items': cart.total_items,
-        })
-        
-    except Exception as e:
+        if held == 0:
+            added = None
+        elif held < cart_quantity:
+            added = (item_id, held, held)
+    if added is None:
         return JsonResponse({
             'success': False,
-            'message': 'An error occurred. Please try again.'
+            'message': 'This product is currently unavailable.'
         })
+    
+    item_id, cart_quantity, limit = added
+    message = 'Product added to cart!'
+    if cart_quantity >= limit:
+        message = f'Only {limit} items available; your cart now has the maximum.'
+    
+    totals = await CartItem.objects.filter(cart__user=user).atotals()
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'item_id': item_id,
+        'item_quantity': cart_quantity,
+        'cart_total_items': totals['item_count'],
+        'cart_total_price': str(totals['subtotal']),
+    })
 
 @login_required
 @require_POST
-def update_cart_quantity(request):
+async def update_cart_quantity(request):
     """Update cart item quantity via AJAX"""
     try:
         data = json.loads(request.body)
         item_id = data.get('item_id')
         quantity = int(data.get('quantity', 1))
         
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        user = await request.auser()
+        cart = await aget_object_or_404(Cart, user=user)
+        cart_item = await aget_object_or_404(CartItem.objects.with_totals(), id=item_id, cart=cart)
         
         # Check stock
         available_stock = cart_item.variant.stock_quantity if cart_item.variant else cart_item.product.stock_quantity
@@ -159,22 +231,34 @@ def update_cart_quantity(request):
                 'message': f'Maximum order quantity is {cart_item.product.max_order_quantity}.'
             })
         
+        if reservations_enabled():
+            holder = user_holder(user)
+            held = await sync_to_async(hold)(holder, cart_item.product_id, max(quantity, 0), cart_item.variant_id)
+            if held < quantity:
+                # Put the previous hold back and reject the change
+                await sync_to_async(hold)(holder, cart_item.product_id, cart_item.quantity, cart_item.variant_id)
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Only {held} items available in stock.'
+                })
+        
         if quantity <= 0:
-            cart_item.delete()
+            await cart_item.adelete()
             message = 'Item removed from cart.'
         else:
             cart_item.quantity = quantity
-            cart_item.save()
+            await cart_item.asave()
             message = 'Cart updated successfully!'
         
+        totals = await cart.items.atotals()
         return JsonResponse({
             'success': True,
             'message': message,
-            'cart_total_items': cart.total_items,
-            'cart_total_price': str(cart.total_price),
+            'cart_total_items': totals['item_count'],
+            'cart_total_price': str(totals['subtotal']),
             'item_total_price': str(cart_item.total_price) if quantity > 0 else '0.00'
         })
-        
+    
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -183,51 +267,75 @@ def update_cart_quantity(request):
 
 @login_required
 @require_POST
-def remove_from_cart(request):
+async def remove_from_cart(request):
     """Remove item from cart via AJAX"""
     try:
         data = json.loads(request.body)
         item_id = data.get('item_id')
         
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        cart_item.delete()
+        user = await request.auser()
+        cart = await aget_object_or_404(Cart, user=user)
+        lines = CartItem.objects.filter(id=item_id, cart=cart)
+        line = await lines.values('product_id', 'variant_id').afirst() if reservations_enabled() else None
+        deleted, _ = await lines.adelete()
+        if not deleted:
+            raise Http404('No CartItem matches the given query.')
+        if line is not None:
+            await sync_to_async(release)(user_holder(user), line['product_id'], line['variant_id'])
         
+        totals = await cart.items.atotals()
         return JsonResponse({
             'success': True,
             'message': 'Item removed from cart successfully!',
-            'cart_total_items': cart.total_items,
-            'cart_total_price': str(cart.total_price)
+            'cart_total_items': totals['item_count'],
+            'cart_total_price': str(totals['subtotal'])
         })
-        
+    
     except Exception as e:
         return JsonResponse({
             'success': False,
             'message': 'An error occurred. Please try again.'
         })
 
+@login_required
+@require_POST
+async def cart_batch(request):
+    """Apply a list of add/update/remove operations in one transaction"""
+    try:
+        operations = parse_operations(json.loads(request.body))
+    except InvalidOperations as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+    
+    user = await request.auser()
+    results, summary = await sync_to_async(apply_cart_operations)(user, operations)
+    return JsonResponse({
+        'success': all(result['success'] for result in results),
+        'results': results,
+        **summary.as_json(),
+    })
+
 @login_required
 def cart_view(request):
     """Shopping cart page"""
     try:
         cart = Cart.objects.get(user=request.user)
-        cart_items = cart.items.select_related('product', 'variant').all()
+        summary = cart.summary()
     except Cart.DoesNotExist:
         cart = None
-        cart_items = []
+        summary = None
     
-    # Calculate savings
-    total_savings = 0
-    if cart_items:
-        for item in cart_items:
-            if item.product.original_price and item.product.discount_percentage > 0:
-                savings_per_item = item.product.original_price - item.product.price
-                total_savings += savings_per_item * item.quantity
+    # Products whose text is most like the cart's (empty until an index is built)
+    recommended_ids = recommend_for_products([item.product_id for item in summary]) if summary else []
+    recommended = Product.objects.filter(pk__in=recommended_ids, is_active=True).with_main_image().in_bulk()
     
     context = {
         'cart': cart,
-        'cart_items': cart_items,
-        'total_savings': total_savings,
+        'cart_summary': summary,
+        'cart_items': summary.lines if summary else [],
+        'total_savings': summary.savings if summary else 0,
+        'recommended_products': [recommended[pk] for pk in recommended_ids if pk in recommended],
     }
     
     return render(request, 'products/cart.html', context)
@@ -238,12 +346,9 @@ def get_cart_context(request):
     cart_total_price = 0
     
     if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            cart_total_items = cart.total_items
-            cart_total_price = cart.total_price
-        except Cart.DoesNotExist:
-            pass
+        totals = CartItem.objects.filter(cart__user=request.user).totals()
+        cart_total_items = totals['item_count']
+        cart_total_price = totals['subtotal']
     
     return {
         'cart_total_items': cart_total_items,